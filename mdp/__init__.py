@@ -224,9 +224,8 @@ class MDPDeprecationWarning(DeprecationWarning, MDPWarning):
            'with_extension',
            ]
 
-if config.has_joblib:
-    from . import caching
-    __all__ += ['caching']
+from . import caching
+__all__ += ['caching']
 
 utils.fixup_namespace(__name__, __all__,
                       ('signal_node',
@@ -1,18 +1,35 @@
 """MDP extension to cache the execution phase of nodes.
 
-This extension is based on the **joblib** library by Gael Varoquaux,
-available at http://packages.python.org/joblib/. At the moment, the
-extension is based on joblib v. 0.4.6.
+The results can be cached on disk with the **joblib** library by Gael
+Varoquaux, available at http://packages.python.org/joblib/, or in an
+in-process LRU cache that does not need joblib (see `activate_caching`).
 """
 from builtins import object
 __docformat__ = "restructuredtext en"
 
-import joblib
+import collections
+import hashlib
+import marshal
+import pickle
+import types
+import weakref
 
+import mdp
 from ..utils import TemporaryDirectory
 from ..extension import ExtensionNode, activate_extension, deactivate_extension
 from ..signal_node import Node
 
+if mdp.config.has_joblib:
+    import joblib
+else:
+    joblib = None
+
+try:
+    _hash_func = hashlib.blake2b
+except AttributeError:
+    # python < 3.6
+    _hash_func = hashlib.sha1
+
 # -- global attributes for this extension
 
 _cachedir = None
@@ -24,12 +41,199 @@
 _cacheobj = None
 # instance of joblib cache object (set with set_cachedir)
 _memory = None
+# instance of the in-process cache (set with activate_caching)
+_lru = None
+
+# default size of the in-process cache in bytes
+DEFAULT_MAX_BYTES = 2**27
 
 # True is the cache is active for *all* classes
 _cache_active_global = True
-_cached_classes = []
-_cached_instances = []
-_cached_methods = {}
+_cached_classes = set()
+_cached_instances = weakref.WeakSet()
+_cached_methods = weakref.WeakKeyDictionary()
+
+
+class _LRUCache(object):
+    """In-process cache of execution results with a byte budget.
+
+    The least recently used results are dropped as soon as the total size
+    of the cached arrays exceeds 'max_bytes'.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return the cached result for 'key', or None if there is none."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        # re-insert to mark the entry as most recently used
+        self._entries[key] = entry
+        return entry[0]
+
+    def set(self, key, value):
+        """Cache 'value' for 'key', dropping old results if needed.
+
+        Return False if 'value' is too large to be cached.
+        """
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return False
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, old_nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= old_nbytes
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+def _nbytes(value):
+    """Return the approximate memory size of an execution result."""
+    if isinstance(value, mdp.numx.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    return 64
+
+
+def _copy_result(value):
+    """Return a copy of the arrays in a cached result.
+
+    This prevents that callers modifying their result in place alter the
+    cache.
+    """
+    if isinstance(value, mdp.numx.ndarray):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy_result(item) for item in value)
+    if isinstance(value, list):
+        return [_copy_result(item) for item in value]
+    return value
+
+
+def _update_fingerprint(h, obj, _stack=()):
+    """Feed 'obj' into the hash object 'h'.
+
+    Arrays are hashed directly from their buffer, nodes by their content
+    fingerprint, functions by their code, and other objects with a
+    __dict__ (e.g. the flow inside a FlowNode) by their attributes without
+    the state tokens. Everything else is pickled.
+    """
+    if id(obj) in _stack:
+        # reference cycle
+        h.update(repr(('cycle', _stack.index(id(obj)))).encode('ascii'))
+        return
+    if isinstance(obj, Node):
+        h.update(_node_fingerprint(obj, _stack))
+        return
+    if isinstance(obj, mdp.numx.ndarray) and not obj.dtype.hasobject:
+        h.update(repr((obj.dtype.str, obj.shape)).encode('ascii'))
+        h.update(mdp.numx.ascontiguousarray(obj).view(mdp.numx.uint8).data)
+        return
+    if isinstance(obj, (str, bytes, int, float, complex, bool, type(None))):
+        h.update(pickle.dumps(obj, protocol=2))
+        return
+    _stack = _stack + (id(obj),)
+    if isinstance(obj, (tuple, list)):
+        h.update(repr((type(obj).__name__, len(obj))).encode('ascii'))
+        for item in obj:
+            _update_fingerprint(h, item, _stack)
+    elif isinstance(obj, dict):
+        # the keys are ordered by their fingerprint, since they might not
+        # be comparable
+        items = sorted((_fingerprint(key), value)
+                       for key, value in obj.items()
+                       if key != '_state_token')
+        h.update(repr(('dict', [key for key, _ in items])).encode('ascii'))
+        for _, value in items:
+            _update_fingerprint(h, value, _stack)
+    elif isinstance(obj, types.FunctionType):
+        # functions are pickled by reference, but lambdas not at all
+        h.update(repr((obj.__module__, obj.__name__)).encode('ascii'))
+        h.update(marshal.dumps(obj.__code__))
+        _update_fingerprint(h, obj.__defaults__, _stack)
+        _update_fingerprint(h, [cell.cell_contents
+                                for cell in obj.__closure__ or ()], _stack)
+    elif isinstance(obj, types.MethodType):
+        _update_fingerprint(h, (obj.__func__, obj.__self__), _stack)
+    elif (hasattr(obj, '__dict__') and
+          not isinstance(obj, (type, types.ModuleType))):
+        h.update(repr((type(obj).__module__,
+                       type(obj).__name__)).encode('ascii'))
+        getstate = getattr(type(obj), '__getstate__', None)
+        if (getstate is not None and
+                getstate is not getattr(object, '__getstate__', None)):
+            # e.g. the cumulator buffers only pickle the collected data
+            _update_fingerprint(h, obj.__getstate__(), _stack)
+        else:
+            _update_fingerprint(h, obj.__dict__, _stack)
+    else:
+        try:
+            h.update(pickle.dumps(obj, protocol=2))
+        except Exception:
+            if joblib is None:
+                # such objects are only recognized by their identity
+                h.update(repr((type(obj).__name__, id(obj))).encode('ascii'))
+            else:
+                h.update(joblib.hash(obj).encode('ascii'))
+
+
+def _fingerprint(*objs):
+    """Return a content hash of the given objects."""
+    h = _hash_func()
+    for obj in objs:
+        _update_fingerprint(h, obj)
+    return h.digest()
+
+
+def _node_fingerprint(node, _stack=()):
+    """Return a content hash of the state of 'node'.
+
+    The hash is computed from scratch on every call, so that in place
+    changes of the node arrays are detected as well. The state tokens of
+    the node and of the nodes and objects inside it are ignored.
+    """
+    h = _hash_func()
+    h.update(repr((type(node).__module__,
+                   type(node).__name__)).encode('ascii'))
+    _update_fingerprint(h, node.__dict__, _stack + (id(node),))
+    return h.digest()
+
+
+class _NodeKey(object):
+    """Wrap a node so that joblib only hashes its content fingerprint."""
+
+    def __init__(self, node):
+        self.node = node
+
+    def __reduce__(self):
+        # joblib hashes the arguments by pickling them
+        return (_NodeKey, (_node_fingerprint(self.node),))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, str(self.node))
+
+
+def _execute_node(node_key, x, *args, **kwargs):
+    """Execute the node wrapped in 'node_key' without caching."""
+    return node_key.node._non_extension_execute(x, *args, **kwargs)
 
 def set_cachedir(cachedir=None, verbose=0):
     """Set root directory for the joblib cache.
@@ -48,6 +252,10 @@ def set_cachedir(cachedir=None, verbose=0):
     global _cached_methods
     global _memory
 
+    if joblib is None:
+        errstr = "The joblib cache requires the 'joblib' module."
+        raise mdp.MDPException(errstr)
+
     if cachedir is None:
         _cacheobj = TemporaryDirectory(prefix='mdp-joblib-cache.')
         cachedir = _cacheobj.name
@@ -71,6 +279,10 @@ class CacheExecuteExtensionNode(ExtensionNode, Node):
     or
     3) the instance is registered to be cached
 
+    The results are stored either in the joblib disk cache or in the
+    in-process LRU cache, depending on the 'backend' chosen in
+    `activate_caching`.
+
     *Warning: this extension might break the algorithms if nodes rely
     on side effects.*
 
@@ -99,10 +311,9 @@ def set_instance_cache(self, active=True):
         # add to global dictionary
         global _cached_instances
         if active:
-            _cached_instances.append(self)
+            _cached_instances.add(self)
         else:
-            if self in _cached_instances:
-                _cached_instances.remove(self)
+            _cached_instances.discard(self)
 
     def execute(self, x, *args, **kwargs):
         global _cached_methods
@@ -114,14 +325,29 @@ def execute(self, x, *args, **kwargs):
 
         if self not in _cached_methods:
             global _memory
-            _cached_methods[self] = _memory.cache(
-                self._non_extension_execute.__func__)
+            if _memory is not None:
+                _cached_methods[self] = _memory.cache(_execute_node)
+            else:
+                _cached_methods[self] = _execute_node
             # execute pre-execution checks once so that all automatic
             # settings of things like dtype and input_dim are done, and
             # caching begins from first execution, not the second
             self._pre_execution_checks(x)
 
-        return _cached_methods[self](self, x, *args, **kwargs)
+        # the joblib cache identifies the node by a content fingerprint
+        global _lru
+        if _lru is None:
+            return _cached_methods[self](_NodeKey(self), x, *args, **kwargs)
+
+        # the in-process cache identifies the node by its state token
+        key = (self._get_state_token(), _fingerprint(x, args, kwargs))
+        result = _lru.get(key)
+        if result is None:
+            result = _cached_methods[self](_NodeKey(self), x,
+                                           *args, **kwargs)
+            if not _lru.set(key, result):
+                return result
+        return _copy_result(result)
 
 
 # ------- helper functions and context manager
@@ -130,7 +356,8 @@ def execute(self, x, *args, **kwargs):
 
 def activate_caching(cachedir=None,
                      cache_classes=None, cache_instances=None,
-                     verbose=0):
+                     verbose=0, backend='joblib',
+                     max_bytes=DEFAULT_MAX_BYTES, spill=False):
     """Activate caching extension.
 
     By default, the cache is activated globally (i.e., for all instances
@@ -146,19 +373,52 @@ def activate_caching(cachedir=None,
      cache_classes
       A list of Node instances for which caching is activated.
       Default value: None
+     backend
+      'joblib' to cache the results on disk with joblib (default), or
+      'memory' to keep them in an in-process LRU cache, which does not
+      need joblib. The joblib cache hashes the whole content of a node on
+      every call. The memory cache identifies the input data by a hash
+      of their content and the nodes by their state token (see
+      `Node._get_state_token`), so that only the input data is hashed.
+      *Warning: the state token only changes when an attribute of the
+      node is assigned (or the node is trained), so with the 'memory'
+      backend in place changes like ``node.v *= 2`` return stale results
+      until the attribute is reassigned.*
+     max_bytes
+      Maximum total size of the results kept by the 'memory' backend.
+      The least recently used results are dropped first.
+     spill
+      If True, the 'memory' backend falls back to the joblib disk cache
+      in 'cachedir' for results that are not in memory.
     """
     global _cache_active_global
     global _cached_classes
     global _cached_instances
-
-    set_cachedir(cachedir=cachedir, verbose=verbose)
+    global _cached_methods
+    global _cachedir
+    global _cacheobj
+    global _memory
+    global _lru
+
+    if backend == 'joblib':
+        set_cachedir(cachedir=cachedir, verbose=verbose)
+        _lru = None
+    elif backend == 'memory':
+        if spill:
+            set_cachedir(cachedir=cachedir, verbose=verbose)
+        else:
+            _cachedir = _cacheobj = _memory = None
+            _cached_methods.clear()
+        _lru = _LRUCache(max_bytes)
+    else:
+        raise mdp.MDPException("Unknown cache backend: %s" % str(backend))
     _cache_active_global = (cache_classes is None and cache_instances is None)
 
     # active cache for specific classes and instances
     if cache_classes is not None:
-        _cached_classes = list(cache_classes)
+        _cached_classes = set(cache_classes)
     if cache_instances is not None:
-        _cached_instances = list(cache_instances)
+        _cached_instances = weakref.WeakSet(cache_instances)
 
     activate_extension('cache_execute')
 
@@ -171,10 +431,12 @@ def deactivate_caching(cachedir=None):
     global _cached_classes
     global _cached_instances
     global _cached_methods
+    global _lru
     _cache_active_global = True
-    _cached_classes = []
-    _cached_instances = []
-    _cached_methods = {}
+    _cached_classes = set()
+    _cached_instances = weakref.WeakSet()
+    _cached_methods = weakref.WeakKeyDictionary()
+    _lru = None
 
 class cache(object):
     """Context manager for the 'cache_execute' extension.
@@ -191,7 +453,8 @@ class cache(object):
     """
 
     def __init__(self, cachedir=None, cache_classes=None, cache_instances=None,
-                 verbose=0):
+                 verbose=0, backend='joblib', max_bytes=DEFAULT_MAX_BYTES,
+                 spill=False):
         """Activate caching extension.
 
         By default, the cache is activated globally (i.e., for all instances
@@ -207,15 +470,21 @@ def __init__(self, cachedir=None, cache_classes=None, cache_instances=None,
          cache_classes
           A list of Node instances for which caching is activated.
           Default value: None
+         backend, max_bytes, spill
+          The cache backend and its options, see `activate_caching`.
         """
         self.cachedir = cachedir
         self.cache_classes = cache_classes
         self.cache_instances = cache_instances
         self.verbose = verbose
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.spill = spill
 
     def __enter__(self):
         activate_caching(self.cachedir, self.cache_classes,
-                         self.cache_instances, self.verbose)
+                         self.cache_instances, self.verbose,
+                         self.backend, self.max_bytes, self.spill)
 
     def __exit__(self, type, value, traceback):
         deactivate_caching()
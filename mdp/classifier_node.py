@@ -113,9 +113,9 @@ def _check_train_args(self, x, labels):
             raise mdp.TrainingException(msg)
 
     def _train(self, x, labels):
-        """Cumulate all input data in a one dimensional list."""
+        """Cumulate all input data and the labels."""
         self.tlen += x.shape[0]
-        self.data.extend(x.ravel().tolist())
+        self._cumulate('data', x)
 
         # if labels is a number, all x's belong to the same class
         if isinstance(labels, (list, tuple, numx.ndarray)):
@@ -126,9 +126,8 @@ def _train(self, x, labels):
         self.labels.extend(labels.ravel().tolist())
 
     def _stop_training(self, *args, **kwargs):
-        """Transform the data and labels lists to array objects and reshape them."""
-        self.data = numx.array(self.data, dtype=self.dtype)
-        self.data.shape = (self.tlen, self.input_dim)
+        """Transform the data and labels to array objects."""
+        self.data = self._cumulated('data')
         self.labels = numx.array(self.labels)
         self.labels.shape = (self.tlen)
 
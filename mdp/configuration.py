@@ -69,7 +69,8 @@ class methods `ExternalDepFound` and `ExternalDepFailed`.
       ``MDP_DISABLE_LIBSVM``
         inhibit loading of the svm classifier
       ``MDP_DISABLE_JOBLIB``
-        inhibit loading of the ``joblib`` module and `mdp.caching`
+        inhibit loading of the ``joblib`` module (`mdp.caching` is then
+        limited to the in-process cache)
       ``MDP_DISABLE_SKLEARN``
         inhibit loading of the ``sklearn`` module
       ``MDPNSDEBUG``
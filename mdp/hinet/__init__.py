@@ -29,7 +29,7 @@
 
 from .flownode import FlowNode
 from .flownode_online import (OnlineFlowNode, CircularOnlineFlowNode)
-from .layer import Layer, SameInputLayer, CloneLayer
+from .layer import Layer, SameInputLayer, CloneLayer, SwitchboardCloneLayer
 from .layer_online import OnlineLayer, SameInputOnlineLayer, CloneOnlineLayer
 from .switchboard import (
     Switchboard, SwitchboardException, MeanInverseSwitchboard,
@@ -48,6 +48,7 @@
 )
 
 __all__ = ['FlowNode', 'OnlineFlowNode', 'CircularOnlineFlowNode', 'Layer', 'SameInputLayer', 'CloneLayer',
+           'SwitchboardCloneLayer',
            'OnlineLayer', 'SameInputOnlineLayer', 'CloneOnlineLayer',
            'Switchboard', 'SwitchboardException', 'ChannelSwitchboard',
            'Rectangular2dSwitchboard', 'Rectangular2dSwitchboardException',
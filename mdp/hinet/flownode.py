@@ -136,6 +136,14 @@ def is_trainable(self):
     def is_invertible(self):
         return all(node.is_invertible() for node in self._flow)
 
+    def is_row_independent(self):
+        return all(node.is_row_independent() for node in self._flow)
+
+    def _get_state_token(self):
+        # the internal nodes can also be modified directly
+        return (super(FlowNode, self)._get_state_token(),
+                tuple(node._get_state_token() for node in self._flow))
+
     def _get_train_seq(self):
         """Return a training sequence containing all training phases."""
         
@@ -7,6 +7,7 @@
 from __future__ import division
 import mdp
 from mdp import numx
+from .switchboard import Rectangular2dSwitchboard
 
 
 # TODO: maybe turn self.nodes into a read only property with self._nodes
@@ -132,6 +133,11 @@ def is_trainable(self):
     def is_invertible(self):
         return all(node.is_invertible() for node in self.nodes)
 
+    def _get_state_token(self):
+        # the internal nodes can also be modified directly
+        return (super(Layer, self)._get_state_token(),
+                tuple(node._get_state_token() for node in self.nodes))
+
     def _get_train_seq(self):
         """Return the train sequence.
 
@@ -249,6 +255,11 @@ class CloneLayer(Layer):
     A CloneLayer can be used for weight sharing in the training phase. It might
     be also useful for reducing the memory footprint use during the execution
     phase (since only a single node instance is needed).
+
+    The data for the clones is stacked, so that the node is executed only
+    once. If the node is row independent (see Node.is_row_independent)
+    this is also done for the training, otherwise the node is trained
+    separately with the data of every clone.
     """
 
     def __init__(self, node, n_nodes=1, dtype=None):
@@ -261,6 +272,14 @@ def __init__(self, node, n_nodes=1, dtype=None):
         super(CloneLayer, self).__init__((node,) * n_nodes, dtype=dtype)
         self.node = node  # attribute for convenience
 
+    def _train(self, x, *args, **kwargs):
+        """Perform single training step by training the internal node."""
+        if args or kwargs or not self.node.is_row_independent():
+            # the additional arguments belong to the unstacked data
+            super(CloneLayer, self)._train(x, *args, **kwargs)
+        elif self.node.is_training():
+            self.node.train(self._stack(x, self.node.input_dim))
+
     def _stop_training(self, *args, **kwargs):
         """Stop training of the internal node."""
         if self.node.is_training():
@@ -268,17 +287,152 @@ def _stop_training(self, *args, **kwargs):
         if self.output_dim is None:
             self.output_dim = self._get_output_dim_from_nodes()
 
+    @staticmethod
+    def _stack(x, dim):
+        """Reshape the data from (n, n_nodes*dim) to (n*n_nodes, dim)."""
+        return x.reshape(x.shape[0] * x.shape[1] // dim, dim)
+
     def _execute(self, x, *args, **kwargs):
-        n_samples = x.shape[0]
-        x = x.reshape(n_samples * x.shape[1] // self.node.input_dim, self.node.input_dim)
-        y = self.node.execute(x)
-        return y.reshape(n_samples, self.output_dim)
+        y = self.node.execute(self._stack(x, self.node.input_dim))
+        return y.reshape(x.shape[0], self.output_dim)
 
     def _inverse(self, x, *args, **kwargs):
-        n_samples = x.shape[0]
-        x = x.reshape(n_samples * x.shape[1] // self.node.output_dim, self.node.output_dim)
-        y = self.node.inverse(x)
-        return y.reshape(n_samples, self.input_dim)
+        y = self.node.inverse(self._stack(x, self.node.output_dim))
+        return y.reshape(x.shape[0], self.input_dim)
+
+
+class SwitchboardCloneLayer(CloneLayer):
+    """CloneLayer which does the routing of a ChannelSwitchboard itself.
+
+    SwitchboardCloneLayer(switchboard, node) gives the same results as
+    Flow([switchboard, CloneLayer(node, switchboard.output_channels)]),
+    but the switchboard output is never created for all the data at once.
+    The input of the clones is gathered for chunks of samples instead,
+    so that a gathered chunk is not larger than max_memory bytes.
+    For a Rectangular2dSwitchboard the fields are read from a strided
+    view of the input, without any fancy indexing.
+    """
+
+    def __init__(self, switchboard, node, max_memory=2**27, dtype=None):
+        """Setup the layer with the given switchboard and node.
+
+        Keyword arguments:
+        switchboard -- ChannelSwitchboard doing the routing, the dimension
+            of its output channels must be equal to node.input_dim.
+        node -- Node to be cloned, one clone per switchboard output channel.
+        max_memory -- Maximum size in bytes of the data gathered at once.
+        """
+        if node.input_dim != switchboard.out_channel_dim:
+            err = ("The node input_dim %s does not match the switchboard "
+                   "out_channel_dim %d." % (str(node.input_dim),
+                                            switchboard.out_channel_dim))
+            raise mdp.NodeException(err)
+        super(SwitchboardCloneLayer, self).__init__(
+                                    node, n_nodes=switchboard.output_channels,
+                                    dtype=dtype)
+        self.switchboard = switchboard
+        self.max_memory = max_memory
+        self._input_dim = switchboard.input_dim
+        self._field_view_params = self._get_field_view_params()
+
+    def _get_field_view_params(self):
+        """Return the shape and the strides (in units of input entries)
+        of the strided view giving the switchboard output, or None if the
+        routing cannot be expressed as such a view."""
+        sboard = self.switchboard
+        if not isinstance(sboard, Rectangular2dSwitchboard):
+            return None
+        x_in, _ = sboard.in_channels_xy
+        x_field, y_field = sboard.field_channels_xy
+        x_spacing, y_spacing = sboard.field_spacing_xy
+        x_out, y_out = sboard.out_channels_xy
+        chan_dim = sboard.in_channel_dim
+        shape = (y_out, x_out, y_field, x_field, chan_dim)
+        strides = (y_spacing * x_in * chan_dim, x_spacing * chan_dim,
+                   x_in * chan_dim, chan_dim, 1)
+        # make sure that the view reproduces the switchboard connections
+        indices = numx.arange(sboard.input_dim)
+        indices = numx.lib.stride_tricks.as_strided(
+                        indices, shape=shape,
+                        strides=[s * indices.itemsize for s in strides])
+        if not numx.array_equal(indices.reshape(-1), sboard.connections):
+            return None
+        return shape, strides
+
+    def _gather(self, x):
+        """Return the stacked clone input (n*n_nodes, node.input_dim)
+        for the data x."""
+        if self._field_view_params is None:
+            fields = x[:, self.switchboard.connections]
+        else:
+            shape, strides = self._field_view_params
+            fields = numx.lib.stride_tricks.as_strided(
+                        x, shape=(x.shape[0],) + shape,
+                        strides=((x.strides[0],) +
+                                 tuple(s * x.strides[1] for s in strides)))
+        return self._stack(fields.reshape(x.shape[0], -1),
+                           self.node.input_dim)
+
+    def _chunks(self, x):
+        """Yield the slices of x for the chunks of samples."""
+        itemsize = numx.dtype(x.dtype).itemsize
+        chunk_len = max(1, self.max_memory //
+                        (itemsize * self.switchboard.output_dim))
+        for start in range(0, x.shape[0], chunk_len):
+            yield slice(start, start + chunk_len)
+
+    def is_invertible(self):
+        return self.switchboard.is_invertible() and self.node.is_invertible()
+
+    def _pre_execution_checks(self, x):
+        """Make sure that output_dim is set and then perform normal checks."""
+        if self.output_dim is None:
+            self.node._pre_execution_checks(self._gather(x[:1]))
+            self.output_dim = self._get_output_dim_from_nodes()
+            if self.output_dim is None:
+                err = "output_dim must be set at this point for all nodes"
+                raise mdp.NodeException(err)
+        # intentionally use MRO above Layer, not SwitchboardCloneLayer
+        super(Layer, self)._pre_execution_checks(x)
+
+    def _train(self, x, *args, **kwargs):
+        """Perform single training step by training the internal node."""
+        if not self.node.is_training():
+            return
+        if args or kwargs or not self.node.is_row_independent():
+            for channel in range(self.switchboard.output_channels):
+                self.node.train(
+                    x[:, self.switchboard.get_out_channel_input(channel)],
+                    *args, **kwargs)
+        else:
+            for chunk in self._chunks(x):
+                self.node.train(self._gather(x[chunk]))
+
+    def _execute(self, x, *args, **kwargs):
+        y = None
+        for chunk in self._chunks(x):
+            y_chunk = self.node.execute(self._gather(x[chunk]))
+            if y is None:
+                y = numx.empty((x.shape[0], self.output_dim),
+                               dtype=y_chunk.dtype)
+            y[chunk] = y_chunk.reshape(-1, self.output_dim)
+        return y
+
+    def _inverse(self, x, *args, **kwargs):
+        # the inverse of the clones has the size of the switchboard output,
+        # so it is created for chunks of samples as well
+        y = None
+        for chunk in self._chunks(x):
+            x_chunk = x[chunk]
+            y_chunk = self.node.inverse(self._stack(x_chunk,
+                                                    self.node.output_dim))
+            y_chunk = self.switchboard.inverse(
+                y_chunk.reshape(x_chunk.shape[0], self.switchboard.output_dim))
+            if y is None:
+                y = numx.empty((x.shape[0], self.input_dim),
+                               dtype=y_chunk.dtype)
+            y[chunk] = y_chunk
+        return y
 
 
 class SameInputLayer(Layer):
@@ -71,6 +71,14 @@ def __init__(self, input_dim, connections):
     def _execute(self, x):
         return x[:, self.connections]
 
+    def _get_affine_map(self):
+        W = numx.zeros((self.input_dim, self.output_dim), dtype=self.dtype)
+        W[self.connections, numx.arange(self.output_dim)] = 1
+        return W, numx.zeros(self.output_dim, dtype=self.dtype)
+
+    def _get_index_map(self):
+        return self.connections
+
     @staticmethod
     def is_trainable():
         return False
@@ -14,6 +14,8 @@
 import os as _os
 import sys as _sys
 import mdp
+from .signal_node import (_has_default_execute, _get_affine_map,
+                          _get_index_map)
 from builtins import object
 from builtins import range
 from builtins import str
@@ -87,6 +89,113 @@ def __init__(self, *args):
         Exception.__init__(self, errstr)
 
 
+class _TrainCache(object):
+    """Store the output of the already trained part of a flow.
+
+    The cache is filled while a node is trained with the chunks produced
+    by the nodes in front of it. When the following node is trained with
+    the very same data iterable, the cached chunks are advanced through the
+    newly trained node only, instead of re-executing the whole prefix of
+    the flow for every chunk.
+
+    The extra training arguments (e.g. labels) returned by the iterable
+    are always kept in memory, the data chunks are stored according to
+    'mode':
+
+    'memory' -- the chunks are kept in memory
+    'disk' -- the chunks are saved as '.npy' files and loaded completely
+              when they are needed
+    'mmap' -- the chunks are saved as '.npy' files and are memory-mapped
+              (copy-on-write) when they are needed
+    """
+
+    MODES = ('memory', 'disk', 'mmap')
+
+    def __init__(self, mode, cache_dir=None):
+        if mode not in self.MODES:
+            err = ("Unknown cache mode '%s', valid modes are: %s" %
+                   (str(mode), ', '.join(self.MODES)))
+            raise FlowException(err)
+        self.mode = mode
+        self.cache_dir = cache_dir
+        # the iterable that produced the cached chunks and the index of
+        # the last node that processed them (None if the cache is invalid)
+        self.source = None
+        self.nodenr = None
+        self._chunks = []
+        self._args = []
+        self._tmpdir = None
+        self._n_files = 0
+
+    def reset(self):
+        """Discard the cached chunks."""
+        if self.mode != 'memory':
+            for filename in self._chunks:
+                _os.remove(filename)
+        self._chunks = []
+        self._args = []
+        self.source = None
+        self.nodenr = None
+
+    def append(self, x, args):
+        """Add a chunk to the cache (while it is being filled)."""
+        self._chunks.append(self._store(x))
+        self._args.append(args)
+
+    def finish(self, source, nodenr):
+        """Mark the cache as complete for the given iterable and node."""
+        self.source = source
+        self.nodenr = nodenr
+
+    def is_valid_for(self, source):
+        return (self.nodenr is not None) and (self.source is source)
+
+    def advance(self, flow, nodenr):
+        """Execute the cached chunks through the nodes up to 'nodenr'."""
+        for i in range(self.nodenr+1, nodenr+1):
+            node = flow.flow[i]
+            for j, stored in enumerate(self._chunks):
+                try:
+                    y = node.execute(self._load(stored))
+                except Exception as e:
+                    flow._propagate_exception(e, i)
+                self._chunks[j] = self._store(y)
+                if self.mode != 'memory':
+                    _os.remove(stored)
+            self.nodenr = i
+
+    def close(self):
+        """Discard the cached chunks and remove any temporary file."""
+        self.reset()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def __iter__(self):
+        for stored, args in zip(self._chunks, self._args):
+            yield self._load(stored), args
+
+    def _store(self, x):
+        if self.mode == 'memory':
+            return x
+        if self._tmpdir is None:
+            self._tmpdir = mdp.utils.TemporaryDirectory(prefix='MDPcache_',
+                                                        dir=self.cache_dir)
+        filename = _os.path.join(self._tmpdir.name,
+                                 'chunk_%d.npy' % self._n_files)
+        self._n_files += 1
+        numx.save(filename, x)
+        return filename
+
+    def _load(self, stored):
+        if self.mode == 'memory':
+            return stored
+        elif self.mode == 'disk':
+            return numx.load(stored)
+        else:
+            return numx.load(stored, mmap_mode='c')
+
+
 class Flow(object):
     """A 'Flow' is a sequence of nodes that are trained and executed
     together to form a more complex algorithm.  Input data is sent to the
@@ -135,10 +244,12 @@ def _propagate_exception(self, except_, nodenr):
             ('\n', 40*'-', act, 'Node Traceback:\n', prev, 40*'-'))
         raise FlowExceptionCR(errstr, self, except_)
 
-    def _train_node(self, data_iterable, nodenr):
+    def _train_node(self, data_iterable, nodenr, cache=None):
         """Train a single node in the flow.
 
         nodenr -- index of the node in the flow
+        cache -- optional _TrainCache instance, used to store and reuse the
+                 output of the nodes in front of the trained node
         """
         node = self.flow[nodenr]
         if (data_iterable is not None) and (not node.is_trainable()):
@@ -161,6 +272,17 @@ def _train_node(self, data_iterable, nodenr):
         try:
             train_arg_keys = self._get_required_train_args(node)
             train_args_needed = bool(len(train_arg_keys))
+            # the cache holds the output of the previous nodes only if
+            # they were fed with the same iterable
+            from_cache = fill_cache = False
+            if (cache is not None) and (nodenr > 0):
+                if cache.is_valid_for(data_iterable):
+                    cache.advance(self, nodenr-1)
+                    from_cache = True
+                else:
+                    cache.reset()
+                    fill_cache = True
+            iterable = cache if from_cache else data_iterable
             # We leave the last training phase open for the
             # CheckpointFlow class.
             # Checkpoint functions must close it explicitly if needed!
@@ -168,12 +290,14 @@ def _train_node(self, data_iterable, nodenr):
             # automatically when the node is executed.
             while True:
                 empty_iterator = True
-                for x in data_iterable:
+                for x in iterable:
                     empty_iterator = False
                     # the arguments following the first are passed only to the
                     # currently trained node, allowing the implementation of
                     # supervised nodes
-                    if (type(x) is tuple) or (type(x) is list):
+                    if from_cache:
+                        x, arg = x
+                    elif (type(x) is tuple) or (type(x) is list):
                         arg = x[1:]
                         x = x[0]
                     else:
@@ -189,8 +313,10 @@ def _train_node(self, data_iterable, nodenr):
                                    str(train_arg_keys))
                             raise FlowException(err)
                     # filter x through the previous nodes
-                    if nodenr > 0:
+                    if nodenr > 0 and not from_cache:
                         x = self._execute_seq(x, nodenr-1)
+                    if fill_cache:
+                        cache.append(x, arg)
                     # train current node
                     node.train(x, *arg)
                 if empty_iterator:
@@ -205,6 +331,12 @@ def _train_node(self, data_iterable, nodenr):
                         err_str = ("The training data iterator for node "
                                    "no. %d is empty." % (nodenr+1))
                         raise FlowException(err_str)
+                if fill_cache:
+                    # further training phases are fed from the cache
+                    cache.finish(data_iterable, nodenr-1)
+                    iterable = cache
+                    from_cache = True
+                    fill_cache = False
                 self._stop_training_hook()
                 if node.get_remaining_train_phase() > 1:
                     # close the previous training phase
@@ -312,7 +444,7 @@ def set_crash_recovery(self, state=True):
         """
         self._crash_recovery = state
 
-    def train(self, data_iterables):
+    def train(self, data_iterables, cache_mode=None, cache_dir=None):
         """Train all trainable nodes in the flow.
 
         'data_iterables' is a list of iterables, one for each node in the flow.
@@ -335,17 +467,43 @@ def train(self, data_iterables):
         Instead of a data array 'x' the iterators can also return a list or
         tuple, where the first entry is 'x' and the following are args for the
         training of the node (e.g. for supervised training).
+
+        By default the data for each node is processed by all the nodes in
+        front of it, so that the nodes at the beginning of the flow are
+        executed again for every following node. If 'cache_mode' is set,
+        the output of the already trained part of the flow is cached instead
+        and the following node is fed from the cache, so that every node is
+        executed only once on the training data. This only applies to
+        consecutive nodes that receive the very same iterable object (e.g.
+        when 'data_iterables' is a single array). Possible values are:
+
+        - None: no caching (default)
+        - 'memory': keep the cached chunks in memory
+        - 'disk': save the cached chunks as '.npy' files in a temporary
+          directory and load them when needed
+        - 'mmap': like 'disk', but the chunks are memory-mapped
+
+        'cache_dir' is the directory in which the temporary directory for
+        the 'disk' and 'mmap' modes is created (default: the system default
+        location for temporary files). The cache is removed at the end of
+        the training.
         """
 
         data_iterables = self._train_check_iterables(data_iterables)
+        cache = (_TrainCache(cache_mode, cache_dir)
+                 if cache_mode is not None else None)
 
-        # train each Node successively
-        for i in range(len(self.flow)):
-            if self.verbose:
-                print("Training node #%d (%s)" % (i, str(self.flow[i])))
-            self._train_node(data_iterables[i], i)
-            if self.verbose:
-                print("Training finished")
+        try:
+            # train each Node successively
+            for i in range(len(self.flow)):
+                if self.verbose:
+                    print("Training node #%d (%s)" % (i, str(self.flow[i])))
+                self._train_node(data_iterables[i], i, cache)
+                if self.verbose:
+                    print("Training finished")
+        finally:
+            if cache is not None:
+                cache.close()
 
         self._close_last_node()
 
@@ -361,7 +519,7 @@ def _execute_seq(self, x, nodenr=None):
                 self._propagate_exception(e, i)
         return x
 
-    def execute(self, iterable, nodenr=None):
+    def execute(self, iterable, nodenr=None, out=None):
         """Process the data through all nodes in the flow.
 
         'iterable' is an iterable or iterator (note that a list is also an
@@ -370,18 +528,187 @@ def execute(self, iterable, nodenr=None):
 
         If 'nodenr' is specified, the flow is executed only up to
         node nr. 'nodenr'. This is equivalent to 'flow[:nodenr+1](iterable)'.
+
+        If 'out' is specified, the results are written consecutively into
+        this preallocated array (e.g. a 'numpy.memmap') instead of being
+        concatenated at the end, and the filled part of 'out' is returned.
+        See also 'iexecute'.
         """
+        if out is not None:
+            return self._write_chunks(self.iexecute(iterable, nodenr), out)
         if isinstance(iterable, numx.ndarray):
             return self._execute_seq(iterable, nodenr)
-        res = []
+        return numx.concatenate(list(self.iexecute(iterable, nodenr)))
+
+    def iexecute(self, iterable, nodenr=None):
+        """Process the data through all nodes in the flow chunk by chunk.
+
+        Return a generator that yields the result for each data array
+        returned by 'iterable' as soon as it has been processed, so that
+        the results never need to be kept in memory all at once.
+        The arguments are the same as for 'execute'.
+        """
+        if isinstance(iterable, numx.ndarray):
+            iterable = [iterable]
         empty_iterator = True
         for x in iterable:
             empty_iterator = False
-            res.append(self._execute_seq(x, nodenr))
+            yield self._execute_seq(x, nodenr)
         if empty_iterator:
             errstr = ("The execute data iterator is empty.")
             raise FlowException(errstr)
-        return numx.concatenate(res)
+
+    def freeze_execute(self, nodenr=None):
+        """Return a function that executes the flow with minimal overhead.
+
+        The per-call checks of all nodes are done only once here (see
+        'Node.freeze_execute'), so all nodes up to 'nodenr' must be
+        trained. The returned function 'f(x)' processes a single data
+        array 'x' through the nodes, calling their '_execute' methods
+        directly. The input is cast to the dtype of the first node, but
+        its dimension is not checked anymore.
+
+        This is useful to execute a trained flow on many small batches,
+        e.g. single observations in a real-time application.
+        """
+        flow = self.flow
+        if nodenr is None:
+            nodenr = len(flow)-1
+        functions = []
+        dtype = None
+        for i in range(nodenr+1):
+            node = flow[i]
+            try:
+                if i > 0:
+                    # set what the first execution would set
+                    if node.input_dim is None:
+                        node.input_dim = flow[i-1].output_dim
+                    if node.dtype is None:
+                        node.dtype = dtype
+                func = node.freeze_execute()
+            except Exception as e:
+                self._propagate_exception(e, i)
+            if (node.dtype == dtype and
+                    _has_default_execute(node)):
+                # the output of the previous node has already the
+                # right dtype
+                func = node._execute
+            functions.append(func)
+            dtype = node.dtype
+        propagate_exception = self._propagate_exception
+
+        def frozen_execute(x):
+            i = 0
+            try:
+                for i, func in enumerate(functions):
+                    x = func(x)
+            except Exception as e:
+                propagate_exception(e, i)
+            return x
+        return frozen_execute
+
+    def fuse_affine_nodes(self):
+        """Return a flow in which consecutive affine nodes are fused.
+
+        Trained nodes whose execution is an affine map
+        'x -> mult(x, W) + b' (e.g. 'PCANode', 'WhiteningNode', 'SFANode',
+        'FDANode' or 'LinearRegressionNode') are replaced, when two or
+        more of them follow each other, by a single 'mdp.nodes.AffineNode'
+        with the precomputed map. This saves one matrix product and one
+        temporary array per fused node. Nodes are only added to a fused
+        node as long as its matrix is not larger than the original
+        matrices together, so that the execution never gets more expensive
+        (e.g. a strong dimensionality reduction followed by an expansion
+        is not fused).
+
+        Nodes which only select columns ('x -> x[:, idx]', e.g. a
+        'Switchboard' or an 'IdentityNode') are not matrix products. They
+        are only fused into an adjacent affine node, by selecting the
+        rows or columns of its matrix, and are otherwise kept as they are.
+
+        The original nodes are not modified. They are kept by the
+        'AffineNode' to compute the inverse, which is available if all of
+        them are invertible. Nodes which are still in training are not
+        fused. Note that the fused flow gives the same result only up to
+        floating point rounding errors.
+        """
+        flow = []
+        # consecutive affine nodes to be fused, with the fused map (W, b)
+        # and the total size of their original matrices
+        sequence = []
+        W = b = None
+        size = 0
+        # consecutive index nodes which are not fused yet, with the
+        # composed index array
+        selection = []
+        index = None
+        for node in self.flow:
+            index_map = affine_map = None
+            if node.dtype is not None and node.dtype.kind in 'fc':
+                index_map = _get_index_map(node)
+                if index_map is None:
+                    affine_map = _get_affine_map(node)
+            if index_map is not None:
+                index_map = numx.asarray(index_map)
+                if sequence and node.dtype == sequence[-1].dtype:
+                    # select the columns of the fused matrix
+                    W_fused = W[:, index_map]
+                    if W_fused.size <= size:
+                        sequence.append(node)
+                        W, b = W_fused, b[index_map]
+                        continue
+                flow.extend(self._fuse_affine_sequence(sequence, W, b))
+                sequence = []
+                if selection and node.dtype == selection[-1].dtype:
+                    selection.append(node)
+                    index = index[index_map]
+                else:
+                    flow.extend(selection)
+                    selection = [node]
+                    index = index_map
+                continue
+            if affine_map is None:
+                flow.extend(self._fuse_affine_sequence(sequence, W, b))
+                flow.extend(selection)
+                sequence = []
+                selection = []
+                flow.append(node)
+                continue
+            W_node, b_node = affine_map
+            b_node = numx.ravel(b_node)
+            if sequence and node.dtype == sequence[-1].dtype:
+                W_fused = mdp.utils.mult(W, W_node)
+                if W_fused.size <= size + W_node.size:
+                    sequence.append(node)
+                    size += W_node.size
+                    W, b = W_fused, mdp.utils.mult(b, W_node) + b_node
+                    continue
+            flow.extend(self._fuse_affine_sequence(sequence, W, b))
+            sequence = [node]
+            size = W_node.size
+            W, b = W_node, b_node
+            if selection:
+                # add the selected rows of the matrix for the input
+                input_dim = selection[0].input_dim
+                if (node.dtype == selection[-1].dtype and
+                        input_dim * W_node.shape[1] <= size):
+                    W = numx.zeros((input_dim, W_node.shape[1]),
+                                   dtype=W_node.dtype)
+                    numx.add.at(W, index, W_node)
+                    sequence = selection + sequence
+                else:
+                    flow.extend(selection)
+                selection = []
+        flow.extend(self._fuse_affine_sequence(sequence, W, b))
+        flow.extend(selection)
+        return self.__class__(flow)
+
+    @staticmethod
+    def _fuse_affine_sequence(nodes, W, b):
+        # Return the list of nodes replacing the sequence of affine nodes
+        if len(nodes) < 2:
+            return nodes
+        return [mdp.nodes.AffineNode(W, b, nodes=nodes, dtype=nodes[0].dtype)]
 
     def _inverse_seq(self, x):
         # Successively invert input data 'x' through all nodes backwards
@@ -393,7 +720,7 @@ def _inverse_seq(self, x):
                 self._propagate_exception(e, i)
         return x
 
-    def inverse(self, iterable):
+    def inverse(self, iterable, out=None):
         """Process the data through all nodes in the flow backwards
         (starting from the last node up to the first node) by calling the
         inverse function of each node. Of course, all nodes in the
@@ -403,21 +730,53 @@ def inverse(self, iterable):
         iterable), which returns data arrays that are used as input to the flow.
         Alternatively, one can specify one data array as input.
 
+        If 'out' is specified, the results are written consecutively into
+        this preallocated array (e.g. a 'numpy.memmap') and the filled part
+        of 'out' is returned. See also 'iinverse'.
+
         Note that this is _not_ equivalent to 'flow[::-1](iterable)',
         which also executes the flow backwards but calls the 'execute'
         function of each node."""
-
+        if out is not None:
+            return self._write_chunks(self.iinverse(iterable), out)
         if isinstance(iterable, numx.ndarray):
             return self._inverse_seq(iterable)
-        res = []
+        return numx.concatenate(list(self.iinverse(iterable)))
+
+    def iinverse(self, iterable):
+        """Process the data through all nodes in the flow backwards chunk by
+        chunk.
+
+        Return a generator that yields the result for each data array
+        returned by 'iterable' as soon as it has been processed.
+        The arguments are the same as for 'inverse'.
+        """
+        if isinstance(iterable, numx.ndarray):
+            iterable = [iterable]
         empty_iterator = True
         for x in iterable:
             empty_iterator = False
-            res.append(self._inverse_seq(x))
+            yield self._inverse_seq(x)
         if empty_iterator:
             errstr = ("The inverse data iterator is empty.")
             raise FlowException(errstr)
-        return numx.concatenate(res)
+
+    @staticmethod
+    def _write_chunks(chunks, out):
+        """Write the arrays in 'chunks' consecutively into 'out'.
+
+        Return the filled part of 'out'.
+        """
+        n_rows = 0
+        for y in chunks:
+            if n_rows + len(y) > len(out):
+                errstr = ("The output array is too small: %d rows given, "
+                          "at least %d needed." %
+                          (len(out), n_rows + len(y)))
+                raise FlowException(errstr)
+            out[n_rows:n_rows+len(y)] = y
+            n_rows += len(y)
+        return out[:n_rows]
 
     def copy(self, protocol=None):
         """Return a deep copy of the flow.
@@ -601,7 +960,8 @@ def _train_check_checkpoints(self, checkpoints):
 
         return checkpoints
 
-    def train(self, data_iterables, checkpoints):
+    def train(self, data_iterables, checkpoints, cache_mode=None,
+              cache_dir=None):
         """Train all trainable nodes in the flow.
 
         In addition to the basic behavior (see 'Node.train'), calls the
@@ -614,23 +974,31 @@ def train(self, data_iterables, checkpoints):
 
         The class CheckpointFunction can be used to define user-supplied
         checkpoint functions.
+
+        For 'cache_mode' and 'cache_dir' see 'Flow.train'.
         """
 
         data_iterables = self._train_check_iterables(data_iterables)
         checkpoints = self._train_check_checkpoints(checkpoints)
+        cache = (_TrainCache(cache_mode, cache_dir)
+                 if cache_mode is not None else None)
 
-        # train each Node successively
-        for i in range(len(self.flow)):
-            node = self.flow[i]
-            if self.verbose:
-                print("Training node #%d (%s)" % (i, type(node).__name__))
-            self._train_node(data_iterables[i], i)
-            if (i <= len(checkpoints)) and (checkpoints[i] is not None):
-                dic = checkpoints[i](node)
-                if dic:
-                    self.__dict__.update(dic)
-            if self.verbose:
-                print("Training finished")
+        try:
+            # train each Node successively
+            for i in range(len(self.flow)):
+                node = self.flow[i]
+                if self.verbose:
+                    print("Training node #%d (%s)" % (i, type(node).__name__))
+                self._train_node(data_iterables[i], i, cache)
+                if (i <= len(checkpoints)) and (checkpoints[i] is not None):
+                    dic = checkpoints[i](node)
+                    if dic:
+                        self.__dict__.update(dic)
+                if self.verbose:
+                    print("Training finished")
+        finally:
+            if cache is not None:
+                cache.close()
 
         self._close_last_node()
 
@@ -523,7 +523,7 @@ def train(self, data_iterables):
         data_iterables = self._train_check_iterables(data_iterables)
         self._train_nodes(data_iterables)
 
-    def execute(self, iterable, nodenr=None):
+    def execute(self, iterable, nodenr=None, out=None):
         """Process the data through all nodes between input and the output node.
         This is functionally similar to the execute method of an OnlineFlow.
 
@@ -533,7 +533,23 @@ def execute(self, iterable, nodenr=None):
         """
         if nodenr is None:
             nodenr = self.output_node_idx
-        return super(CircularOnlineFlow, self).execute(iterable, nodenr)
+        return super(CircularOnlineFlow, self).execute(iterable, nodenr, out)
+
+    def iexecute(self, iterable, nodenr=None):
+        """Process the data through all nodes between input and the output node
+        chunk by chunk. See 'Flow.iexecute'.
+        """
+        if nodenr is None:
+            nodenr = self.output_node_idx
+        return super(CircularOnlineFlow, self).iexecute(iterable, nodenr)
+
+    def freeze_execute(self, nodenr=None):
+        """Return a function that executes the flow between the input and
+        the output node with minimal overhead. See 'Flow.freeze_execute'.
+        """
+        if nodenr is None:
+            nodenr = self.output_node_idx
+        return super(CircularOnlineFlow, self).freeze_execute(nodenr)
 
     def _inverse_seq(self, x):
         # Successively invert input data 'x' through all nodes backwards from the output node to the input node.
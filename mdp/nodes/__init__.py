@@ -11,7 +11,7 @@
                               GeneralExpansionNode)
 from .fda_nodes import FDANode
 from .em_nodes import FANode
-from .misc_nodes import (IdentityNode, HitParadeNode, TimeFramesNode,
+from .misc_nodes import (IdentityNode, AffineNode, HitParadeNode, TimeFramesNode,
                          TimeDelayNode, TimeDelaySlidingWindowNode,
                          EtaComputerNode, NoiseNode, NormalNoiseNode,
                          CutoffNode, HistogramNode, AdaptiveCutoffNode)
@@ -54,7 +54,7 @@
            'EtaComputerNode', 'HitParadeNode', 'NoiseNode', 'NormalNoiseNode',
            'TimeFramesNode', 'TimeDelayNode', 'TimeDelaySlidingWindowNode',
            'CutoffNode', 'AdaptiveCutoffNode', 'HistogramNode',
-           'IdentityNode', '_OneDimensionalHitParade',
+           'IdentityNode', 'AffineNode', '_OneDimensionalHitParade',
            'OnlineCenteringNode', 'OnlineTimeDiffNode', 'CCIPCANode', 'CCIPCAWhiteningNode', 'MCANode',
            'IncSFANode', 'RecursiveExpansionNode', 'NormalizingRecursiveExpansionNode', ]
 
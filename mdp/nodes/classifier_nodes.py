@@ -355,12 +355,24 @@ def _label_one(self, pattern, threshold):
                     pattern[row] = new_pattern_row
         return mdp.utils.sign_to_bool(pattern)
 
-# TODO: Make it more efficient
-
 class KMeansClassifier(ClassifierNode):
-    """Employs K-Means Clustering for a given number of centroids."""
+    """Employs K-Means Clustering for a given number of centroids.
+
+    The initial centroids are chosen with the k-means++ seeding.
+    By default all the training data is stored and the centroids are
+    computed with the standard (Lloyd) algorithm in ``stop_training``.
+    If ``batch_size`` is given the node uses mini-batch k-means instead:
+    the centroids are updated in ``train`` with batches of
+    ``batch_size`` samples and no training data is stored.
+    """
+
+    # maximum number of elements in the distance matrices that are
+    # computed at once, used to bound the memory consumption
+    _max_dist_elements = 2**20
+
     def __init__(self, num_clusters, max_iter=10000, execute_method=None,
-                 input_dim=None, output_dim=None, dtype=None):
+                 input_dim=None, output_dim=None, dtype=None,
+                 batch_size=None):
         """Initializes an object of type 'KMeansClassifier'
         
         :param num_clusters: number of centroids to use = number of clusters
@@ -386,6 +398,12 @@ def __init__(self, num_clusters, max_iter=10000, execute_method=None,
                 
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
+
+        :param batch_size: If not None, use mini-batch k-means with batches
+            of ``batch_size`` samples. The centroids are then updated during
+            training and the training data is not stored. ``max_iter`` is
+            ignored in this mode.
+        :type batch_size: int
         """
         super(KMeansClassifier, self).__init__(execute_method=execute_method,
                                                input_dim=input_dim,
@@ -396,49 +414,122 @@ def __init__(self, num_clusters, max_iter=10000, execute_method=None,
         self.tlen = 0
         self._centroids = None
         self.max_iter = max_iter
+        self.batch_size = batch_size
+        # number of samples assigned to each centroid (mini-batch mode)
+        self._counts = None
 
     def _train(self, x):
-        # append all data
-        # we could use a Cumulator class here
         self.tlen += x.shape[0]
-        self.data.extend(x.ravel().tolist())
+        if self.batch_size is None:
+            # store the chunks, they are concatenated in _stop_training
+            self.data.append(x)
+            return
+        if self._centroids is None:
+            # collect enough samples to choose the initial centroids
+            self.data.append(x)
+            if self.tlen < self._num_clusters:
+                return
+            x = numx.concatenate(self.data)
+            self.data = []
+            self._centroids = self._kmeans_plusplus(x)
+            self._counts = numx.zeros(self._num_clusters, dtype=self.dtype)
+        for start in range(0, x.shape[0], self.batch_size):
+            self._minibatch_step(x[start:start+self.batch_size])
 
     def _stop_training(self):
-        self.data = numx.array(self.data, dtype=self.dtype)
-        self.data.shape = (self.tlen, self.input_dim)
-
+        if self.batch_size is not None:
+            if self._centroids is None:
+                # fewer samples than clusters, this raises an exception
+                self._centroids = self._kmeans_plusplus(
+                    numx.concatenate(self.data))
+            self.data = []
+            return
+        self.data = numx.concatenate(self.data).astype(self.dtype)
         # choose initial centroids unless they are already given
-        if not self._centroids:
-            import random
-            centr_idx = random.sample(range(self.tlen), self._num_clusters)
-            #numx_rand.permutation(self.tlen)[:self._num_clusters]
-            centroids = self.data[centr_idx]
+        if self._centroids is None:
+            centroids = self._kmeans_plusplus(self.data)
         else:
             centroids = self._centroids
 
         for step in range(self.max_iter):
-            # list of (sum_position, num_clusters)
-            new_centroids = [(0., 0.)] * len(centroids)
-            # cluster
-            for x in self.data:
-                idx = self._nearest_centroid_idx(x, centroids)
-                # update position and count
-                pos_count = (new_centroids[idx][0] + x,
-                             new_centroids[idx][1] + 1.)
-                new_centroids[idx] = pos_count
-
-            # get new centroid position
-            new_centroids = numx.array([old_div(c[0], c[1]) if c[1]>0. else centroids[idx]
-                                        for idx, c in enumerate(new_centroids)])
+            labels = self._nearest_centroids(self.data, centroids)
+            sums, counts = self._cluster_sums(self.data, labels)
+            # empty clusters keep their old centroid
+            new_centroids = centroids.copy()
+            nonempty = counts > 0
+            new_centroids[nonempty] = (sums[nonempty] /
+                                       counts[nonempty, numx.newaxis])
             # check if we are stable
             if numx.all(new_centroids == centroids):
-                self._centroids = centroids
-                return
+                break
             centroids = new_centroids
-
-    def _nearest_centroid_idx(self, data, centroids):
-        dists = numx.array([numx.linalg.norm(data - c) for c in centroids])
-        return dists.argmin()
+        self._centroids = centroids
+
+    def _kmeans_plusplus(self, x):
+        """Choose the initial centroids from the rows of x with the
+        k-means++ seeding."""
+        n_samples = x.shape[0]
+        if n_samples < self._num_clusters:
+            err = ("Not enough training data (%d samples) for %d clusters." %
+                   (n_samples, self._num_clusters))
+            raise mdp.TrainingException(err)
+        centroids = numx.empty((self._num_clusters, x.shape[1]),
+                               dtype=self.dtype)
+        centroids[0] = x[numx_rand.randint(n_samples)]
+        min_dist = utils.sqdist(x, centroids[:1])[:, 0]
+        for i in range(1, self._num_clusters):
+            cumdist = numx.cumsum(min_dist)
+            if cumdist[-1] > 0:
+                idx = cumdist.searchsorted(numx_rand.random() * cumdist[-1],
+                                           side='right')
+                idx = min(idx, n_samples - 1)
+            else:
+                # all the samples coincide with a centroid
+                idx = numx_rand.randint(n_samples)
+            centroids[i] = x[idx]
+            numx.minimum(min_dist, utils.sqdist(x, centroids[i:i+1])[:, 0],
+                         out=min_dist)
+        return centroids
+
+    def _cluster_sums(self, x, labels):
+        """Return the sum of the samples and the number of samples for
+        every cluster."""
+        k = self._num_clusters
+        counts = numx.bincount(labels, minlength=k).astype(self.dtype)
+        sums = numx.empty((k, x.shape[1]), dtype=self.dtype)
+        for j in range(x.shape[1]):
+            sums[:, j] = numx.bincount(labels, weights=x[:, j], minlength=k)
+        return sums, counts
+
+    def _minibatch_step(self, x):
+        """Move the centroids to the running mean of the samples assigned
+        to them."""
+        labels = self._nearest_centroids(x, self._centroids)
+        sums, counts = self._cluster_sums(x, labels)
+        self._counts += counts
+        nonempty = counts > 0
+        c = self._centroids[nonempty]
+        c += ((sums[nonempty] - counts[nonempty, numx.newaxis] * c) /
+              self._counts[nonempty, numx.newaxis])
+        self._centroids[nonempty] = c
+
+    def _nearest_centroids(self, x, centroids):
+        """Return the index of the nearest centroid for every row of x.
+
+        The distances are computed in chunks of rows to bound the size of
+        the distance matrix.
+        """
+        shift = centroids.mean(axis=0)
+        shifted = centroids - shift
+        c_sqnorms = numx.einsum('ij,ij->i', shifted, shifted)
+        chunk_len = max(1, self._max_dist_elements // len(centroids))
+        labels = numx.empty(x.shape[0], dtype=numx.intp)
+        for start in range(0, x.shape[0], chunk_len):
+            stop = start + chunk_len
+            labels[start:stop] = utils.sqdist(x[start:stop], centroids,
+                                              c_sqnorms,
+                                              shift).argmin(axis=1)
+        return labels
 
     def _label(self, x):
         """For a set of feature vectors x, this classifier returns
@@ -449,7 +540,7 @@ def _label(self, x):
         :return: A list of centroids
         :rtype: list
         """
-        return [self._nearest_centroid_idx(xi, self._centroids) for xi in x]
+        return self._nearest_centroids(x, self._centroids).tolist()
 
 
 class GaussianClassifier(ClassifierNode):
@@ -621,7 +712,8 @@ class NearestMeanClassifier(ClassifierNode):
     """Nearest-Mean classifier."""
     
     def __init__(self, execute_method=None,
-                 input_dim=None, output_dim=None, dtype=None):
+                 input_dim=None, output_dim=None, dtype=None,
+                 max_memory=2**27):
         """Initializes an object of type 'NearestMeanClassifier'
 
         :param execute_method: Set to string value 'label', 'rank', or 'prob' to
@@ -637,6 +729,10 @@ def __init__(self, execute_method=None,
         :type output_dim: int
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
+        :param max_memory: Maximum size in bytes of the distance matrix that
+            is computed at once (the data is processed in chunks of rows
+            accordingly).
+        :type max_memory: int
         """
         super(NearestMeanClassifier, self).__init__(
                                             execute_method=execute_method,
@@ -648,7 +744,8 @@ def __init__(self, execute_method=None,
         # initialized after training, used for vectorized execution:
         self.ordered_labels = []
         self.ordered_means = None  # will be array
-        
+        self.max_memory = max_memory
+
     def _train(self, x, labels):
         """Update the mean information for the different classes.
         
@@ -696,6 +793,23 @@ def _stop_training(self):
             ordered_means.append(self.label_means[label])
         self.ordered_means = numx.vstack(ordered_means)
             
+    def _square_distances(self, x):
+        """Yield the square distances between the data and the class means
+        for consecutive chunks of rows of x.
+
+        Each chunk is a (chunk_len, n_labels) array, the distances are
+        computed with a matrix product.
+        """
+        n_labels = len(self.ordered_labels)
+        itemsize = numx.dtype(self.dtype).itemsize
+        chunk_len = max(1, self.max_memory // (itemsize * n_labels))
+        shift = self.ordered_means.mean(axis=0)
+        shifted = self.ordered_means - shift
+        mean_sqnorms = numx.einsum('ij,ij->i', shifted, shifted)
+        for start in range(0, x.shape[0], chunk_len):
+            yield utils.sqdist(x[start:start+chunk_len], self.ordered_means,
+                               mean_sqnorms, shift)
+
     def _label(self, x):
         """Classify the data based on minimal distance to mean.
         
@@ -704,20 +818,53 @@ def _label(self, x):
         :return: The data labels.
         :rtype: list
         """
-        n_labels = len(self.ordered_labels)
-        differences = x[:,:,numx.newaxis].repeat(n_labels, 2). \
-                        swapaxes(1,2) - self.ordered_means
-        square_distances = (differences**2).sum(2)
-        label_indices = square_distances.argmin(1)
-        labels = [self.ordered_labels[i] for i in label_indices]
+        labels = []
+        for square_distances in self._square_distances(x):
+            labels += [self.ordered_labels[i]
+                       for i in square_distances.argmin(axis=1)]
         return labels
+
+    def rank(self, x, threshold=None):
+        """Returns ordered list with all labels ordered according to the
+        distance of x to the class means, nearest first
+        (e.g., [[3 1 2], [2 1 3], ...]).
+
+        :param x: The data to classify.
+        :type x: numpy.ndarray
+        :param threshold: If not None then labels with a square distance
+            larger than threshold are excluded.
+        :type threshold: float
+        :return: The ranked labels.
+        :rtype: list
+        """
+        self._pre_execution_checks(x)
+        x = self._refcast(x)
+        all_ranking = []
+        for square_distances in self._square_distances(x):
+            order = square_distances.argsort(axis=1, kind='stable')
+            for dists, indices in zip(square_distances, order):
+                if threshold is not None:
+                    indices = indices[dists[indices] <= threshold]
+                all_ranking.append([self.ordered_labels[i]
+                                    for i in indices])
+        return all_ranking
     
     
 class KNNClassifier(ClassifierNode):
-    """K-Nearest-Neighbour Classifier."""
-    
+    """K-Nearest-Neighbour Classifier.
+
+    The query points are compared with the stored samples in chunks,
+    so that the size of the distance matrices stays below ``max_memory``.
+    Alternatively a KD-tree index of the samples can be built at the
+    end of the training (this requires scipy), which is faster for
+    low dimensional data.
+    """
+
+    _INDEX_TYPES = (None, 'kdtree')
+
     def __init__(self, k=1, execute_method=None,
-                 input_dim=None, output_dim=None, dtype=None):
+                 input_dim=None, output_dim=None, dtype=None,
+                 max_memory=2**27, index=None):
         """Initializes an object of type 'KNNClassifier'
         
         :param k: Number of closest sample points that are taken into account.
@@ -739,19 +886,43 @@ def __init__(self, k=1, execute_method=None,
         
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
+
+        :param max_memory: Maximum size in bytes of the distance matrix that
+            is computed at once when labelling data (the query data is
+            processed in chunks of rows accordingly).
+        :type max_memory: int
+
+        :param index: Spatial index for the nearest neighbour queries.
+            None for a brute force search or 'kdtree' for a KD-tree
+            (requires scipy).
+        :type index: str
         """
         super(KNNClassifier, self).__init__(execute_method=execute_method,
                                             input_dim=input_dim,
                                             output_dim=output_dim,
                                             dtype=dtype)
+        if index not in self._INDEX_TYPES:
+            err = ("Unknown index type %s, supported types are %s." %
+                   (str(index), str(self._INDEX_TYPES)))
+            raise mdp.NodeException(err)
+        if index == 'kdtree':
+            try:
+                from scipy.spatial import cKDTree
+            except ImportError:
+                raise mdp.NodeException("The 'kdtree' index requires scipy.")
         self.k = k
+        self.max_memory = max_memory
+        self.index = index
         self._label_samples = {}  # temporary variable during training
         self.n_samples = None
         # initialized after training:
         self.samples = None  # 2d array with all samples
         self.sample_label_indices = None  # 1d array for label indices
         self.ordered_labels = []
-        
+        self._sample_shift = None
+        self._sample_sqnorms = None
+        self._tree = None
+
     def _train(self, x, labels):
         """Add the sample points to the classes.
         
@@ -796,6 +967,37 @@ def _stop_training(self):
                                 [numx.ones(len(ordered_samples[i]),
                                            dtype="int32") * i
                                  for i in range(len(self.ordered_labels))])
+        if self.index == 'kdtree':
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.samples)
+        else:
+            self._sample_shift = self.samples.mean(axis=0)
+            shifted = self.samples - self._sample_shift
+            self._sample_sqnorms = numx.einsum('ij,ij->i', shifted, shifted)
+
+    def _nearest_indices(self, x):
+        """Return the indices of the k nearest samples for every row of x.
+
+        The indices in each row are not sorted by distance.
+        """
+        k = min(self.k, self.n_samples)
+        if self._tree is not None:
+            _, indices = self._tree.query(x, k=k)
+            return indices.reshape(x.shape[0], k)
+        indices = numx.empty((x.shape[0], k), dtype=numx.intp)
+        itemsize = numx.dtype(self.dtype).itemsize
+        chunk_len = max(1, self.max_memory // (itemsize * self.n_samples))
+        for start in range(0, x.shape[0], chunk_len):
+            stop = start + chunk_len
+            square_distances = utils.sqdist(x[start:stop], self.samples,
+                                            self._sample_sqnorms,
+                                            self._sample_shift)
+            if k < self.n_samples:
+                indices[start:stop] = square_distances.argpartition(
+                                                    k-1, axis=1)[:, :k]
+            else:
+                indices[start:stop] = numx.arange(k)
+        return indices
 
     def _label(self, x):
         """Label the data by comparison with the reference points.
@@ -806,11 +1008,12 @@ def _label(self, x):
         :return: The labels
         :rtype: list
         """
-        square_distances = (x*x).sum(1)[:, numx.newaxis] \
-                      + (self.samples*self.samples).sum(1)
-        square_distances -= 2 * numx.dot(x, self.samples.T)
-        min_inds = square_distances.argsort()
-        win_inds = [numx.bincount(self.sample_label_indices[indices[0:self.k]]).
-                    argmax(0) for indices in min_inds]
+        n_labels = len(self.ordered_labels)
+        neighbour_labels = self.sample_label_indices[self._nearest_indices(x)]
+        # count the votes for every label, ties go to the first label
+        offsets = numx.arange(x.shape[0])[:, numx.newaxis] * n_labels
+        votes = numx.bincount((neighbour_labels + offsets).ravel(),
+                              minlength=x.shape[0] * n_labels)
+        win_inds = votes.reshape(x.shape[0], n_labels).argmax(axis=1)
         labels = [self.ordered_labels[i] for i in win_inds]
         return labels
@@ -1,12 +1,13 @@
 from __future__ import division
 from builtins import range
-from past.utils import old_div
 __docformat__ = "restructuredtext en"
 
 import mdp
 from mdp import numx
-from mdp.utils import mult, matmult, invert_exp_funcs2
+from mdp.utils import mult, invert_exp_funcs2, sqdist
 from mdp.nodes import GrowingNeuralGasNode
+# numpy.linalg works on stacks of matrices
+from numpy import linalg as _stacked_linalg
 
 def nmonomials(degree, nvariables):
     """Return the number of monomials of a given degree in a given number
@@ -92,6 +93,10 @@ def __init__(self, degree, input_dim = None, dtype = None):
         self._degree = int(degree)
         super(PolynomialExpansionNode, self).__init__(input_dim, dtype)
 
+    @staticmethod
+    def is_row_independent():
+        return True
+
     def _get_supported_dtypes(self):
         """Return the list of dtypes supported by this node.
         
@@ -174,9 +179,16 @@ class RBFExpansionNode(mdp.Node):
         y_j = exp(-0.5 * (x-c_j)^T S^-1 (x-c_j))
 
     for anisotropic RBFs.
+
+    Isotropic RBFs are evaluated for all centers at once with a single
+    matrix product. For anisotropic RBFs the inverse covariance matrices
+    are Cholesky factored, ``S_j^-1 = L_j L_j^T``, so that the quadratic
+    form becomes ``||L_j^T x - L_j^T c_j||^2``; the input is processed in
+    chunks of rows so that the intermediate array stays below
+    ``max_memory`` bytes.
     """
 
-    def __init__(self, centers, sizes, dtype = None):
+    def __init__(self, centers, sizes, dtype = None, max_memory=2**22):
         """Initializes an object of type 'RBFExpansionNode'.
         
         :param centers: Centers of the RBFs. The dimensionality
@@ -195,8 +207,13 @@ def __init__(self, centers, sizes, dtype = None):
 
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
+
+        :param max_memory: Maximum size in bytes of the temporary array
+            used to evaluate anisotropic RBFs.
+        :type max_memory: int
         """
         super(RBFExpansionNode, self).__init__(None, None, dtype)
+        self.max_memory = max_memory
         self._init_RBF(centers, sizes)
 
     @staticmethod
@@ -207,9 +224,19 @@ def is_trainable():
     def is_invertible():
         return False
 
+    @staticmethod
+    def is_row_independent():
+        return True
+
     def _init_RBF(self, centers, sizes):
         # initialize the centers of the RBFs
         centers = numx.array(centers, self.dtype)
+        # The distances are computed with matrix products, which cancel
+        # catastrophically for data far from the origin (in particular in
+        # single precision). So the data and the centers are shifted by the
+        # mean of the centers first.
+        self._shift = centers.mean(axis=0)
+        shifted_centers = centers - self._shift
 
         # define input/output dim
         self.set_input_dim(centers.shape[1])
@@ -244,20 +271,52 @@ def _init_RBF(self, centers, sizes):
             for i in range(sizes.shape[0]):
                 sizes[i,:,:] = mdp.utils.inv(sizes[i,:,:])
 
+            # factor the inverse covariances as S^-1 = L L^T and
+            # transform the centers accordingly
+            try:
+                chol = _stacked_linalg.cholesky(sizes)
+            except _stacked_linalg.LinAlgError:
+                msg = "The covariance matrices must be positive definite"
+                raise mdp.NodeException(msg)
+            chol = chol.astype(self.dtype)
+            self._chol_centers = numx.einsum('kd,kde->ke', shifted_centers,
+                                             chol)
+            # stack the factors side by side, so that L_j^T x can be
+            # computed for all centers with a single matrix product
+            n_centers, dim = centers.shape
+            self._chol = chol.transpose(1, 0, 2).reshape(dim, n_centers*dim)
+
         self._centers = centers
+        self._shifted_centers = shifted_centers
         self._sizes = sizes
+        self._centers_sqnorms = numx.einsum('ij,ij->i', shifted_centers,
+                                            shifted_centers)
 
     def _execute(self, x):
-        y = numx.zeros((x.shape[0], self._output_dim), dtype = self.dtype)
-        c, s = self._centers, self._sizes
-        for i in range(self._output_dim):
-            dist = x - c[i,:]
-            if self._isotropic:
-                tmp = old_div((dist**2.).sum(axis=1), s[i])
-            else:
-                tmp = (dist*matmult(dist, s[i,:,:])).sum(axis=1)
-            y[:,i] = numx.exp(-0.5*tmp)
-        return y
+        if self._isotropic:
+            tmp = sqdist(x - self._shift, self._shifted_centers,
+                         self._centers_sqnorms)
+            tmp /= self._sizes
+        else:
+            tmp = self._anisotropic_distances(x)
+        tmp *= -0.5
+        return numx.exp(tmp, out=tmp)
+
+    def _anisotropic_distances(self, x):
+        """Return the Mahalanobis distances between the rows of x and the
+        centers, computed in chunks of rows."""
+        n, dim = x.shape
+        n_centers = self._output_dim
+        itemsize = numx.dtype(self.dtype).itemsize
+        chunk_len = max(1, self.max_memory // (itemsize * n_centers * dim))
+        dist = numx.empty((n, n_centers), dtype=self.dtype)
+        for start in range(0, n, chunk_len):
+            stop = min(start + chunk_len, n)
+            z = mult(x[start:stop] - self._shift, self._chol)
+            z = z.reshape(stop - start, n_centers, dim)
+            z -= self._chol_centers
+            dist[start:stop] = numx.einsum('nke,nke->nk', z, z)
+        return dist
 
 class GrowingNeuralGasExpansionNode(GrowingNeuralGasNode):
     """
@@ -20,6 +20,7 @@
 import mdp
 from mdp import numx, NodeException, TrainingException
 from mdp.utils import (mult, symeig, pinv, SymeigException)
+from mdp.utils.covariance import _symmetric_product
 from mdp.nodes import GeneralExpansionNode
 
 # For Python 2 & 3 compatibility
@@ -652,7 +653,7 @@ def update_unlabeled(self, x, weight=1.0):
         num_samples = x.shape[0]
 
         sum_x = x.sum(axis=0)
-        sum_prod_x = mdp.utils.mult(x.T, x)
+        sum_prod_x = _symmetric_product(x)
         self.add_samples(sum_prod_x, sum_x, num_samples, weight)
 
     def update_regular(self, x, weight=1.0):
@@ -663,7 +664,7 @@ def update_regular(self, x, weight=1.0):
 
         # Update Cov Matrix
         sum_x = x.sum(axis=0)
-        sum_prod_x = mdp.utils.mult(x.T, x)
+        sum_prod_x = _symmetric_product(x)
         self.add_samples(sum_prod_x, sum_x, num_samples, weight)
 
         # Update DCov Matrix
@@ -711,7 +712,7 @@ def update_graph(self, x, node_weights=None, edge_weights=None,
         weighted_x = x * node_weights_column
 
         weighted_sum_x = weighted_x.sum(axis=0)
-        weighted_sum_prod_x = mdp.utils.mult(x.T, weighted_x)
+        weighted_sum_prod_x = _symmetric_product(x, node_weights)
         weighted_num_samples = node_weights.sum()
         self.add_samples(weighted_sum_prod_x, weighted_sum_x,
                          weighted_num_samples, weight=weight)
@@ -726,19 +727,14 @@ def update_graph(self, x, node_weights=None, edge_weights=None,
             self.add_diffs(weighted_sum_prod_diffs, weighted_num_diffs,
                            weight=weight)
         else:
-            num_diffs = len(edge_weights)
-            diffs = numx.zeros((num_diffs, dim))
-            weighted_diffs = numx.zeros((num_diffs, dim))
-            weighted_num_diffs = 0
-            for ii, (i, j) in enumerate(edge_weights.keys()):
-                diff = x[j, :] - x[i, :]
-                diffs[ii] = diff
-                w_ij = edge_weights[(i, j)]
-                weighted_diff = diff * w_ij
-                weighted_diffs[ii] = weighted_diff
-                weighted_num_diffs += w_ij
-
-            weighted_sum_prod_diffs = mdp.utils.mult(diffs.T, weighted_diffs)
+            edges = list(edge_weights.keys())
+            ii = [i for (i, j) in edges]
+            jj = [j for (i, j) in edges]
+            diffs = numx.asarray(x[jj, :] - x[ii, :], dtype='d')
+            w = numx.array([edge_weights[edge] for edge in edges])
+            weighted_num_diffs = w.sum()
+
+            weighted_sum_prod_diffs = _symmetric_product(diffs, w)
             self.add_diffs(weighted_sum_prod_diffs, weighted_num_diffs,
                            weight=weight)
 
@@ -819,7 +815,7 @@ def update_mirroring_sliding_window(self, x, weight=1.0,
 
         # Update Cov Matrix. All samples have same weight
         sum_x = x.sum(axis=0)
-        sum_prod_x = mdp.utils.mult(x.T, x)
+        sum_prod_x = _symmetric_product(x)
         self.add_samples(sum_prod_x, sum_x, num_samples, weight)
 
         # Update DCov Matrix. First mirror the borders
@@ -867,7 +863,7 @@ def update_slow_mirroring_sliding_window(self, x, weight=1.0,
 
         # Update Cov Matrix. All samples have same weight
         sum_x = x.sum(axis=0)
-        sum_prod_x = mdp.utils.mult(x.T, x)
+        sum_prod_x = _symmetric_product(x)
         self.add_samples(sum_prod_x, sum_x, num_samples, weight)
 
         # Update DCov Matrix. window = numx.ones(2*width+1), rectangular window
@@ -899,7 +895,7 @@ def update_slow_truncating_sliding_window(self, x, weight=1.0,
 
         # Update Cov Matrix. All samples have same weight
         sum_x = x.sum(axis=0)
-        sum_prod_x = mdp.utils.mult(x.T, x)
+        sum_prod_x = _symmetric_product(x)
         self.add_samples(sum_prod_x, sum_x, num_samples, weight)
 
         # Update DCov Matrix. window = numx.ones(2*width+1), rectangular window
@@ -1123,7 +1119,7 @@ def update_clustered_homogeneous_block_sizes(self, x, weight=1.0,
         num_blocks = num_samples // block_size
 
         sum_x = x.sum(axis=0)
-        sum_prod_x = mdp.utils.mult(x.T, x)
+        sum_prod_x = _symmetric_product(x)
         self.add_samples(sum_prod_x, sum_x, num_samples, weight)
 
         # DCorrelation Matrix. Compute medias signal
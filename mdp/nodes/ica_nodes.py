@@ -72,6 +72,9 @@ class ICANode(mdp.Cumulator, mdp.Node, ProjectMatrixMixin):
         Wiley.
     """
 
+    # number of rows whitened at once
+    _white_block_len = 4096
+
     def __init__(self, limit = 0.001, telescope = False, verbose = False,
                  whitened = False, white_comp = None, white_parm = None,
                  input_dim = None, dtype = None):
@@ -154,7 +157,7 @@ def _stop_training(self):
                                             dtype=self.dtype,
                                             **self.white_parm)
             white.train(self.data)
-            self.data = white.execute(self.data)
+            self.data = self._whiten_data(white)
             self.white = white
 
         # if output_dim not set, set it now
@@ -180,6 +183,20 @@ def _stop_training(self):
             print("Convergence criterium: ", convergence)
         self.convergence = convergence
 
+    def _whiten_data(self, white):
+        """Whiten the collected data in place, block by block.
+
+        The whitened data overwrites the first columns of 'self.data', so
+        that no second array of the full size is needed.
+        """
+        data = self.data
+        dim = white.output_dim
+        block_len = self._white_block_len
+        for start in range(0, data.shape[0], block_len):
+            block = data[start:start+block_len]
+            block[:, :dim] = white.execute(block)
+        return data[:, :dim]
+
     def core(self, data):
         """This is the core routine of the ICANode.
         
@@ -387,7 +404,7 @@ def __init__(self, approach = 'defl', g = 'pow3', guess = None,
                  max_it = 5000, max_it_fine = 100,
                  failures = 5, coarse_limit=None, limit = 0.001,  verbose = False,
                  whitened = False, white_comp = None, white_parm = None,
-                 input_dim = None, dtype=None):
+                 input_dim = None, dtype=None, block_size=None):
         """Initializes an object of type 'FastICANode'.
         
         :param approach: approach: Approach to use. Possible values are
@@ -466,6 +483,14 @@ def __init__(self, approach = 'defl', g = 'pow3', guess = None,
         
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
+
+        :param block_size: If given, the fixed-point iterations process the
+            data in blocks of this many samples, accumulating the statistics
+            block by block, so that the temporaries have a bounded size
+            regardless of the number of samples. Together with
+            ``set_storage('disk')`` this keeps the memory consumption of the
+            training bounded.
+        :type block_size: int
         """
         super(FastICANode, self).__init__(limit, False, verbose, whitened,
                                           white_comp, white_parm, input_dim,
@@ -501,11 +526,79 @@ def __init__(self, approach = 'defl', g = 'pow3', guess = None,
         self.coarse_limit = coarse_limit
         self.failures = failures
         self.guess = guess
+        self.block_size = block_size
 
-    def _get_rsamples(self, X):
-        tlen = X.shape[1]
-        mask = numx.where(numx_rand.random(tlen) < self.sample_size)[0]
-        return X[:, mask]
+    def _work_array(self, work, name, shape, dtype):
+        """Return an uninitialized array from the 'work' cache.
+
+        The array is reallocated only if it is too small, otherwise a view
+        on the first 'shape[0]' rows is returned.
+        """
+        array = work.get(name)
+        if (array is None or array.dtype != dtype or
+                array.shape[1:] != shape[1:] or array.shape[0] < shape[0]):
+            array = work[name] = numx.empty(shape, dtype=dtype)
+        return array[:shape[0]]
+
+    def _fixed_point_stats(self, data, W, used_g, work):
+        """Compute the sample statistics for one fixed-point iteration.
+
+        With u = x'W and the nonlinearity g selected by 'used_g' return
+        the tuple (A, e, ug, n), where A is the sum of x g(u)', e is the sum
+        of the derivative terms of g, ug the sum of u g(u)' and n the number
+        of samples used (a random subset of 'data' if 'used_g' selects
+        sampling). W can be a matrix (symmetric approach) or a single
+        vector (deflation approach).
+
+        The data is processed in blocks of 'block_size' rows, so that all
+        temporaries are bounded by the block size and taken from 'work'.
+        """
+        kind, variant = divmod(used_g, 10)
+        if kind not in (1, 2, 3, 4) or variant > 3:
+            errstr = 'Nonlinearity not found: %i' % used_g
+            raise mdp.NodeException(errstr)
+        tlen = data.shape[0]
+        block_size = self.block_size or tlen
+        dtype = numx.result_type(data.dtype, W.dtype)
+        A = numx.zeros(W.shape, dtype=dtype)
+        e = numx.zeros(W.shape[1:], dtype=dtype)
+        ug = numx.zeros(W.shape[1:]*2, dtype=dtype)
+        n = 0
+        for start in range(0, tlen, block_size):
+            x = data[start:start+block_size]
+            if variant >= 2:
+                x = x[numx_rand.random(x.shape[0]) < self.sample_size]
+            m = x.shape[0]
+            shape = (m,) + W.shape[1:]
+            u = mult(x, W, out=self._work_array(work, 'u', shape, dtype))
+            g = self._work_array(work, 'g', shape, dtype)
+            if kind == 1:
+                # pow3
+                numx.multiply(u, u, out=g)
+                g *= u
+                e += 3.*m
+            elif kind == 2:
+                # tanh
+                numx.multiply(u, self.fine_tanh, out=g)
+                numx.tanh(g, out=g)
+                e += self.fine_tanh * (m - numx.einsum('i...,i...->...',
+                                                       g, g))
+            elif kind == 3:
+                # gaus
+                u2 = self._work_array(work, 'u2', shape, dtype)
+                numx.multiply(u, u, out=u2)
+                numx.multiply(u2, -0.5*self.fine_gaus, out=g)
+                numx.exp(g, out=g)
+                e += g.sum(axis=0)
+                e -= self.fine_gaus * numx.einsum('i...,i...->...', u2, g)
+                g *= u
+            else:
+                # skew
+                numx.multiply(u, u, out=g)
+            A += mult(x.T, g)
+            ug += mult(u.T, g)
+            n += m
+        return A, e, ug, n
 
     def core(self, data):
         """This is the core routine of a node inheriting from ICANode.
@@ -527,12 +620,11 @@ def core(self, data):
         # I just had no time at the moment to do it.
         # The logic behind the used_g hell is beyond my understanding :-)))
 
-        X = data.T
-
         # casted constants
-        comp = X.shape[0]
-        tlen = X.shape[1]
+        comp = data.shape[1]
         dtype = self.dtype
+        # work arrays for the fixed-point statistics, reused in every round
+        work = {}
 
         # Default values and initial definitions
         fine_tanh = self.fine_tanh
@@ -682,120 +774,12 @@ def core(self, data):
                 # First calculate the independent components (u_i's).
                 # u_i = b_i' x = x' b_i. For all x:s simultaneously this is
                 # non linearity
-                if used_g == 10:
-                    u = mult(X.T, Q)
-                    Q = old_div(mult(X, u*u*u),tlen) - 3.*Q
-                elif used_g == 11:
-                    u = mult(X.T, Q)
-                    Gpow3 = u*u*u
-                    Beta = (u*Gpow3).sum(axis=0)
-                    D = numx.diag((old_div(1,(Beta - 3*tlen))))
-                    Q = Q + mu * mult(Q, mult((mult(u.T, Gpow3) -
-                                               numx.diag(Beta)), D))
-                elif used_g == 12:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Q = old_div(mult(Xsub, u*u*u),Xsub.shape[1]) - 3.*Q
-                elif used_g == 13:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Gpow3 = u*u*u
-                    Beta = (u*Gpow3).sum(axis=0)
-                    D = numx.diag((old_div(1,(Beta - 3*Xsub.shape[1]))))
-                    Q = Q + mu * mult(Q, mult((mult(u.T, Gpow3) -
-                                               numx.diag(Beta)), D))
-                elif used_g == 20:
-                    u = mult(X.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    temp = old_div((1.-tang*tang).sum(axis=0),tlen)
-                    Q = old_div(mult(X, tang),tlen) - temp * Q * fine_tanh
-                elif used_g == 21:
-                    u = mult(X.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    Beta = (u*tang).sum(axis=0)
-                    D = numx.diag(old_div(1,(Beta -
-                                     fine_tanh*(1.-tang*tang).sum(axis=0))))
-                    Q = Q + mu * mult(Q,
-                                 mult((mult(u.T, tang)-
-                                       numx.diag(Beta)), D))
-                elif used_g == 22:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    temp = old_div((1.-tang*tang).sum(axis=0),Xsub.shape[1])
-                    Q = old_div(mult(Xsub, tang),Xsub.shape[1]) - temp * Q * fine_tanh
-                elif used_g == 23:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    tang = numx.tanh(fine_tanh * u)
-                    Beta = (u*tang).sum(axis=0)
-                    D = numx.diag(old_div(1,(Beta -
-                                     fine_tanh*(1.-tang*tang).sum(axis=0))))
-                    Q = Q + mu * mult(Q,
-                                 mult((mult(u.T, tang)-
-                                       numx.diag(Beta)), D))
-                elif used_g == 30:
-                    u = mult(X.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gauss =  u*ex
-                    dgauss = (1. - fine_gaus*u2)*ex
-                    Q = old_div((mult(X, gauss)-dgauss.sum(axis=0)*Q),tlen)
-                elif used_g == 31:
-                    u = mult(X.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gaus =  u*ex
-                    Beta = (u*gaus).sum(axis=0)
-                    D = numx.diag(old_div(1,(Beta -
-                                     ((1-fine_gaus*u2)*ex).sum(axis=0))))
-                    Q = Q + mu * mult(Q,
-                                 mult((mult(u.T, gaus)-
-                                       numx.diag(Beta)), D))
-                elif used_g == 32:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gauss =  u*ex
-                    dgauss = (1. - fine_gaus*u2)*ex
-                    Q = old_div((mult(Xsub, gauss)-dgauss.sum(axis=0)*Q),Xsub.shape[1])
-                elif used_g == 33:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    u2 = u*u
-                    ex = numx.exp(-fine_gaus*u2*0.5)
-                    gaus = u*ex
-                    Beta = (u*gaus).sum(axis=0)
-                    D = numx.diag(old_div(1,(Beta -
-                                     ((1-fine_gaus*u2)*ex).sum(axis=0))))
-                    Q = Q + mu * mult(Q, mult((mult(u.T, gaus)-
-                                               numx.diag(Beta)), D))
-                elif used_g == 40:
-                    u = mult(X.T, Q)
-                    Q = old_div(mult(X, u*u),tlen)
-                elif used_g == 41:
-                    u = mult(X.T, Q)
-                    Gskew = u*u
-                    Beta = (u*Gskew).sum(axis=0)
-                    D = numx.diag(old_div(1,Beta))
-                    Q =  Q + mu * mult(Q, mult((mult(u.T, Gskew)-
-                                                numx.diag(Beta)), D))
-                elif used_g == 42:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Q = old_div(mult(Xsub, u*u),Xsub.shape[1])
-                elif used_g == 43:
-                    Xsub = self._get_rsamples(X)
-                    u = mult(Xsub.T, Q)
-                    Gskew = u*u
-                    Beta = (u*Gskew).sum(axis=0)
-                    D = numx.diag(old_div(1,Beta))
-                    Q =  Q + mu * mult(Q, mult((mult(u.T, Gskew)-
-                                                numx.diag(Beta)), D))
+                A, e, ug, n = self._fixed_point_stats(data, Q, used_g, work)
+                if used_g % 2 == 0:
+                    Q = (A - e*Q)/n
                 else:
-                    errstr = 'Nonlinearity not found: %i' % used_g
-                    raise mdp.NodeException(errstr)
+                    Beta = ug.diagonal()
+                    Q = Q + mu * mult(Q, (ug - numx.diag(Beta))/(Beta - e))
 
             self.convergence = numx.array(convergence)
             self.convergence_fine = numx.array(convergence_fine)
@@ -909,105 +893,12 @@ def core(self, data):
 
                     wOldF = wOld
                     wOld = w
-                    if used_g == 10:
-                        u = mult(X.T, w)
-                        w = old_div(mult(X, u*u*u),tlen) - 3.*w
-                    elif used_g == 11:
-                        u = mult(X.T, w)
-                        EXGpow3 = old_div(mult(X, u*u*u),tlen)
-                        Beta = mult(w.T, EXGpow3)
-                        w = w - mu * (EXGpow3 - Beta*w)/(3-Beta)
-                    elif used_g == 12:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        w = old_div(mult(Xsub, u*u*u),Xsub.shape[1]) - 3.*w
-                    elif used_g == 13:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        EXGpow3 = old_div(mult(Xsub, u*u*u),Xsub.shape[1])
-                        Beta = mult(w.T, EXGpow3)
-                        w = w - mu * (EXGpow3 - Beta*w)/(3-Beta)
-                    elif used_g == 20:
-                        u = mult(X.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        temp = mult((1. - tang*tang).sum(axis=0), w)
-                        w = old_div((mult(X, tang) - fine_tanh*temp),tlen)
-                    elif used_g == 21:
-                        u = mult(X.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        Beta = mult(u.T, tang)
-                        temp = (1. - tang*tang).sum(axis=0)
-                        w = w-mu*(old_div((mult(X, tang)-Beta*w),(fine_tanh*temp-Beta)))
-                    elif used_g == 22:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        temp = mult((1. - tang*tang).sum(axis=0), w)
-                        w = old_div((mult(Xsub, tang) - fine_tanh*temp),Xsub.shape[1])
-                    elif used_g == 23:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        tang = numx.tanh(fine_tanh * u)
-                        Beta = mult(u.T, tang)
-                        w = w - mu * (old_div((mult(Xsub, tang)-Beta*w),
-                                      (fine_tanh*(1. - tang*tang).sum(axis=0) -
-                                       Beta)))
-                    elif used_g == 30:
-                        u = mult(X.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        w = old_div((mult(X, gauss)-mult(dgauss.sum(axis=0), w)),tlen)
-                    elif used_g == 31:
-                        u = mult(X.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        Beta = mult(u.T, gauss)
-                        w = w - mu*(old_div((mult(X, gauss)-Beta*w),
-                                    (dgauss.sum(axis=0)-Beta)))
-                    elif used_g == 32:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        w = old_div((mult(Xsub, gauss)-
-                             mult(dgauss.sum(axis=0), w)),Xsub.shape[1])
-                    elif used_g == 33:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        u2 = u*u
-                        ex = numx.exp(-fine_gaus*u2*0.5)
-                        gauss =  u*ex
-                        dgauss = (1. - fine_gaus *u2)*ex
-                        Beta = mult(u.T, gauss)
-                        w = w - mu*(old_div((mult(Xsub, gauss)-Beta*w),
-                                    (dgauss.sum(axis=0)-Beta)))
-                    elif used_g == 40:
-                        u = mult(X.T, w)
-                        w = old_div(mult(X, u*u),tlen)
-                    elif used_g == 41:
-                        u = mult(X.T, w)
-                        EXGskew = old_div(mult(X, u*u), tlen)
-                        Beta = mult(w.T, EXGskew)
-                        w = w - mu * (EXGskew - mult(Beta, w))/(-Beta)
-                    elif used_g == 42:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        w = old_div(mult(Xsub, u*u),Xsub.shape[1])
-                    elif used_g == 43:
-                        Xsub = self._get_rsamples(X)
-                        u = mult(Xsub.T, w)
-                        EXGskew = old_div(mult(Xsub, u*u), Xsub.shape[1])
-                        Beta = mult(w.T, EXGskew)
-                        w = w - mu * (EXGskew - Beta*w)/(-Beta)
+                    A, e, ug, n = self._fixed_point_stats(data, w, used_g,
+                                                          work)
+                    if used_g % 2 == 0:
+                        w = (A - e*w)/n
                     else:
-                        errstr = 'Nonlinearity not found: %i' % used_g
-                        raise mdp.NodeException(errstr)
+                        w = w - mu*(A - ug*w)/(e - ug)
 
                     # Normalize the new w.
                     w /= utils.norm2(w)
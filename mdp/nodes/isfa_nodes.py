@@ -9,7 +9,7 @@
 import mdp
 from mdp import Node, NodeException, numx, numx_rand
 from mdp.nodes import WhiteningNode
-from mdp.utils import (DelayCovarianceMatrix, MultipleCovarianceMatrices,
+from mdp.utils import (MultiLagCovarianceMatrix, MultipleCovarianceMatrices,
                        rotate, mult)
 
 # Licensed under the BSD License, see Copyright file for details.
@@ -231,7 +231,7 @@ def __init__(self, lags=1, sfa_ica_coeff=(1., 1.), icaweights=None,
                                        dtype=dtype, **white_parm)
 
         # initialize covariance matrices
-        self.covs = [ DelayCovarianceMatrix(dt, dtype=dtype) for dt in lags ]
+        self.covs = MultiLagCovarianceMatrix(lags, dtype=dtype)
 
         # initialize the global rotation-permutation matrix
         # if not set that we'll eventually be an identity matrix
@@ -285,7 +285,7 @@ def _train(self, x):
         if not self.whitened:
             self.white.train(x)
         # update the covariance matrices
-        [self.covs[i].update(x) for i in range(len(self.lags))]
+        self.covs.update(x)
 
     def _execute(self, x):
         # filter through whitening node if needed
@@ -560,8 +560,7 @@ def _fix_covs(self, covs=None):
             else:
                 proj = None
             # fix and whiten the covariance matrices
-            for i in range(len(self.lags)):
-                covs[i], avg, avg_dt, tlen = covs[i].fix(proj)
+            covs, avg, avg_dt, tlen = covs.fix(proj)
 
             # send the matrices to the container class
             covs = MultipleCovarianceMatrices(covs)
@@ -5,13 +5,56 @@
 from past.utils import old_div
 __docformat__ = "restructuredtext en"
 
-from mdp import numx, numx_linalg, Cumulator, TrainingException, MDPWarning
-from mdp.utils import mult, nongeneral_svd, svd, sqrtm, symeig
+from mdp import (numx, numx_linalg, numx_rand, Cumulator, TrainingException,
+                 MDPWarning)
+from mdp.utils import mult, nongeneral_svd, svd, sqrtm, symeig, sqdist
 import warnings as _warnings
+# numpy.linalg works on stacks of matrices, unlike scipy.linalg
+from numpy import linalg as _stacked_linalg
+
+# the weight matrices are sparse if scipy is available
+try:
+    from scipy import sparse as _sparse
+    from scipy.sparse import linalg as _sparse_linalg
+except ImportError:
+    _sparse = None
 
 # some useful functions
 sqrt = numx.sqrt
 
+# maximum number of elements of the distance matrices computed at once
+_MAX_DIST_ELEMENTS = 2**22
+
+
+def _nearest_neighbors(data, queries, k, skip_nearest=False):
+    """Return the indices of the k nearest neighbors in data for every
+    query point, sorted by distance.
+
+    The distances are computed in blocks of query points, so that the
+    full distance matrix is never created. If skip_nearest is True the
+    nearest point is skipped (i.e., the query point itself when the
+    queries are the data points).
+    """
+    n_nbrs = k + 1 if skip_nearest else k
+    n_data = data.shape[0]
+    shift = data.mean(axis=0)
+    shifted = data - shift
+    sqnorms = numx.einsum('ij,ij->i', shifted, shifted)
+    chunk_len = max(1, _MAX_DIST_ELEMENTS // n_data)
+    nbrs = numx.empty((queries.shape[0], n_nbrs), dtype=numx.intp)
+    for start in range(0, queries.shape[0], chunk_len):
+        dist = sqdist(queries[start:start+chunk_len], data, sqnorms, shift)
+        rows = numx.arange(dist.shape[0])[:, numx.newaxis]
+        if n_nbrs < n_data:
+            idx = dist.argpartition(n_nbrs-1, axis=1)[:, :n_nbrs]
+        else:
+            idx = numx.tile(numx.arange(n_data), (dist.shape[0], 1))
+        order = dist[rows, idx].argsort(axis=1, kind='stable')
+        nbrs[start:start+chunk_len] = idx[rows, order]
+    if skip_nearest:
+        return nbrs[:, 1:]
+    return nbrs
+
 # search XXX for locations where future work is needed
 
 #########################################################
@@ -27,6 +70,9 @@ class LLENode(Cumulator):
     :ivar desired_variance: Variance limit used to compute intrinsic
         dimensionality.
 
+    :ivar W: The weight matrix (defined when training finishes), a
+        ``scipy.sparse`` matrix if scipy is available.
+
     Based on the algorithm outlined in *An Introduction to Locally
     Linear Embedding* by L. Saul and S. Roweis, using improvements
     suggested in *Locally Linear Embedding for Classification* by
@@ -136,59 +182,52 @@ def _stop_training(self):
         if learn_outdim:
             Qs, sig2s, nbrss = self._adjust_output_dim()
 
-        # build the weight matrix
-        #XXX future work:
-        #XXX   for faster implementation, W should be a sparse matrix
-        W = numx.zeros((N, N), dtype=self.dtype)
+        # -----------------------------------------------
+        #  find k nearest neighbors
+        # -----------------------------------------------
+        if learn_outdim:
+            Q, nbrs = Qs, nbrss
+        else:
+            nbrs = _nearest_neighbors(M, M, k, skip_nearest=True)
+            M_Mi = M[nbrs] - M[:, numx.newaxis, :]
+            # compute covariance matrices of distances
+            Q = numx.matmul(M_Mi, M_Mi.transpose(0, 2, 1))
 
         if self.verbose:
-            print(' - constructing [%i x %i] weight matrix...' % W.shape)
-
-        for row in range(N):
+            print(' - constructing [%i x %i] weight matrix...' % (N, N))
+
+        # -----------------------------------------------
+        #  compute weight vectors based on neighbors
+        # -----------------------------------------------
+
+        #Covariance matrix may be nearly singular:
+        # add a diagonal correction to prevent numerical errors
+        if auto_reg:
+            # automatic mode: correction is equal to the sum of
+            # the (d_in-d_out) unused variances (as in deRidder &
+            # Duin)
             if learn_outdim:
-                Q = Qs[row, :, :]
-                nbrs = nbrss[row, :]
+                sig2 = sig2s
             else:
-                # -----------------------------------------------
-                #  find k nearest neighbors
-                # -----------------------------------------------
-                M_Mi = M-M[row]
-                nbrs = numx.argsort((M_Mi**2).sum(1))[1:k+1]
-                M_Mi = M_Mi[nbrs]
-                # compute covariance matrix of distances
-                Q = mult(M_Mi, M_Mi.T)
-
-            # -----------------------------------------------
-            #  compute weight vector based on neighbors
-            # -----------------------------------------------
-
-            #Covariance matrix may be nearly singular:
-            # add a diagonal correction to prevent numerical errors
-            if auto_reg:
-                # automatic mode: correction is equal to the sum of
-                # the (d_in-d_out) unused variances (as in deRidder &
-                # Duin)
-                if learn_outdim:
-                    sig2 = sig2s[row, :]
-                else:
-                    sig2 = svd(M_Mi, compute_uv=0)**2
-                r = numx.sum(sig2[self.output_dim:])
-                Q[Q_diag_idx, Q_diag_idx] += r
-            else:
-                # Roweis et al instead use "a correction that
-                #   is small compared to the trace" e.g.:
-                # r = 0.001 * float(Q.trace())
-                # this is equivalent to assuming 0.1% of the variance is unused
-                Q[Q_diag_idx, Q_diag_idx] += r*Q.trace()
-
-            #solve for weight
-            # weight is w such that sum(Q_ij * w_j) = 1 for all i
-            # XXX refcast is due to numpy bug: floats become double
-            w = self._refcast(numx_linalg.solve(Q, numx.ones(k)))
-            w /= w.sum()
-
-            #update row of the weight matrix
-            W[nbrs, row] = w
+                sig2 = _stacked_linalg.svd(M_Mi, compute_uv=False)**2
+            r = numx.sum(sig2[:, self.output_dim:], axis=1)
+            Q[:, Q_diag_idx, Q_diag_idx] += r[:, numx.newaxis]
+        else:
+            # Roweis et al instead use "a correction that
+            #   is small compared to the trace" e.g.:
+            # r = 0.001 * float(Q.trace())
+            # this is equivalent to assuming 0.1% of the variance is unused
+            Q[:, Q_diag_idx, Q_diag_idx] += \
+                r * numx.trace(Q, axis1=1, axis2=2)[:, numx.newaxis]
+
+        #solve for weights
+        # weight is w such that sum(Q_ij * w_j) = 1 for all i
+        w = _stacked_linalg.solve(Q, numx.ones((N, k, 1)))[:, :, 0]
+        w = self._refcast(w / w.sum(axis=1)[:, numx.newaxis])
+
+        # W[nbrs[row], row] = w[row]
+        W = self._weight_matrix(w.ravel(), nbrs.ravel(),
+                                numx.repeat(W_diag_idx, k), (N, N))
 
         if self.verbose:
             msg = (' - finding [%i x %i] null space of weight matrix\n'
@@ -198,25 +237,60 @@ def _stop_training(self):
         self.W = W.copy()
         #to find the null space, we need the bottom d+1
         #  eigenvectors of (W-I).T*(W-I)
-        #Compute this using the svd of (W-I):
-        W[W_diag_idx, W_diag_idx] -= 1.
-
-        #XXX future work:
-        #XXX  use of upcoming ARPACK interface for bottom few eigenvectors
-        #XXX   of a sparse matrix will significantly increase the speed
-        #XXX   of the next step
+        if _sparse is not None:
+            W = W - _sparse.identity(N, dtype=W.dtype, format='csr')
+        else:
+            W[W_diag_idx, W_diag_idx] -= 1.
+        # the regularization does not change the eigenvectors
+        self.training_projection = self._null_space(W, 0.1)
+
+    def _weight_matrix(self, values, rows, cols, shape):
+        """Return the weight matrix with the given entries, as a sparse
+        matrix if scipy is available."""
+        if _sparse is not None:
+            return _sparse.csr_matrix((values, (rows, cols)), shape=shape,
+                                      dtype=self.dtype)
+        W = numx.zeros(shape, dtype=self.dtype)
+        W[rows, cols] = values
+        return W
+
+    def _null_space(self, W, reg):
+        """Return the eigenvectors 2 to output_dim+1 (sorted by increasing
+        eigenvalues) of W*W.T.
+
+        For the dense eigenvalue problem reg is added to the diagonal of
+        W*W.T, which does not change the eigenvectors, but makes the matrix
+        non-singular. For sparse matrices it sets the (negative) shift used
+        by ARPACK.
+        """
+        N = W.shape[0]
+        d_out = self.output_dim
+        is_sparse = _sparse is not None and _sparse.issparse(W)
         if self.svd:
-            sig, U = nongeneral_svd(W.T, range=(2, self.output_dim+1))
+            if is_sparse:
+                W = W.toarray()
+            sig, U = nongeneral_svd(W.T, range=(2, d_out+1))
+        elif is_sparse and d_out + 2 < N:
+            # find the smallest eigenvalues with ARPACK in shift-invert
+            # mode; W*W.T is singular, so the shift is slightly below
+            # zero (shifting by -reg would not separate the small
+            # eigenvalues well enough for ARPACK to converge)
+            WW = W.dot(W.T).tocsc()
+            v0 = numx_rand.uniform(0.5, 1.5, N)
+            sig, U = _sparse_linalg.eigsh(WW, k=d_out+1, sigma=-1e-6*reg,
+                                          v0=v0)
+            U = self._refcast(U[:, sig.argsort()[1:]])
         else:
-            # the following code does the same computation, but uses
-            # symeig, which computes only the required eigenvectors, and
-            # is much faster. However, it could also be more unstable...
+            # symeig computes only the required eigenvectors, and
+            # is much faster than the svd. However, it could also be more
+            # unstable...
+            if is_sparse:
+                W = W.toarray()
             WW = mult(W, W.T)
-            # regularizes the eigenvalues, does not change the eigenvectors:
-            WW[W_diag_idx, W_diag_idx] += 0.1
-            sig, U = symeig(WW, range=(2, self.output_dim+1), overwrite=True)
-
-        self.training_projection = U
+            W_diag_idx = numx.arange(N)
+            WW[W_diag_idx, W_diag_idx] += reg
+            sig, U = symeig(WW, range=(2, d_out+1), overwrite=True)
+        return U
 
     def _adjust_output_dim(self):
         """This function is called if we need to compute the number of
@@ -232,46 +306,39 @@ def _adjust_output_dim(self):
         k = self.k
         N, d_in = M.shape
 
-        m_est_array = []
-        Qs = numx.zeros((N, k, k))
-        sig2s = numx.zeros((N, d_in))
-        nbrss = numx.zeros((N, k), dtype='i')
-
-        for row in range(N):
-            #-----------------------------------------------
-            #  find k nearest neighbors
-            #-----------------------------------------------
-            M_Mi = M-M[row]
-            nbrs = numx.argsort((M_Mi**2).sum(1))[1:k+1]
-            M_Mi = M_Mi[nbrs]
-            # compute covariance matrix of distances
-            Qs[row, :, :] = mult(M_Mi, M_Mi.T)
-            nbrss[row, :] = nbrs
+        #-----------------------------------------------
+        #  find k nearest neighbors
+        #-----------------------------------------------
+        nbrss = _nearest_neighbors(M, M, k, skip_nearest=True)
+        M_Mi = M[nbrss] - M[:, numx.newaxis, :]
+        # compute covariance matrices of distances
+        Qs = numx.matmul(M_Mi, M_Mi.transpose(0, 2, 1))
 
-            #-----------------------------------------------
-            # singular values of M_Mi give the variance:
-            #   use this to compute intrinsic dimensionality
-            #   at this point
-            #-----------------------------------------------
-            sig2 = (svd(M_Mi, compute_uv=0))**2
-            sig2s[row, :sig2.shape[0]] = sig2
+        #-----------------------------------------------
+        # singular values of M_Mi give the variance:
+        #   use this to compute intrinsic dimensionality
+        #   at this point
+        #-----------------------------------------------
+        sig2 = _stacked_linalg.svd(M_Mi, compute_uv=False)**2
+        sig2s = numx.zeros((N, d_in))
+        sig2s[:, :sig2.shape[1]] = sig2
 
-            #-----------------------------------------------
-            # use sig2 to compute intrinsic dimensionality of the
-            #   data at this neighborhood.  The dimensionality is the
-            #   number of eigenvalues needed to sum to the total
-            #   desired variance
-            #-----------------------------------------------
-            sig2 /= sig2.sum()
-            S = sig2.cumsum()
-            m_est = S.searchsorted(self.desired_variance)
-            if m_est > 0:
-                m_est += old_div((self.desired_variance-S[m_est-1]),sig2[m_est])
-            else:
-                m_est = old_div(self.desired_variance,sig2[m_est])
-            m_est_array.append(m_est)
+        #-----------------------------------------------
+        # use sig2 to compute intrinsic dimensionality of the
+        #   data at each neighborhood.  The dimensionality is the
+        #   number of eigenvalues needed to sum to the total
+        #   desired variance
+        #-----------------------------------------------
+        sig2 /= sig2.sum(axis=1)[:, numx.newaxis]
+        S = sig2.cumsum(axis=1)
+        rows = numx.arange(N)
+        # same as S[row].searchsorted(self.desired_variance) for every row
+        m_est = numx.minimum((S < self.desired_variance).sum(axis=1),
+                             S.shape[1] - 1)
+        S_prev = numx.where(m_est > 0, S[rows, m_est-1], 0.)
+        m_est_array = m_est + old_div(self.desired_variance - S_prev,
+                                      sig2[rows, m_est])
 
-        m_est_array = numx.asarray(m_est_array)
         self.output_dim = int( numx.ceil( numx.median(m_est_array) ) )
         if self.verbose:
             msg = ('      output_dim = %i'
@@ -286,36 +353,30 @@ def _execute(self, x):
         # similar algorithm to that within self.stop_training()
         #  refer there for notes & comments on code
         #----------------------------------------------------
-        N = self.data.shape[0]
-        Nx = x.shape[0]
-        W = numx.zeros((Nx, N), dtype=self.dtype)
-
         k, r = self.k, self.r
         d_out = self.output_dim
         Q_diag_idx = numx.arange(k)
 
-        for row in range(Nx):
-            #find nearest neighbors of x in M
-            M_xi = self.data-x[row]
-            nbrs = numx.argsort( (M_xi**2).sum(1) )[:k]
-            M_xi = M_xi[nbrs]
-
-            #find corrected covariance matrix Q
-            Q = mult(M_xi, M_xi.T)
-            if r is None and k > d_out:
-                sig2 = (svd(M_xi, compute_uv=0))**2
-                r = numx.sum(sig2[d_out:])
-                Q[Q_diag_idx, Q_diag_idx] += r
-            if r is not None:
-                Q[Q_diag_idx, Q_diag_idx] += r
-
-            #solve for weights
-            w = self._refcast(numx_linalg.solve(Q , numx.ones(k)))
-            w /= w.sum()
-            W[row, nbrs] = w
+        #find nearest neighbors of x in M
+        nbrs = _nearest_neighbors(self.data, x, k)
+        M_xi = self.data[nbrs] - x[:, numx.newaxis, :]
+
+        #find corrected covariance matrix Q
+        Q = numx.matmul(M_xi, M_xi.transpose(0, 2, 1))
+        if r is None:
+            if k > d_out:
+                sig2 = _stacked_linalg.svd(M_xi, compute_uv=False)**2
+                Q[:, Q_diag_idx, Q_diag_idx] += \
+                    numx.sum(sig2[:, d_out:], axis=1)[:, numx.newaxis]
+        else:
+            Q[:, Q_diag_idx, Q_diag_idx] += r
+
+        #solve for weights
+        w = _stacked_linalg.solve(Q, numx.ones((x.shape[0], k, 1)))[:, :, 0]
+        w = self._refcast(w / w.sum(axis=1)[:, numx.newaxis])
 
         #multiply weights by result of SVD from training
-        return numx.dot(W, self.training_projection)
+        return numx.einsum('ij,ijk->ik', w, self.training_projection[nbrs])
 
     @staticmethod
     def is_trainable():
@@ -462,36 +523,33 @@ def _stop_training(self):
                    % (k, 1+d_out+dp))
             _warnings.warn(wrn, MDPWarning)
 
-        #build the weight matrix
-        #XXX   for faster implementation, W should be a sparse matrix
-        W = numx.zeros((N, dp*N), dtype=self.dtype)
+        # -----------------------------------------------
+        #  find k nearest neighbors
+        # -----------------------------------------------
+        if not learn_outdim:
+            nbrss = _nearest_neighbors(M, M, k, skip_nearest=True)
 
-        if self.verbose:
-            print(' - constructing [%i x %i] weight matrix...' % W.shape)
+        #-----------------------------------------------
+        #  center the neighborhoods using the mean
+        #-----------------------------------------------
+        nbrhds = M[nbrss] # this makes a copy
+        nbrhds -= nbrhds.mean(axis=1)[:, numx.newaxis, :]
 
-        for row in range(N):
-            if learn_outdim:
-                nbrs = nbrss[row, :]
-            else:
-                # -----------------------------------------------
-                #  find k nearest neighbors
-                # -----------------------------------------------
-                M_Mi = M-M[row]
-                nbrs = numx.argsort((M_Mi**2).sum(1))[1:k+1]
+        #-----------------------------------------------
+        #  compute local coordinates
+        #   using a singular value decomposition
+        #-----------------------------------------------
+        U = _stacked_linalg.svd(nbrhds, compute_uv=True)[0]
+        nbrhds = self._refcast(U[:, :, :d_out].transpose(0, 2, 1))
+        del U
 
-            #-----------------------------------------------
-            #  center the neighborhood using the mean
-            #-----------------------------------------------
-            nbrhd = M[nbrs] # this makes a copy
-            nbrhd -= nbrhd.mean(0)
+        if self.verbose:
+            print(' - constructing [%i x %i] weight matrix...' % (N, dp*N))
 
-            #-----------------------------------------------
-            #  compute local coordinates
-            #   using a singular value decomposition
-            #-----------------------------------------------
-            U, sig, VT = svd(nbrhd)
-            nbrhd = U.T[:d_out]
-            del VT
+        # weights[row] are the weights of the neighbors nbrss[row]
+        weights = numx.empty((N, k, dp), dtype=self.dtype)
+        for row in range(N):
+            nbrhd = nbrhds[row]
 
             #-----------------------------------------------
             #  build Hessian estimator
@@ -520,14 +578,20 @@ def _stop_training(self):
             #if S[i] is too small, set it equal to 1.0
             # this prevents weights from blowing up
             S[numx.where(numx.absolute(S)<1E-4)] = 1.0
-            #print w.shape, S.shape, (w/S).shape
-            #print W[nbrs, row*dp:(row+1)*dp].shape
-            W[nbrs, row*dp:(row+1)*dp] = old_div(w, S)
+            weights[row] = old_div(w, S)
+
+        # W[nbrss[row], row*dp:(row+1)*dp] = weights[row]
+        cols = numx.arange(N*dp).reshape(N, 1, dp)
+        W = self._weight_matrix(
+                        weights.ravel(),
+                        numx.repeat(nbrss.ravel(), dp),
+                        numx.broadcast_to(cols, weights.shape).ravel(),
+                        (N, dp*N))
+        del weights
 
         #-----------------------------------------------
         # To find the null space, we want the
         #  first d+1 eigenvectors of W.T*W
-        # Compute this using an svd of W
         #-----------------------------------------------
 
         if self.verbose:
@@ -535,22 +599,8 @@ def _stop_training(self):
                    'null space of weight matrix...' % (d_out, N))
             print(msg)
 
-        #XXX future work:
-        #XXX  use of upcoming ARPACK interface for bottom few eigenvectors
-        #XXX   of a sparse matrix will significantly increase the speed
-        #XXX   of the next step
-
-        if self.svd:
-            sig, U = nongeneral_svd(W.T, range=(2, d_out+1))
-            Y = U*numx.sqrt(N)
-        else:
-            WW = mult(W, W.T)
-            # regularizes the eigenvalues, does not change the eigenvectors:
-            W_diag_idx = numx.arange(N)
-            WW[W_diag_idx, W_diag_idx] += 0.01
-            sig, U = symeig(WW, range=(2, self.output_dim+1), overwrite=True)
-            Y = U*numx.sqrt(N)
-            del WW
+        # the regularization does not change the eigenvectors
+        Y = self._null_space(W, 0.01) * numx.sqrt(N)
         del W
 
         #-----------------------------------------------
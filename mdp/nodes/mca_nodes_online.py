@@ -133,6 +133,42 @@ def _train(self, x):
             if self.normalize:
                 self.v[:, j:j + 1] = old_div(v, self.d[j])
 
+    def _train_block(self, x):
+        """Update the minor components with a block of samples.
+
+        Gives the same result as updating the components sample by sample
+        with `_train`. The rank one matrix ``c`` of `_train` and its
+        updates are never formed, they are applied as matrix-vector
+        products instead.
+        """
+        dot = mdp.numx.dot
+        sqrt = mdp.numx.sqrt
+        eps, gamma, normalize = self.eps, self.gamma, self.normalize
+        # work on the transposed (row) vectors, so that they are contiguous
+        vt = self.v.T.copy()
+        d = self.d
+        # normalized components of the current sample, these are the
+        # vectors added to c in _train
+        u = mdp.numx.empty_like(vt)
+        for xi in x:
+            for j in range(self.output_dim):
+                v = vt[j]
+                n = eps / (1 + j * 1.2)
+                a = dot(xi, v) * xi
+                if j > 0:
+                    a += gamma * dot(dot(u[:j], v), u[:j])
+                if normalize:
+                    v = (1.5 - n) * v - n * a
+                else:
+                    v = (1.5 - n * (d[j] ** 2)) * v - n * a
+                d[j] = sqrt(dot(v, v))
+                u[j] = v / d[j]
+                if normalize:
+                    vt[j] = u[j]
+                else:
+                    vt[j] = v
+        self.v[:] = vt.T
+
     def get_projmatrix(self, transposed=1):
         """Return the projection matrix.
         
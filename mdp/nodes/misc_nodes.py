@@ -35,12 +35,117 @@ def _get_supported_dtypes(self):
     def is_trainable():
         return False
 
+    @staticmethod
+    def is_row_independent():
+        return True
+
+    def _get_affine_map(self):
+        if self.input_dim is None:
+            return None
+        return (numx.eye(self.input_dim, dtype=self.dtype),
+                numx.zeros(self.input_dim, dtype=self.dtype))
+
+    def _get_index_map(self):
+        if self.input_dim is None:
+            return None
+        return numx.arange(self.input_dim)
+
+
+class AffineNode(Node):
+    """Execute the fixed affine map ``x -> mult(x, W) + b``.
+
+    The node is not trainable. It is typically created by
+    `Flow.fuse_affine_nodes` to replace a sequence of trained affine nodes
+    (e.g. `PCANode`, `SFANode`), which are then executed with a single
+    matrix product. If these nodes are given, they are used for the
+    inverse, which is available if all of them are invertible.
+
+    **Instance variables of interest**
+
+      ``self.W``
+         The matrix, with shape ``(input_dim, output_dim)``.
+
+      ``self.b``
+         The offset, with shape ``(output_dim,)``.
+
+      ``self.nodes``
+         The nodes represented by the affine map, or None.
+    """
+
+    def __init__(self, W, b=None, nodes=None, dtype=None):
+        """Initialize an object of type 'AffineNode'.
+
+        :param W: The matrix, with shape ``(input_dim, output_dim)``.
+        :type W: numpy.ndarray
+
+        :param b: The offset, with shape ``(output_dim,)``. If None, the
+            map is linear.
+        :type b: numpy.ndarray
+
+        :param nodes: The sequence of nodes represented by the affine map,
+            used for the inverse.
+        :type nodes: list
+
+        :param dtype: The datatype of the input. If None, the dtype of 'W'
+            is used.
+        :type dtype: numpy.dtype or str
+        """
+        if dtype is None:
+            dtype = W.dtype
+        super(AffineNode, self).__init__(input_dim=W.shape[0],
+                                         output_dim=W.shape[1],
+                                         dtype=dtype)
+        self.W = W.astype(self.dtype)
+        if b is None:
+            b = numx.zeros(self.output_dim, dtype=self.dtype)
+        self.b = numx.ravel(b).astype(self.dtype)
+        if nodes is not None:
+            nodes = list(nodes)
+        self.nodes = nodes
+
+    def _get_supported_dtypes(self):
+        """Return the data types supported by this node.
+
+        :return: The list of numpy.dtypes that this node supports.
+        :rtype: list
+        """
+        return mdp.utils.get_dtypes('Float') + mdp.utils.get_dtypes('Complex')
+
+    @staticmethod
+    def is_trainable():
+        return False
+
+    def is_invertible(self):
+        return (self.nodes is not None and
+                all(node.is_invertible() for node in self.nodes))
+
+    @staticmethod
+    def is_row_independent():
+        return True
+
+    def _execute(self, x):
+        y = mdp.utils.mult(x, self.W)
+        y += self.b
+        return y
+
+    def _inverse(self, y):
+        for node in reversed(self.nodes):
+            y = node.inverse(y)
+        return y
+
+    def _get_affine_map(self):
+        return self.W, self.b
+
+
 class OneDimensionalHitParade(object):
     """
     Class to produce hit-parades (i.e., a list of the locally largest
     and smallest values) out of a one-dimensional time-series.
     """
-    
+
+    # number of samples that are screened at once in update
+    _block_len = 1024
+
     def __init__(self, n, d, real_dtype="d", integer_dtype="l"):
         """Initializes an object of type 'OneDimensionalHitParade'.
         
@@ -88,39 +193,51 @@ def update(self, inp):
         :type inp: tuple
         """
         (x, ix) = inp
-        rows = len(x)
+        self.lM = self._update_hits(x, ix, self.M, self.iM, self.lM, True)
+        self.lm = self._update_hits(x, ix, self.m, self.im, self.lm, False)
+
+    def _update_hits(self, x, ix, H, iH, l, maxima):
+        """Update the hits H with indices iH and last hit l in place,
+        and return the new last hit.
+
+        A sample can only change the hits if it beats the worst hit, and
+        the worst hit never gets worse. The samples of each block that do
+        not beat the worst hit at the beginning of the block are therefore
+        discarded at once, and only the remaining candidates are processed
+        one by one.
+        """
         d = self.d
-        M = self.M
-        m = self.m
-        iM = self.iM
-        im = self.im
-        lM = self.lM
-        lm = self.lm
-        for i in range(rows):
-            k1 = M.argmin()
-            k2 = m.argmax()
-            if x[i] > M[k1]:
-                if ix[i]-iM[lM] <= d and x[i] > M[lM]:
-                    M[lM] = x[i]
-                    iM[lM] = ix[i]
-                elif ix[i]-iM[lM] > d:
-                    M[k1] = x[i]
-                    iM[k1] = ix[i]
-                    lM = k1
-            if x[i] < m[k2]:
-                if ix[i]-im[lm] <= d and x[i] < m[lm]:
-                    m[lm] = x[i]
-                    im[lm] = ix[i]
-                elif ix[i]-im[lm] > d:
-                    m[k2] = x[i]
-                    im[k2] = ix[i]
-                    lm = k2
-        self.M = M
-        self.m = m
-        self.iM = iM
-        self.im = im
-        self.lM = lM
-        self.lm = lm
+        if maxima:
+            worst, beats = H.argmin, numx.greater
+        else:
+            worst, beats = H.argmax, numx.less
+        block_len = self._block_len
+        for start in range(0, len(x), block_len):
+            xb = x[start:start+block_len]
+            candidates = beats(xb, H[worst()]).nonzero()[0]
+            if not len(candidates):
+                continue
+            ixb = ix[start:start+block_len]
+            for xi, ixi in zip(xb[candidates].tolist(),
+                               ixb[candidates].tolist()):
+                k = worst()
+                if maxima:
+                    if not xi > H[k]:
+                        continue
+                    better_than_last = xi > H[l]
+                else:
+                    if not xi < H[k]:
+                        continue
+                    better_than_last = xi < H[l]
+                if ixi-iH[l] <= d:
+                    if better_than_last:
+                        H[l] = xi
+                        iH[l] = ixi
+                else:
+                    H[k] = xi
+                    iH[k] = ixi
+                    l = k
+        return l
 
     def get_maxima(self):
         """
@@ -258,6 +375,23 @@ def get_minima(self):
             m[:, c], im[:, c] = hit[c].get_minima()
         return m, im
 
+def _time_frames_view(x, time_frames, gap):
+    """Return a view of the time frames in the C-contiguous array 'x'.
+
+    The view has shape ``(rows, time_frames, dim)`` and its element
+    ``[t, i]`` is the row ``x[t + i*gap]``.
+    """
+    rows = x.shape[0] - (time_frames-1)*gap
+    if rows <= 0:
+        return numx.zeros((0, time_frames, x.shape[1]), dtype=x.dtype)
+    row_stride = x.shape[1]*x.itemsize
+    # same as numpy's as_strided or sliding_window_view, but without their
+    # overhead, which dominates for the small chunks of a data stream
+    return numx.ndarray((rows, time_frames, x.shape[1]), dtype=x.dtype,
+                        buffer=x,
+                        strides=(row_stride, gap*row_stride, x.itemsize))
+
+
 class TimeFramesNode(Node):
     """Copy delayed version of the input signal on the space dimensions.
 
@@ -276,10 +410,18 @@ class TimeFramesNode(Node):
     It is not always possible to invert this transformation (the
     transformation is not surjective. However, the ``pseudo_inverse``
     method does the correct thing when it is indeed possible.
+
+    By default each call to ``execute`` is independent, so that the last
+    ``(time_frames-1)*gap`` rows of each chunk are lost. In streaming mode
+    the node keeps these rows and prepends them to the next chunk, so that
+    the concatenated output of consecutive calls equals the output for the
+    whole data at once. Note that the first calls return fewer rows (or
+    none) until ``(time_frames-1)*gap + 1`` rows have been received. Use
+    ``reset`` to start with a new time series.
     """
 
     def __init__(self, time_frames, gap=1,
-                 input_dim=None, dtype=None):
+                 input_dim=None, dtype=None, streaming=False, view=False):
         """Initializes an object of type 'TimeFramesNode'.
         
         :param time_frames: Number of delayed copies.
@@ -293,12 +435,26 @@ def __init__(self, time_frames, gap=1,
 
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
+
+        :param streaming: If True, the input of consecutive calls is
+            treated as one time series (see above).
+        :type streaming: bool
+
+        :param view: If True, the output is a read-only view of the input
+            whenever possible (i.e., for ``gap=1`` and contiguous input),
+            which saves memory when the output is only read, e.g. by the
+            next node in a flow. Otherwise a new array is returned.
+        :type view: bool
         """
         self.time_frames = time_frames
         super(TimeFramesNode, self).__init__(input_dim=input_dim,
                                              output_dim=None,
                                              dtype=dtype)
         self.gap = gap
+        self.streaming = streaming
+        self.view = view
+        # rows kept from the previous call in streaming mode
+        self._tail = None
 
     def _get_supported_dtypes(self):
         """Return the data types supported by this node.
@@ -326,14 +482,36 @@ def _set_output_dim(self, n):
         msg = 'Output dim can not be explicitly set!'
         raise NodeException(msg)
 
+    def reset(self):
+        """Forget the rows kept from the previous calls in streaming mode."""
+        self._tail = None
+
+    def _get_initial_tail(self):
+        # rows preceding the time series
+        return None
+
+    def _get_frames(self, x):
+        return _time_frames_view(x, self.time_frames, self.gap)
+
     def _execute(self, x):
-        gap = self.gap
-        tf = x.shape[0] - (self.time_frames-1)*gap
-        rows = self.input_dim
-        cols = self.output_dim
-        y = numx.zeros((tf, cols), dtype=self.dtype)
-        for frame in range(self.time_frames):
-            y[:, frame*rows:(frame+1)*rows] = x[gap*frame:gap*frame+tf, :]
+        tail = self._tail if self.streaming else None
+        if tail is None:
+            tail = self._get_initial_tail()
+        if tail is not None and tail.shape[0]:
+            data = numx.concatenate((tail, x))
+        else:
+            data = numx.ascontiguousarray(x)
+        if self.streaming:
+            rest = (self.time_frames-1)*self.gap
+            self._tail = data[max(data.shape[0]-rest, 0):].copy()
+        frames = self._get_frames(data)
+        # this is a copy, unless the frames are contiguous in the input
+        y = frames.reshape(frames.shape[0], self.output_dim)
+        if numx.may_share_memory(y, x):
+            if self.view:
+                y.flags.writeable = False
+            else:
+                y = y.copy()
         return y
 
     def pseudo_inverse(self, y):
@@ -400,14 +578,17 @@ class TimeDelayNode(TimeFramesNode):
     This node provides similar functionality as the ``TimeFramesNode``, only
     that it performs a time embedding into the past rather than into the future.
 
-    See ``TimeDelaySlidingWindowNode`` for a sliding window delay node for
-    application in a non-batch manner.
+    In streaming mode (see ``TimeFramesNode``) the output has one row for
+    each input row, and the rows of the previous calls are used instead of
+    the zeros.
+    See also ``TimeDelaySlidingWindowNode``.
 
     Original code contributed by Sebastian Hoefer.
     Dec 31, 2010
     """
 
-    def __init__(self, time_frames, gap=1, input_dim=None, dtype=None):
+    def __init__(self, time_frames, gap=1, input_dim=None, dtype=None,
+                 streaming=False):
         """Initializes an object of type 'TimeDelayNode'.
 
         :param time_frames: Number of delayed copies.
@@ -421,22 +602,22 @@ def __init__(self, time_frames, gap=1, input_dim=None, dtype=None):
 
         :param dtype: The datatype.
         :type dtype: numpy.dtype 
+
+        :param streaming: If True, the input of consecutive calls is
+            treated as one time series.
+        :type streaming: bool
         """
         super(TimeDelayNode, self).__init__(time_frames, gap,
-                                            input_dim, dtype)
+                                            input_dim, dtype,
+                                            streaming=streaming)
 
-    def _execute(self, x):
-        gap = self.gap
-        rows = x.shape[0]
-        cols = self.output_dim
-        n = self.input_dim
+    def _get_initial_tail(self):
+        return numx.zeros(((self.time_frames-1)*self.gap, self.input_dim),
+                          dtype=self.dtype)
 
-        y = numx.zeros((rows, cols), dtype=self.dtype)
-
-        for frame in range(self.time_frames):
-            y[gap*frame:, frame*n:(frame+1)*n] = x[:rows-gap*frame, :]
-
-        return y
+    def _get_frames(self, x):
+        # the delayed copies come last
+        return _time_frames_view(x, self.time_frames, self.gap)[:, ::-1]
 
     def pseudo_inverse(self, y):
         """
@@ -450,11 +631,14 @@ class TimeDelaySlidingWindowNode(TimeDelayNode):
     ``TimeDelaySlidingWindowNode`` is an alternative to ``TimeDelayNode``
     which should be used for online learning/execution. Whereas the
     ``TimeDelayNode`` works in a batch manner, for online application
-    a sliding window is necessary which yields only one row per call.
+    a sliding window is necessary which keeps the last rows between
+    the calls.
 
     Applied to the same data the collection of all returned rows of the
     ``TimeDelaySlidingWindowNode`` is equivalent to the result of the
-    ``TimeDelayNode``.
+    ``TimeDelayNode``. The data can be given one row at a time or in
+    chunks of any size. This is the same as a ``TimeDelayNode`` in
+    streaming mode.
 
     Original code contributed by Sebastian Hoefer.
     Dec 31, 2010
@@ -474,51 +658,9 @@ def __init__(self, time_frames, gap=1, input_dim=None, dtype=None):
         :param dtype: The datatype.
         :type dtype: numpy.dtype or str
         """
-
-        self.time_frames = time_frames
-        self.gap = gap
         super(TimeDelaySlidingWindowNode, self).__init__(time_frames, gap,
-                                                         input_dim, dtype)
-        self.sliding_wnd = None
-        self.cur_idx = 0
-        self.slide = False
-
-    def _init_sliding_window(self):
-        rows = self.gap+1
-        cols = self.input_dim*self.time_frames
-        self.sliding_wnd = numx.zeros((rows, cols), dtype=self.dtype)
-
-    def _execute(self, x):
-        assert x.shape[0] == 1
-
-        if self.sliding_wnd is None:
-            self._init_sliding_window()
-
-        gap = self.gap
-        rows = self.sliding_wnd.shape[0]
-        cols = self.output_dim
-        n = self.input_dim
-
-        new_row = numx.zeros(cols, dtype=self.dtype)
-        new_row[:n] = x
-
-        # Slide
-        if self.slide:
-            self.sliding_wnd[:-1, :] = self.sliding_wnd[1:, :]
-
-        # Delay
-        if self.cur_idx-gap >= 0:
-            new_row[n:] = self.sliding_wnd[self.cur_idx-gap, :-n]
-
-        # Add new row to matrix
-        self.sliding_wnd[self.cur_idx, :] = new_row
-
-        if self.cur_idx < rows-1:
-            self.cur_idx = self.cur_idx+1 
-        else:
-            self.slide = True
-
-        return new_row[numx.newaxis,:]
+                                                         input_dim, dtype,
+                                                         streaming=True)
 
 class EtaComputerNode(Node):
     """Compute the eta values of the normalized training data.
@@ -818,6 +960,10 @@ def is_trainable():
     def is_invertible():
         return False
 
+    @staticmethod
+    def is_row_independent():
+        return True
+
     def _get_supported_dtypes(self):
         return (mdp.utils.get_dtypes('Float') +
                 mdp.utils.get_dtypes('AllInteger'))
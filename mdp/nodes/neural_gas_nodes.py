@@ -1,5 +1,4 @@
 from __future__ import division
-from builtins import map
 from builtins import range
 from past.utils import old_div
 from builtins import object
@@ -7,6 +6,9 @@
 
 from mdp import numx, numx_rand, utils, graph, Node
 
+# maximal number of elements of the distance matrices computed at once
+_MAX_DIST_ELEMENTS = 2**20
+
 class _NGNodeData(object):
     """Data associated to a node in a Growing Neural Gas graph."""
     def __init__(self, pos, error=0.0, hits=0, label=None):
@@ -54,6 +56,10 @@ class GrowingNeuralGasNode(Node):
     underfitting the data.
 
     :ivar graph: The corresponding `mdp.graph.Graph` object.
+
+    The positions of the graph nodes are stored in a single contiguous
+    array, whose rows follow the order of ``graph.nodes``; the ``pos``
+    attribute of each node data is a view on the corresponding row.
     
     |
     
@@ -125,6 +131,13 @@ def __init__(self, start_poss=None, eps_b=0.2, eps_n=0.006, max_age=50,
 
         self.graph = graph.Graph()
         self.tlen = 0
+        # positions and cumulative errors of the graph nodes, one row
+        # for each node in self.graph.nodes, they are views on the first
+        # rows of the buffers, which have room for more nodes
+        self._positions = None
+        self._errors = None
+        self._position_buffer = None
+        self._error_buffer = None
 
         #copy parameters
         (self.eps_b, self.eps_n, self.max_age, self.lambda_, self.alpha,
@@ -144,36 +157,107 @@ def _set_input_dim(self, n):
         self._input_dim = n
         self.output_dim = n
 
+    def __getstate__(self):
+        # the buffers are rebuilt from the positions and errors
+        state = self.__dict__.copy()
+        state.pop('_position_buffer', None)
+        state.pop('_error_buffer', None)
+        return state
+
+    def __setstate__(self, state):
+        # copying or unpickling the node breaks the link between the
+        # node positions and the position array
+        self.__dict__.update(state)
+        if '_positions' not in state:
+            # pickled by an older version, which stored the positions
+            # and errors only in the graph nodes
+            nodes = self.graph.nodes
+            self._positions = self._errors = None
+            if nodes:
+                self._positions = numx.array([n.data.pos for n in nodes])
+                self._errors = numx.array([n.data.cum_error for n in nodes],
+                                          dtype='d')
+        self._position_buffer = self._positions
+        self._error_buffer = self._errors
+        self._bind_positions()
+
+    def _bind_positions(self):
+        """Make the position of each graph node a view on the
+        corresponding row of the position array."""
+        if self._positions is None:
+            return
+        for node, pos in zip(self.graph.nodes, self._positions):
+            node.data.pos = pos
+
     def _add_node(self, pos):
         node = self.graph.add_node(_NGNodeData(pos))
+        n = 0 if self._positions is None else len(self._positions)
+        reallocated = False
+        if self._positions is None or n == len(self._position_buffer):
+            # double the capacity, so that the rows are only copied
+            # O(log(n)) times while the graph grows
+            capacity = max(2, 2*n)
+            dtype = pos.dtype if self._positions is None \
+                    else self._positions.dtype
+            position_buffer = numx.empty((capacity, len(pos)), dtype=dtype)
+            error_buffer = numx.zeros((capacity,), dtype='d')
+            if n:
+                position_buffer[:n] = self._positions
+                error_buffer[:n] = self._errors
+            self._position_buffer = position_buffer
+            self._error_buffer = error_buffer
+            reallocated = True
+        self._position_buffer[n] = pos
+        self._error_buffer[n] = 0.
+        self._positions = self._position_buffer[:n+1]
+        self._errors = self._error_buffer[:n+1]
+        if reallocated:
+            self._bind_positions()
+        else:
+            node.data.pos = self._positions[n]
         return node
 
+    def _remove_node(self, node):
+        idx = self.graph.nodes.index(node)
+        self.graph.remove_node(node)
+        n = len(self._positions)
+        # move the following rows up, the views stay in the buffer
+        self._positions[idx:-1] = self._positions[idx+1:]
+        self._errors[idx:-1] = self._errors[idx+1:]
+        self._positions = self._position_buffer[:n-1]
+        self._errors = self._error_buffer[:n-1]
+        self._bind_positions()
+
+    def _sync_errors(self):
+        """Copy the cumulative errors to the data of the graph nodes."""
+        for node, error in zip(self.graph.nodes, self._errors):
+            node.data.cum_error = float(error)
+
     def _add_edge(self, from_, to_):
         self.graph.add_edge(from_, to_, _NGEdgeData())
 
+    def _squared_distances(self, x):
+        """Return the squared distances of all graph nodes from x."""
+        diff = self._positions - x
+        return numx.einsum('ij,ij->i', diff, diff)
+
     def _get_nearest_nodes(self, x):
-        """Return the two nodes in the graph that are nearest to x and their
-        squared distances.
+        """Return the indices of the two nodes in the graph that are nearest
+        to x and their squared distances.
+
         :param x: Coordinates of point to compute distance to in order to
             specifiy nearest nodes.
         :type x: numpy.ndarray
         
-        :return: The coordinates of the nearest two nodes and their
-            distances to x. ([node1, node2], [dist1, dist2])
+        :return: The indices in ``graph.nodes`` of the nearest two nodes
+            and their distances to x. ([idx1, idx2], [dist1, dist2])
         :rtype: tuple
         """
-        # distance function
-        def _distance_from_node(node):
-            #return norm(node.data.pos-x)**2
-            tmp = node.data.pos - x
-            return utils.mult(tmp, tmp)
-        g = self.graph
-        # distances of all graph nodes from x
-        distances = numx.array(list(map(_distance_from_node, g.nodes)))
-        ids = distances.argsort()[:2]
-        #nearest = [g.nodes[idx] for idx in ids]
-        #return nearest, distances[ids]
-        return (g.nodes[ids[0]], g.nodes[ids[1]]), distances.take(ids)
+        distances = self._squared_distances(x)
+        # the first element is the smallest one, the second is the
+        # second smallest
+        ids = distances.argpartition(1)[:2]
+        return ids, distances.take(ids)
 
     def _move_node(self, node, x, eps):
         """Move a node by eps in the direction x.
@@ -201,21 +285,22 @@ def _remove_old_edges(self, edges):
             if edge.data.age > max_age:
                 g.remove_edge(edge)
                 if edge.head.degree() == 0:
-                    g.remove_node(edge.head)
+                    self._remove_node(edge.head)
                 if edge.tail.degree() == 0:
-                    g.remove_node(edge.tail)
+                    self._remove_node(edge.tail)
 
     def _insert_new_node(self):
         """Insert a new node in the graph where it is more necessary (i.e.
         where the error is the largest)."""
-        g = self.graph
+        g, errors = self.graph, self._errors
         # determine the node with the highest error
-        errors = [x.data.cum_error for x in g.nodes]
-        qnode = g.nodes[numx.argmax(errors)]
+        q = numx.argmax(errors)
+        qnode = g.nodes[q]
         # determine the neighbour with the highest error
         neighbors = qnode.neighbors()
-        errors = [x.data.cum_error for x in neighbors]
-        fnode = neighbors[numx.argmax(errors)]
+        neighbors_ids = [g.nodes.index(x) for x in neighbors]
+        f = neighbors_ids[numx.argmax(errors.take(neighbors_ids))]
+        fnode = g.nodes[f]
         # new node, halfway between the worst node and the worst of
         # its neighbors
         new_pos = 0.5*(qnode.data.pos + fnode.data.pos)
@@ -225,15 +310,16 @@ def _insert_new_node(self):
         g.remove_edge(edges[0])
         self._add_edge(qnode, new_node)
         self._add_edge(fnode, new_node)
-        # update errors
-        qnode.data.cum_error *= self.alpha
-        fnode.data.cum_error *= self.alpha
-        new_node.data.cum_error = 0.5*(qnode.data.cum_error+
-                                       fnode.data.cum_error)
+        # update errors (the new node is the last one)
+        errors = self._errors
+        errors[q] *= self.alpha
+        errors[f] *= self.alpha
+        errors[-1] = 0.5*(errors[q] + errors[f])
 
     def get_nodes_position(self):
-        return numx.array([n.data.pos for n in self.graph.nodes],
-                          dtype = self.dtype)
+        if self._positions is None:
+            return numx.zeros((0, self.input_dim), dtype=self.dtype)
+        return numx.array(self._positions, dtype=self.dtype)
 
     def _train(self, input):
         g = self.graph
@@ -254,14 +340,15 @@ def _train(self, input):
 
             # step 2 - find the nearest nodes
             # dists are the squared distances of x from n0, n1
-            (n0, n1), dists = self._get_nearest_nodes(x)
+            (i0, i1), dists = self._get_nearest_nodes(x)
+            n0, n1 = g.nodes[i0], g.nodes[i1]
 
             # step 3 - increase age of the emanating edges
             for e in n0.get_edges():
                 e.data.inc_age()
 
             # step 4 - update error
-            n0.data.cum_error += numx.sqrt(dists[0])
+            self._errors[i0] += numx.sqrt(dists[0])
 
             # step 5 - move nearest node and neighbours
             self._move_node(n0, x, self.eps_b)
@@ -286,8 +373,9 @@ def _train(self, input):
                 self._insert_new_node()
 
             # step 9 - decrease errors
-            for node in g.nodes:
-                node.data.cum_error *= d
+            self._errors *= d
+
+        self._sync_errors()
 
     def nearest_neighbor(self, input):
         """Assign each point in the input data to the nearest node in
@@ -306,13 +394,22 @@ def nearest_neighbor(self, input):
         """
         super(GrowingNeuralGasNode, self).execute(input)
 
-        nodes = []
-        dists = []
-        for x in input:
-            (n0, _), dist = self._get_nearest_nodes(x)
-            nodes.append(n0)
-            dists.append(numx.sqrt(dist[0]))
-        return nodes, dists
+        positions = self._positions
+        chunk_len = max(1, _MAX_DIST_ELEMENTS // positions.shape[0])
+        shift = positions.mean(axis=0)
+        shifted = positions - shift
+        pos_sqnorms = numx.einsum('ij,ij->i', shifted, shifted)
+        ids = numx.empty((input.shape[0],), dtype=int)
+        for start in range(0, input.shape[0], chunk_len):
+            chunk = input[start:start+chunk_len]
+            ids[start:start+chunk_len] = utils.sqdist(
+                chunk, positions, pos_sqnorms, shift).argmin(axis=1)
+        # recompute the distances of the nearest nodes without the
+        # round-off errors of the squared norm expansion
+        diff = input - positions[ids]
+        dists = numx.sqrt(numx.einsum('ij,ij->i', diff, diff))
+        nodes = [self.graph.nodes[idx] for idx in ids]
+        return nodes, list(dists)
 
 class NeuralGasNode(GrowingNeuralGasNode):
     """Learn the topological structure of the input data by building a
@@ -423,6 +520,10 @@ def __init__(self, num_nodes = 10,
         """
 
         self.graph = graph.Graph()
+        self._positions = None
+        self._errors = None
+        self._position_buffer = None
+        self._error_buffer = None
 
         if n_epochs_to_train is None:
             n_epochs_to_train = max_epochs
@@ -483,17 +584,19 @@ def _train(self, input):
             lmbda = l_i * ((old_div(l_f,l_i))**denom)
             T = T_i * ((old_div(T_f,T_i))**denom)
             epoch += 1
+            # step sizes of the nodes, in the order of their rank
+            steps = epsilon * numx.exp(old_div(-numx.arange(len(g.nodes)),
+                                               lmbda))
+            positions = self._positions
             for x in di:
                 # Step 1 rank nodes according to their distance to random point
-                ranked_nodes = self._rank_nodes_by_distance(x)
+                ids = self._rank_nodes_by_distance(x)
 
                 # Step 2 move nodes
-                for rank,node in enumerate(ranked_nodes):
-                    #TODO: cut off at some rank when using many nodes
-                    #TODO: check speedup by vectorizing
-                    delta_w = epsilon * numx.exp(old_div(-rank, lmbda)) * \
-                                    (x - node.data.pos)
-                    node.data.pos += delta_w
+                #TODO: cut off at some rank when using many nodes
+                delta_w = x - positions
+                delta_w[ids] *= steps[:, numx.newaxis]
+                positions += delta_w
 
                 # Step 3 update edge weight
                 for e in g.edges:
@@ -501,8 +604,8 @@ def _train(self, input):
 
                 # Step 4 set age of edge between first two nodes to zero
                 #  or create it if it doesn't exist.
-                n0 = ranked_nodes[0]
-                n1 = ranked_nodes[1]
+                n0 = g.nodes[ids[0]]
+                n1 = g.nodes[ids[1]]
                 nn = n0.neighbors()
                 if n1 in nn:
                     edges = n0.get_edges(neighbor=n1)
@@ -517,31 +620,17 @@ def _train(self, input):
 
 
     def _rank_nodes_by_distance(self, x):
-        """Return the nodes in the graph in a list ranked by their squared
-        distance to x.
+        """Return the indices of the nodes in the graph ranked by their
+        squared distance to x.
         
         :param x: Point to compute distance to.
         :type x: numpy.ndarray
         
-        :return: List of nodes ordered by the distance of the node to x.
-        :rtype: list
+        :return: Indices in ``graph.nodes`` ordered by the distance of the
+            node to x.
+        :rtype: numpy.ndarray
         """
-
-        #TODO: Refactor together with GNGNode._get_nearest_nodes
-
-        # distance function
-        def _distance_from_node(node):
-            tmp = node.data.pos - x
-            return utils.mult(tmp, tmp) # maps to mdp.numx.dot
-
-        g = self.graph
-
-        # distances of all graph nodes from x
-        distances = numx.array(list(map(_distance_from_node, g.nodes)))
-        ids = distances.argsort()
-        ranked_nodes = [g.nodes[id] for id in ids]
-
-        return ranked_nodes
+        return self._squared_distances(x).argsort()
 
 
     def _remove_old_edges(self, max_age):
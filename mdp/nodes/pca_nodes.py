@@ -37,7 +37,7 @@ class PCANode(mdp.Node):
 
     def __init__(self, input_dim=None, output_dim=None, dtype=None,
                  svd=False, reduce=False, var_rel=1E-12, var_abs=1E-15,
-                 var_part=None):
+                 var_part=None, compensated=False):
         """Initializes an object of type 'PCANode'.
 
         The number of principal components to be kept can be specified as
@@ -88,6 +88,12 @@ def __init__(self, input_dim=None, output_dim=None, dtype=None,
         :param var_part: Variance relative to total variance threshold.
             Default is None.
         :type var_part: float
+
+        :param compensated: If True the covariance matrix is accumulated
+            with blockwise centering and compensated summation (see
+            *CovarianceMatrix*), e.g. for long trainings in single precision.
+            Default is False.
+        :type compensated: bool
         """
 
         # this must occur *before* calling super!
@@ -103,8 +109,9 @@ def __init__(self, input_dim=None, output_dim=None, dtype=None,
         self.var_rel = var_rel
         self.var_part = var_part
         self.reduce = reduce
+        self.compensated = compensated
         # empirical covariance matrix, updated during the training phase
-        self._cov_mtx = CovarianceMatrix(dtype)
+        self._cov_mtx = CovarianceMatrix(dtype, compensated=compensated)
         # attributes that defined in stop_training
         self.d = None  # eigenvalues
         self.v = None  # eigenvectors, first index for coordinates
@@ -113,6 +120,10 @@ def __init__(self, input_dim=None, output_dim=None, dtype=None,
         self.avg = None
         self.explained_variance = None
 
+    @staticmethod
+    def is_row_independent():
+        return True
+
     def _set_output_dim(self, n):
         if n <= 1 and isinstance(n, float):
             # set the output dim after training, when the variances are known
@@ -343,6 +354,9 @@ def _execute(self, x, n=None):
             return mult(x-self.avg, self.v[:, :n])
         return mult(x-self.avg, self.v)
 
+    def _get_affine_map(self):
+        return self.v, -mult(self.avg, self.v)[0]
+
     def _inverse(self, y, n=None):
         """Project data from the output to the input space using the
         first 'n' components.
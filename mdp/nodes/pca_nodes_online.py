@@ -175,6 +175,48 @@ def _train(self, x):
         self._var_tot = explained_var
         self._reduced_dims = red_j
 
+    def _train_block(self, x):
+        """Update the principal components with a block of samples.
+
+        Gives the same result as updating the components sample by sample
+        with `_train`, but avoids the overhead of the per-sample calls.
+        
+        :param x: Data vectors.
+        :type x: numpy.ndarray
+        """
+        n0 = self.get_current_train_iteration()
+        weights = [self._amnesic(n0 + i + 1) for i in range(x.shape[0])]
+        dot = mdp.numx.dot
+        sqrt = mdp.numx.sqrt
+        # work on the transposed (row) vectors, so that they are contiguous
+        vt = self._v.T.copy()
+        d = self.d
+        var_tot = self._var_tot
+        red_j = self.output_dim
+        for (w1, w2), r in zip(weights, x):
+            red_j = self.output_dim
+            red_j_flag = False
+            explained_var = 0.0
+            for j in range(self.output_dim):
+                v = w1 * vt[j] + (w2 * dot(r, vt[j]) / d[j]) * r
+                d[j] = sqrt(dot(v, v))
+                vn = v / d[j]
+                r = r - dot(r, vn) * vn
+                explained_var += d[j]
+
+                if not red_j_flag:
+                    ratio = explained_var / var_tot
+                    if ratio > self.var_rel:
+                        red_j = j
+                        red_j_flag = True
+
+                vt[j] = v
+            var_tot = explained_var
+        self._v[:] = vt.T
+        self.v = old_div(self._v, d)
+        self._var_tot = var_tot
+        self._reduced_dims = red_j
+
     def get_var_tot(self):
         """Return the  variance that can be
         explained by self._output_dim PCA components.
@@ -290,6 +332,15 @@ def _train(self, x):
         super(CCIPCAWhiteningNode, self)._train(x)
         self.v = old_div(self.v, mdp.numx.sqrt(self.d))
 
+    def _train_block(self, x):
+        """Updates whitening vectors with a block of samples.
+        
+        :param x: Data vectors.
+        :type x: numpy.ndarray
+        """
+        super(CCIPCAWhiteningNode, self)._train_block(x)
+        self.v = old_div(self.v, mdp.numx.sqrt(self.d))
+
     def get_eigenvectors(self):
         """Return the eigenvectors of the covariance matrix.
         
@@ -133,6 +133,11 @@ def _execute(self, x):
             x = self._add_constant(x)
         return mult(x, self.beta)
 
+    def _get_affine_map(self):
+        if self.with_bias:
+            return self.beta[1:], self.beta[0]
+        return self.beta, numx.zeros(self.beta.shape[1], dtype=self.dtype)
+
     def _add_constant(self, x):
         """Add a constant term to the vector 'x'.
         x -> [1 x]
@@ -65,7 +65,8 @@ class SFANode(Node):
     """
 
     def __init__(self, input_dim=None, output_dim=None, dtype=None,
-                 include_last_sample=True, rank_deficit_method='none'):
+                 include_last_sample=True, rank_deficit_method='none',
+                 compensated=False):
         """Initialize an object of type 'SFANode'.
 
         :param input_dim: The input dimensionality.
@@ -154,9 +155,16 @@ def __init__(self, input_dim=None, output_dim=None, dtype=None,
             which would save a potentially time-consuming rerun of all
             ``train()`` calls.
         :type rank_deficit_method: str
+
+        :param compensated: If ``True`` the covariance matrices are
+            accumulated with blockwise centering and compensated summation
+            (see *CovarianceMatrix*), e.g. for long trainings in single
+            precision.
+        :type compensated: bool
         """
         super(SFANode, self).__init__(input_dim, output_dim, dtype)
         self._include_last_sample = include_last_sample
+        self.compensated = compensated
 
         # init two covariance matrices
         self._init_cov()
@@ -176,9 +184,11 @@ def __init__(self, input_dim=None, output_dim=None, dtype=None,
     def _init_cov(self):
         # init two covariance matrices
         # one for the input data
-        self._cov_mtx = CovarianceMatrix(self.dtype)
+        self._cov_mtx = CovarianceMatrix(self.dtype,
+                                         compensated=self.compensated)
         # one for the input data
-        self._dcov_mtx = CovarianceMatrix(self.dtype)
+        self._dcov_mtx = CovarianceMatrix(self.dtype,
+                                          compensated=self.compensated)
 
     def set_rank_deficit_method(self, rank_deficit_method):
         if rank_deficit_method == 'pca':
@@ -338,6 +348,9 @@ def _execute(self, x, n=None):
             bias = self._bias
         return mult(x, sf) - bias
 
+    def _get_affine_map(self):
+        return self.sf, -self._bias
+
     def _inverse(self, y):
         return mult(y, pinv(self.sf)) + self.avg
 
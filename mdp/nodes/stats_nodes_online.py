@@ -63,6 +63,27 @@ def _train(self, x):
 
         self.avg = (1 - alpha) * self.avg + alpha * x
 
+    def _train_block(self, x):
+        """Update the average with a block of samples.
+
+        Gives the same result as updating the average sample by sample.
+        """
+        n0 = self.get_current_train_iteration()
+        if self.avg_n is None:
+            # the simple moving average is the mean of all samples
+            self.avg = ((n0 * self.avg + x.sum(axis=0, keepdims=True)) /
+                        (n0 + x.shape[0]))
+            return
+        alpha = 2.0 / (self.avg_n + 1)
+        if n0 == 0:
+            # the first sample replaces the average
+            self.avg = x[:1]
+            x = x[1:]
+        # weights of the previous average and of the samples
+        decay = (1 - alpha) ** mdp.numx.arange(x.shape[0], -1, -1)
+        self.avg = (decay[0] * self.avg +
+                    alpha * mdp.utils.mult(decay[1:], x)[mdp.numx.newaxis])
+
     def _execute(self, x):
         """Returns a centered input.
         
@@ -177,6 +198,15 @@ def _train(self, x):
         self.x_prev = self.x_cur
         self.x_cur = x[-1:]
 
+    def _train_block(self, x):
+        """Update the buffer with a block of samples, as if they were
+        passed one by one."""
+        if x.shape[0] > 1:
+            self.x_prev = x[-2:-1]
+        else:
+            self.x_prev = self.x_cur
+        self.x_cur = x[-1:]
+
     @staticmethod
     def is_invertible():
         return False
@@ -311,6 +311,15 @@ def _execute(self, x):
         result[:, :-self.L] = src
         return result
 
+    def _get_affine_map(self):
+        in_dim, out_dim, L = self.input_dim, self.output_dim, self.L
+        W = mdp.numx.zeros((in_dim, out_dim), dtype=self.dtype)
+        # the sources are copied, the input signals projected
+        W[in_dim-out_dim:in_dim-L, :out_dim-L] = mdp.numx.eye(out_dim-L)
+        W[in_dim-L:, out_dim-L:] = mdp.numx.eye(L)
+        W[:in_dim-out_dim, out_dim-L:] = -self.proj_mtx
+        return W, mdp.numx.zeros(out_dim, dtype=self.dtype)
+
 class NormalizeNode(mdp.PreserveDimNode):
     """Make input signal meanfree and unit variance."""
     def __init__(self, input_dim=None, output_dim=None, dtype=None):
@@ -37,12 +37,13 @@
 )
 from .parallelflows import (
     _purge_flownode, FlowTaskCallable, FlowTrainCallable, FlowExecuteCallable,
-    TrainResultContainer, ExecuteResultContainer,
+    FlowJoinCallable, TrainResultContainer, ExecuteResultContainer,
     ParallelFlowException, NoTaskException,
     ParallelFlow, ParallelCheckpointFlow
 )
 from .parallelhinet import (
-    ParallelFlowNode, ParallelLayer, ParallelCloneLayer
+    ParallelFlowNode, ParallelLayer, ParallelCloneLayer,
+    ParallelSwitchboardCloneLayer
 )
 
 from mdp import config
@@ -63,10 +64,11 @@
     "ParallelSFANode", "ParallelSFANode", "ParallelFDANode",
     "ParallelHistogramNode",
     "FlowTaskCallable", "FlowTrainCallable", "FlowExecuteCallable",
-    "ExecuteResultContainer", "TrainResultContainer", "ParallelFlowException",
+    "FlowJoinCallable", "ExecuteResultContainer", "TrainResultContainer", "ParallelFlowException",
     "NoTaskException",
     "ParallelFlow", "ParallelCheckpointFlow",
-    "ParallelFlowNode", "ParallelLayer", "ParallelCloneLayer"]
+    "ParallelFlowNode", "ParallelLayer", "ParallelCloneLayer",
+    "ParallelSwitchboardCloneLayer"]
 
 import sys as _sys
 fixup_namespace(__name__, __all__,
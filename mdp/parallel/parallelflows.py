@@ -15,7 +15,8 @@
 
 from .parallelnodes import NotForkableParallelException
 from .scheduling import (
-    TaskCallable, ResultContainer, OrderedResultContainer, Scheduler
+    TaskCallable, ResultContainer, ListResultContainer,
+    OrderedResultContainer, Scheduler
 )
 from mdp.hinet import FlowNode
 
@@ -105,6 +106,21 @@ def fork(self):
                               purge_nodes=self._purge_nodes)
 
 
+class FlowJoinCallable(FlowTaskCallable):
+    """Joins forked flownodes, used for the tree join of training results.
+
+    The data is a list of flownodes returned by training tasks, the others
+    are joined into the first one, which is then returned.
+    """
+
+    def __call__(self, flownodes):
+        """Join the flownodes and return the result."""
+        flownode = flownodes[0]
+        for forked_flownode in flownodes[1:]:
+            flownode.join(forked_flownode)
+        return flownode
+
+
 class TrainResultContainer(ResultContainer):
     """Container for parallel nodes.
 
@@ -267,6 +283,7 @@ def __init__(self, flow, verbose=False, **kwargs):
     def train(self, data_iterables, scheduler=None,
               train_callable_class=None,
               overwrite_result_container=True,
+              tree_join=False,
               **kwargs):
         """Train all trainable nodes in the flow.
 
@@ -297,6 +314,13 @@ def train(self, data_iterables, scheduler=None,
             the result container in the scheduler will be overwritten with an
             instance of NodeResultContainer (unless it is already an instance
             of NodeResultContainer). This improves the memory efficiency.
+        tree_join -- If True then the forked flownodes returned by the
+            training tasks are not joined one by one in this process. Instead
+            they are joined pairwise by FlowJoinCallable tasks on the
+            scheduler, in log2(n) rounds for n training tasks, so that only
+            the final flownode is joined here. The scheduler then uses a
+            ListResultContainer (if overwrite_result_container is True).
+            Default value is False.
         """
         # Warning: If this method is updated you also have to update train
         #          in ParallelCheckpointFlow.
@@ -341,22 +365,21 @@ def train(self, data_iterables, scheduler=None,
                 else:
                     schedulers = None
                 # check that the scheduler is compatible
-                if ((scheduler is not None) and
-                    overwrite_result_container and
-                    (not isinstance(scheduler.result_container,
-                                    TrainResultContainer))):
-                    scheduler.result_container = TrainResultContainer()
+                if overwrite_result_container:
+                    self._set_train_result_container(scheduler, tree_join)
                 ## train all nodes
                 while self.is_parallel_training:
                     while self.task_available:
                         task = self.get_task()
                         scheduler.add_task(*task)
                     results = scheduler.get_results()
-                    if results == []:
+                    if len(results) == 0:
                         err = ("Could not get any training tasks or results "
                                "for the current training phase.")
                         raise Exception(err)
                     else:
+                        if tree_join:
+                            results = self._tree_join(results, scheduler)
                         self.use_results(results)
                     # check if we have to switch to next scheduler
                     if ((schedulers is not None) and
@@ -369,11 +392,9 @@ def train(self, data_iterables, scheduler=None,
                             scheduler = next(schedulers)
                         last_trained_node = self._i_train_node
                         # check that the scheduler is compatible
-                        if ((scheduler is not None) and
-                            overwrite_result_container and
-                            (not isinstance(scheduler.result_container,
-                                            TrainResultContainer))):
-                            scheduler.result_container = TrainResultContainer()
+                        if overwrite_result_container:
+                            self._set_train_result_container(scheduler,
+                                                             tree_join)
             finally:
                 # reset iterable references, which cannot be pickled
                 self._train_data_iterables = None
@@ -381,6 +402,38 @@ def train(self, data_iterables, scheduler=None,
                 if (schedulers is not None) and (scheduler is not None):
                     scheduler.shutdown()
 
+    @staticmethod
+    def _set_train_result_container(scheduler, tree_join=False):
+        """Set the result container of the scheduler for the training.
+
+        For the tree join the results must not be joined in the container.
+        """
+        if scheduler is None:
+            return
+        if tree_join:
+            if type(scheduler.result_container) is not ListResultContainer:
+                scheduler.result_container = ListResultContainer()
+        elif not isinstance(scheduler.result_container,
+                            TrainResultContainer):
+            scheduler.result_container = TrainResultContainer()
+
+    @staticmethod
+    def _tree_join(results, scheduler):
+        """Join the forked flownodes pairwise with tasks on the scheduler.
+
+        Returns a list containing the single joined flownode.
+        """
+        flownodes = list(results)
+        join_callable = FlowJoinCallable()
+        while len(flownodes) > 1:
+            for i in range(0, len(flownodes) - 1, 2):
+                # only the first task contains the callable (caching)
+                scheduler.add_task(flownodes[i:i+2], join_callable)
+                join_callable = None
+            remaining = flownodes[-1:] if len(flownodes) % 2 else []
+            flownodes = list(scheduler.get_results()) + remaining
+        return flownodes
+
     def setup_parallel_training(self, data_iterables,
                                 train_callable_class=FlowTrainCallable):
         """Prepare the flow for handing out tasks to do the training.
@@ -727,6 +780,7 @@ def __init__(self, flow, verbose=False, **kwargs):
     def train(self, data_iterables, checkpoints, scheduler=None,
               train_callable_class=FlowTrainCallable,
               overwrite_result_container=True,
+              tree_join=False,
               **kwargs):
         """Train all trainable nodes in the flow.
 
@@ -738,6 +792,7 @@ def train(self, data_iterables, checkpoints, scheduler=None,
                         scheduler=scheduler,
                         train_callable_class=train_callable_class,
                         overwrite_result_container=overwrite_result_container,
+                        tree_join=tree_join,
                         checkpoints=checkpoints,
                         **kwargs)
 
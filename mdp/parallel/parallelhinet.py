@@ -80,3 +80,13 @@ def _join(self, forked_node):
     
     def use_execute_fork(self):
         return self.node.use_execute_fork()
+
+
+class ParallelSwitchboardCloneLayer(hinet.SwitchboardCloneLayer,
+                                    parallelnodes.ParallelExtensionNode):
+    """Parallel version of SwitchboardCloneLayer class."""
+
+    def _fork(self):
+        """Fork the internal node, the switchboard is referenced."""
+        return self.__class__(self.switchboard, self.node.fork(),
+                              max_memory=self.max_memory, dtype=self.dtype)
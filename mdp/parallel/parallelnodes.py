@@ -169,9 +169,7 @@ def _join_covariance(cov, forked_cov):
         cov -- Instance of CovarianceMatrix, to which the forked_cov instance
             is aded in-place.
         """
-        cov._cov_mtx += forked_cov._cov_mtx
-        cov._avg += forked_cov._avg
-        cov._tlen += forked_cov._tlen
+        cov._merge(forked_cov)
 
 
 ## MDP parallel node implementations ##
@@ -7,12 +7,6 @@
 from builtins import str
 from builtins import range
 
-# TODO: use a queue instead of sleep?
-#    http://docs.python.org/library/queue.html
-
-# TODO: use shared memory for data numpy arrays, but this also requires the
-#    use of multiprocessing since the ctype objects can't be pickled
-
 # TODO: only return result when get_results is called,
 #    this sends a special request to the processes to send their data,
 #    we would have to add support for this to the callable,
@@ -26,12 +20,18 @@
 import sys
 import os
 import pickle as pickle
+import queue
 import threading
 import subprocess
-import time
 import traceback
 import warnings
 
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    # python < 3.8
+    shared_memory = None
+
 if __name__ == "__main__":
     # try to make sure that mdp can be imported by adding it to sys.path
     mdp_path = os.path.realpath(__file__)
@@ -46,22 +46,162 @@
 import mdp
 from mdp.parallel import Scheduler, cpu_count
 
-SLEEP_TIME = 0.1  # time spend sleeping when waiting for a free process
+
+### Shared memory transport of large arrays. ###
+
+# alignment of the arrays in the shared memory segments
+_SHARED_ALIGNMENT = 64
+
+
+class _SharedArray(object):
+    """Descriptor of an array in a shared memory segment.
+
+    It is sent through the pipe instead of the array data.
+    """
+
+    def __init__(self, segment_name, offset, shape, dtype):
+        self.segment_name = segment_name
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _map_arrays(obj, func):
+    """Apply func to the arrays and _SharedArray descriptors in obj.
+
+    obj can be an array (or a descriptor) or a tuple or list of such
+    objects (e.g. the data with additional training arguments, or the
+    result of a FlowExecuteCallable), all other objects are kept.
+    """
+    if isinstance(obj, (mdp.numx.ndarray, _SharedArray)):
+        return func(obj)
+    if type(obj) in (tuple, list):
+        return type(obj)(_map_arrays(item, func) for item in obj)
+    return obj
+
+
+class _SharedSegment(object):
+    """Reusable shared memory segment for the arrays sent by one side.
+
+    The large arrays of a message are copied into the segment. The segment
+    is only replaced (by one with at least twice the size) if they do not
+    fit, so that no new shared memory has to be mapped for every task.
+    Since there is at most one task per process underway the segment can
+    be overwritten by the next message.
+    """
+
+    def __init__(self, threshold):
+        """Arrays with at least threshold bytes are put into the segment."""
+        self.threshold = threshold
+        self._shm = None
+
+    def _is_large(self, x):
+        return (type(x) is mdp.numx.ndarray and not x.dtype.hasobject and
+                x.nbytes >= self.threshold)
+
+    def export(self, obj):
+        """Return obj with the large arrays replaced by descriptors."""
+        arrays = []
+        _map_arrays(obj, lambda x: arrays.append(x) if self._is_large(x)
+                    else None)
+        if not arrays:
+            return obj
+        offsets = {}
+        size = 0
+        for x in arrays:
+            offsets[id(x)] = size
+            size += -(-x.nbytes // _SHARED_ALIGNMENT) * _SHARED_ALIGNMENT
+        if self._shm is None or self._shm.size < size:
+            if self._shm is not None:
+                size = max(size, 2 * self._shm.size)
+            self.close()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+
+        def to_shared(x):
+            if not self._is_large(x):
+                return x
+            offset = offsets[id(x)]
+            mdp.numx.ndarray(x.shape, dtype=x.dtype, buffer=self._shm.buf,
+                             offset=offset)[...] = x
+            return _SharedArray(self._shm.name, offset, x.shape, x.dtype)
+        return _map_arrays(obj, to_shared)
+
+    def close(self):
+        """Release the segment."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class _SharedSegmentReader(object):
+    """Access to the segments of the _SharedSegment on the other side."""
+
+    def __init__(self):
+        self._shm = None
+
+    def _attach(self, name):
+        if self._shm is not None and self._shm.name == name:
+            return
+        self.close()
+        self._shm = shared_memory.SharedMemory(name=name)
+        # the segment belongs to the other side, which unlinks it
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+    def import_(self, obj, copy):
+        """Return obj with the descriptors replaced by the arrays.
+
+        If copy is False the arrays are views on the segment, which are
+        only valid until the next message arrives.
+        """
+        def from_shared(x):
+            if not isinstance(x, _SharedArray):
+                return x
+            self._attach(x.segment_name)
+            x = mdp.numx.ndarray(x.shape, dtype=x.dtype,
+                                 buffer=self._shm.buf, offset=x.offset)
+            return x.copy() if copy else x
+        return _map_arrays(obj, from_shared)
+
+    def close(self):
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # an array still refers to the segment, the memory is
+                # released when it is garbage collected
+                pass
+            self._shm = None
+
+
+class _TaskFailure(object):
+    """Sent back by a process instead of the result if a task failed."""
+
+    def __init__(self, exception):
+        self.exception = exception
 
 
 class ProcessScheduler(Scheduler):
     """Scheduler that distributes the task to multiple processes.
 
     The subprocess module is used to start the requested number of processes.
-    The execution of each task is internally managed by dedicated thread.
+    Each process is managed by a dedicated thread, which takes the tasks
+    from an internal queue.
 
     This scheduler should work on all platforms (at least on Linux,
     Windows XP and Vista).
+
+    By default all the task data and results are pickled and sent through
+    the process pipes. With the shared_memory_threshold argument large
+    arrays are instead copied into shared memory segments, and only small
+    descriptors are pickled. Every process has one reusable segment for
+    each direction, so in the process the task data is used without
+    a copy.
     """
 
     def __init__(self, result_container=None, verbose=False, n_processes=1,
                  source_paths=None, python_executable=None,
-                 cache_callable=True):
+                 cache_callable=True, shared_memory_threshold=None):
         """Initialize the scheduler and start the slave processes.
 
         result_container -- ResultContainer used to store the results.
@@ -81,6 +221,10 @@ def __init__(self, result_container=None, verbose=False, n_processes=1,
             is True). Disabling caching can reduce the memory usage, but will
             generally be less efficient since the task_callable has to be
             pickled each time.
+        shared_memory_threshold -- If not None (default) then arrays with at
+            least this number of bytes in the task data and in the results
+            (also inside a tuple or list) are sent via shared memory
+            instead of pipes. This requires Python 3.8 or newer.
         """
         super(ProcessScheduler, self).__init__(
                                         result_container=result_container,
@@ -90,6 +234,11 @@ def __init__(self, result_container=None, verbose=False, n_processes=1,
         else:
             self._n_processes = cpu_count()
         self._cache_callable = cache_callable
+        if shared_memory_threshold is not None and shared_memory is None:
+            err = ("The shared memory transport requires the "
+                   "multiprocessing.shared_memory module (Python 3.8).")
+            raise mdp.MDPException(err)
+        self._shared_memory_threshold = shared_memory_threshold
         if python_executable is None:
             python_executable = sys.executable
         # get the location of this module to start the processes
@@ -101,98 +250,163 @@ def __init__(self, result_container=None, verbose=False, n_processes=1,
         #    copy_reg.
         process_args = [python_executable, "-u", module_file]
         process_args.append(str(self._cache_callable))
+        process_args.append(str(self._shared_memory_threshold))
         if isinstance(source_paths, str):
             source_paths = [source_paths]
         if source_paths is None:
             source_paths = sys.path
         process_args += source_paths
-        # list of processes not in use, start the processes now
-        self._free_processes = [subprocess.Popen(args=process_args,
-                                                 stdout=subprocess.PIPE,
-                                                 stdin=subprocess.PIPE)
-                                for _ in range(self._n_processes)]
-        # tag each process with its cached callable task_index,
-        # this is compared with _last_callable_index to check if the cached
-        # task_callable is still up to date
-        for process in self._free_processes:
-            process._callable_index = -1
+        self._process_args = process_args
+        # start the processes now
+        self._processes = [self._start_process()
+                           for _ in range(self._n_processes)]
+        # the tasks are passed to the process threads via the queue,
+        # the semaphore counts the free processes to block add_task,
+        # the threads are only started with the first task
+        self._task_queue = queue.Queue()
+        self._free_processes = threading.Semaphore(self._n_processes)
+        self._threads = []
         if self.verbose:
             print ("scheduler initialized with %d processes" %
                    self._n_processes)
 
+    def _start_process(self):
+        """Start and return a new worker process."""
+        process = subprocess.Popen(args=self._process_args,
+                                   stdout=subprocess.PIPE,
+                                   stdin=subprocess.PIPE)
+        # tag each process with its cached callable task_index,
+        # this is compared with the callable index of the task to check if
+        # the cached task_callable is still up to date
+        process._callable_index = -1
+        if self._shared_memory_threshold is not None:
+            process._segment = _SharedSegment(self._shared_memory_threshold)
+            process._segment_reader = _SharedSegmentReader()
+        return process
+
     def _shutdown(self):
         """Shut down the slave processes.
 
         If a process is still running a task then an exception is raised.
         """
         self._lock.acquire()
-        if len(self._free_processes) < self._n_processes:
-            raise Exception("some slave process is still working")
-        for process in self._free_processes:
-            pickle.dump("EXIT", process.stdin)
-            process.stdin.flush()
+        n_open_tasks = self._n_open_tasks
         self._lock.release()
+        if n_open_tasks:
+            raise Exception("some slave process is still working")
+        for _ in self._threads:
+            self._task_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for process in self._processes:
+            try:
+                pickle.dump("EXIT", process.stdin)
+                process.stdin.flush()
+            except (IOError, OSError):
+                # the process died after a failed task
+                pass
+            if self._shared_memory_threshold is not None:
+                process.wait()
+                process._segment.close()
+                process._segment_reader.close()
         if self.verbose:
             print("scheduler shutdown")
 
     def _process_task(self, data, task_callable, task_index):
-        """Add a task, if possible without blocking.
+        """Add a task to the queue.
 
-        It blocks when the system is not able to start a new thread
-        or when the processes are all in use.
+        It blocks until one of the processes is free.
         """
-        task_started = False
-        while not task_started:
-            if not len(self._free_processes):
-                # release lock for other threads and wait
-                self._lock.release()
-                time.sleep(SLEEP_TIME)
-                self._lock.acquire()
-            else:
-                try:
-                    process = self._free_processes.pop()
-                    self._lock.release()
-                    thread = threading.Thread(target=self._task_thread,
-                                              args=(process, data,
-                                                    task_callable, task_index))
-                    thread.start()
-                    task_started = True
-                except thread.error:
-                    if self.verbose:
-                        print ("unable to create new task thread,"
-                               " waiting 2 seconds...")
-                    time.sleep(2)
-
-    def _task_thread(self, process, data, task_callable, task_index):
-        """Thread function which cares for a single task.
+        # the task callable is always the last callable
+        callable_index = self._last_callable_index
+        if not self._threads:
+            for i_process in range(self._n_processes):
+                thread = threading.Thread(target=self._process_thread,
+                                          args=(i_process,))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        self._lock.release()
+        self._free_processes.acquire()
+        self._task_queue.put((data, task_callable, task_index,
+                              callable_index))
+
+    def _process_thread(self, i_process):
+        """Thread function which cares for a single process.
+
+        The tasks are taken from the queue until None is received. If the
+        process dies it is replaced by a new one for the next task.
+        """
+        while True:
+            task = self._task_queue.get()
+            if task is None:
+                break
+            try:
+                self._task_thread(self._processes[i_process], *task)
+            finally:
+                if self._processes[i_process].poll() is not None:
+                    self._processes[i_process] = self._restart_process(
+                                                self._processes[i_process])
+                self._free_processes.release()
+
+    def _restart_process(self, process):
+        """Release the resources of a dead process and start a new one."""
+        if self.verbose:
+            print("restarting a dead process")
+        for stream in (process.stdin, process.stdout):
+            try:
+                stream.close()
+            except (IOError, OSError):
+                pass
+        if self._shared_memory_threshold is not None:
+            process._segment.close()
+            process._segment_reader.close()
+        return self._start_process()
+
+    def _task_thread(self, process, data, task_callable, task_index,
+                     callable_index):
+        """Care for a single task.
 
         The task is pushed to the process via stdin, then we wait for the
-        result on stdout, pass the result to the result container, free
-        the process and exit.
+        result on stdout and pass the result to the result container.
         """
         try:
             if self._cache_callable:
                 # check if the cached callable is up to date
-                if process._callable_index < self._last_callable_index:
-                    process._callable_index = self._last_callable_index
+                if process._callable_index < callable_index:
+                    process._callable_index = callable_index
                 else:
                     task_callable = None
+            if self._shared_memory_threshold is not None:
+                data = process._segment.export(data)
             # push the task to the process
             pickle.dump((data, task_callable, task_index),
                         process.stdin, protocol=-1)
             process.stdin.flush()
             # wait for result to arrive
             result = pickle.load(process.stdout)
-        except:
+            if self._shared_memory_threshold is not None:
+                # the segment of the process is reused for the next task
+                result = process._segment_reader.import_(result, copy=True)
+        except Exception as exception:
+            # the communication with the process failed, so its state is
+            # unknown, it is killed and then replaced by _process_thread
             traceback.print_exc()
-            self._free_processes.append(process)
-            sys.exit("failed to execute task %d in process:" % task_index)
-        # store the result and clean up
-        self._store_result(result, task_index)
-        self._free_processes.append(process)
+            print("failed to execute task %d in process" % task_index,
+                  file=sys.stderr)
+            process.kill()
+            process.wait()
+            self._store_exception(exception, task_index)
+            return
+        if isinstance(result, _TaskFailure):
+            # the task raised an exception, the process is still usable
+            self._store_exception(result.exception, task_index)
+        else:
+            self._store_result(result, task_index)
 
 
-def _process_run(cache_callable=True):
+def _process_run(cache_callable=True, shared_memory_threshold=None):
     """Run this function in a worker process to receive and run tasks.
 
     It waits for tasks on stdin, and sends the results back via stdout.
@@ -211,15 +425,24 @@ def _process_run(cache_callable=True):
     sys.stdout = sys.stderr
     exit_loop = False
     last_callable = None  # cached callable
+    if shared_memory_threshold is not None:
+        segment = _SharedSegment(shared_memory_threshold)
+        segment_reader = _SharedSegmentReader()
     while not exit_loop:
         task = None
+        sending = False
         try:
             # wait for task to arrive
             task = pickle.load(pickle_in)
             if task == "EXIT":
                 exit_loop = True
+                if shared_memory_threshold is not None:
+                    segment_reader.close()
+                    segment.close()
             else:
                 data, task_callable, task_index = task
+                if shared_memory_threshold is not None:
+                    data = segment_reader.import_(data, copy=False)
                 if task_callable is None:
                     if last_callable is None:
                         err = ("No callable was provided and no cached "
@@ -235,27 +458,59 @@ def _process_run(cache_callable=True):
                     task_callable.setup_environment()
                 result = task_callable(data)
                 del task_callable  # free memory
+                del data
+                if shared_memory_threshold is not None:
+                    result = segment.export(result)
+                # a failure now might leave a partial result in the stream
+                sending = True
                 pickle.dump(result, pickle_out, protocol=-1)
                 pickle_out.flush()
+                sending = False
         except Exception as exception:
-            # return the exception instead of the result
-            if task is None:
-                print("unpickling a task caused an exception in a process:")
-            else:
-                print("task %d caused exception in process:" % task[2])
+            if task is None or sending:
+                # a stream is corrupted, the master restarts the process
+                if task is None:
+                    print("unpickling a task caused an exception in a "
+                          "process:")
+                else:
+                    print("sending the result of task %d caused exception "
+                          "in process:" % task[2])
+                print(exception)
+                traceback.print_exc()
+                sys.stdout.flush()
+                sys.exit()
+            print("task %d caused exception in process:" % task[2])
             print(exception)
             traceback.print_exc()
             sys.stdout.flush()
-            sys.exit()
+            # return the exception instead of the result
+            try:
+                failure = pickle.dumps(_TaskFailure(exception), protocol=-1)
+            except Exception:
+                failure = pickle.dumps(_TaskFailure(Exception(
+                                            "%s: %s" % (type(exception),
+                                                        exception))),
+                                       protocol=-1)
+            pickle_out.write(failure)
+            pickle_out.flush()
 
 if __name__ == "__main__":
     # first argument is cache_callable flag
     cache_callable = sys.argv[1] == "True"
+    # second argument is the shared memory threshold
+    if sys.argv[2] == "None":
+        shared_memory_threshold = None
+    else:
+        shared_memory_threshold = int(sys.argv[2])
 
-    if len(sys.argv) > 2:
+    if len(sys.argv) > 3:
         # remaining arguments are code paths,
         # put them in front so that they take precedence over PYTHONPATH
-        new_paths = [sys_arg for sys_arg in sys.argv[2:]
+        new_paths = [sys_arg for sys_arg in sys.argv[3:]
                      if sys_arg not in sys.path]
         sys.path = new_paths + sys.path
-    _process_run(cache_callable=cache_callable)
+    # use the classes of the imported module, so that the shared memory
+    # descriptors are identical to the ones unpickled in the master
+    from mdp.parallel.process_schedule import _process_run
+    _process_run(cache_callable=cache_callable,
+                 shared_memory_threshold=shared_memory_threshold)
@@ -214,6 +214,10 @@ def __init__(self, result_container=None, verbose=False):
         # count the number of submitted tasks, also used for the task index
         self._task_counter = 0
         self._lock = threading.Lock()
+        # notified (with the lock) when the last open task is finished
+        self._tasks_finished = threading.Condition(self._lock)
+        # exceptions raised by tasks, re-raised in get_results
+        self._task_exceptions = []
         self._last_callable = None  # last callable is stored
         # task index of the _last_callable, can be *.5 if updated between tasks
         self._last_callable_index = -1.0
@@ -297,22 +301,49 @@ def _store_result(self, result, task_index):
             else:
                 print("    task failed")
         self._n_open_tasks -= 1
+        if self._n_open_tasks == 0:
+            self._tasks_finished.notify_all()
+        self._lock.release()
+
+    def _store_exception(self, exception, task_index):
+        """Record the failure of a task instead of storing its result.
+
+        exception -- The exception raised by the task, it is re-raised by
+            get_results.
+        task_index -- Task index.
+        """
+        self._lock.acquire()
+        self._task_exceptions.append(exception)
+        if self.verbose:
+            print("    task no. %d failed" % task_index)
+        self._n_open_tasks -= 1
+        if self._n_open_tasks == 0:
+            self._tasks_finished.notify_all()
         self._lock.release()
 
     def get_results(self):
         """Get the accumulated results from the result container.
 
-        This method blocks if there are open tasks.
+        This method blocks if there are open tasks. If some of the tasks
+        failed then the exception of the first failed task is raised (and
+        the results of the other tasks are discarded).
         """
-        while True:
-            self._lock.acquire()
-            if self._n_open_tasks == 0:
-                results = self.result_container.get_results()
-                self._lock.release()
-                return results
-            else:
-                self._lock.release()
-                time.sleep(1)
+        self._lock.acquire()
+        try:
+            while self._n_open_tasks:
+                self._tasks_finished.wait()
+            exceptions = self._task_exceptions
+            if exceptions:
+                self._task_exceptions = []
+                try:
+                    # reset the container, the results are incomplete
+                    self.result_container.get_results()
+                except Exception:
+                    pass
+                raise exceptions[0]
+            return self.result_container.get_results()
+        finally:
+            self._lock.release()
 
     def shutdown(self):
         """Controlled shutdown of the scheduler.
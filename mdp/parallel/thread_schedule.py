@@ -5,14 +5,12 @@
 from future import standard_library
 standard_library.install_aliases()
 
+import queue
 import threading
-import time
 import pickle as pickle
 
 from .scheduling import Scheduler, cpu_count
 
-SLEEP_TIME = 0.1  # time spend sleeping when waiting for a thread to finish
-
 
 class ThreadScheduler(Scheduler):
     """Thread based scheduler.
@@ -21,6 +19,11 @@ class ThreadScheduler(Scheduler):
     numpy calculations (or some other external non-blocking C code) or for IO,
     but can be more efficient than ProcessScheduler because of the
     shared memory.
+
+    The tasks are processed by a pool of persistent threads, which take them
+    from an internal queue. The threads are started with the first task and
+    run until shutdown is called (or the scheduler is used as a context
+    manager), otherwise they are only stopped at the interpreter exit.
     """
 
     def __init__(self, result_container=None, verbose=False, n_threads=1,
@@ -35,6 +38,8 @@ def __init__(self, result_container=None, verbose=False, n_threads=1,
         copy_callable -- Use deep copies of the task callable in the threads.
             This is for example required if some nodes are stateful during
             execution (e.g., a BiNode using the coroutine decorator).
+            Every task gets its own copy, only the pickled task callable
+            is cached.
         """
         super(ThreadScheduler, self).__init__(
                                             result_container=result_container,
@@ -43,45 +48,69 @@ def __init__(self, result_container=None, verbose=False, n_threads=1,
             self._n_threads = n_threads
         else:
             self._n_threads = cpu_count()
-        self._n_active_threads = 0
         self.copy_callable = copy_callable
+        # index and pickled version of the last copied callable
+        self._pickled_callable_index = -1
+        self._pickled_callable = None
+        # the tasks are passed to the threads via the queue,
+        # the semaphore counts the free threads to block add_task
+        self._task_queue = queue.Queue()
+        self._free_threads = threading.Semaphore(self._n_threads)
+        self._threads = []
+
+    def _shutdown(self):
+        """Stop the threads."""
+        for _ in self._threads:
+            self._task_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
 
     def _process_task(self, data, task_callable, task_index):
-        """Add a task, if possible without blocking.
+        """Add a task to the queue.
 
-        It blocks when the maximum number of threads is reached (given by
-        n_threads) or when the system is not able to start a new thread.
+        It blocks when all the threads (given by n_threads) are busy.
         """
-        task_started = False
-        while not task_started:
-            if self._n_active_threads >= self._n_threads:
-                # release lock for other threads and wait
-                self._lock.release()
-                time.sleep(SLEEP_TIME)
-                self._lock.acquire()
-            else:
-                self._lock.release()
-                task_callable = task_callable.fork()
-                if self.copy_callable:
-                    # create a deep copy of the task_callable,
-                    # since it might not be thread safe 
-                    # (but the fork is still required)
-                    as_str = pickle.dumps(task_callable, -1)
-                    task_callable = pickle.loads(as_str)
-                try:
-                    thread = threading.Thread(target=self._task_thread,
-                                              args=(data, task_callable,
-                                                    task_index))
-                    thread.start()
-                    task_started = True
-                except Exception:
-                    if self.verbose:
-                        print ("unable to create new thread,"
-                               " waiting 2 seconds...")
-                    time.sleep(2)
+        if not self._threads:
+            for _ in range(self._n_threads):
+                thread = threading.Thread(target=self._task_thread)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        # the task callable is always the last callable
+        callable_index = self._last_callable_index
+        if self.copy_callable:
+            # the threads create deep copies of the task_callable,
+            # since it might not be thread safe
+            # (but the fork is still required),
+            # the cache is only used while holding the lock
+            if callable_index > self._pickled_callable_index:
+                self._pickled_callable = pickle.dumps(task_callable, -1)
+                self._pickled_callable_index = callable_index
+            task_callable = self._pickled_callable
+        self._lock.release()
+        if not self.copy_callable:
+            task_callable = task_callable.fork()
+        self._free_threads.acquire()
+        self._task_queue.put((data, task_callable, task_index))
 
-    def _task_thread(self, data, task_callable, task_index):
-        """Thread function which processes a single task."""
-        result = task_callable(data)
-        self._store_result(result, task_index)
-        self._n_active_threads -= 1
+    def _task_thread(self):
+        """Thread function which processes the tasks from the queue.
+
+        The thread finishes when None is received.
+        """
+        while True:
+            task = self._task_queue.get()
+            if task is None:
+                break
+            data, task_callable, task_index = task
+            try:
+                if self.copy_callable:
+                    task_callable = pickle.loads(task_callable).fork()
+                result = task_callable(data)
+            except Exception as exception:
+                self._store_exception(exception, task_index)
+            else:
+                self._store_result(result, task_index)
+            finally:
+                self._free_threads.release()
@@ -10,6 +10,9 @@
 import pickle as _cPickle
 import warnings as _warnings
 import copy as _copy
+import itertools as _itertools
+import os as _os
+import tempfile as _tempfile
 # python 2/3 compatibility
 try:
     from inspect import getfullargspec as getargs
@@ -22,6 +25,60 @@
 from mdp.utils import inspect_formatargspec
 
 
+# counter and process dependent nonce for the node state tokens,
+# see `Node._get_state_token`
+_state_counter = _itertools.count()
+_state_nonce = (None, None)
+
+def _new_state_token():
+    """Return a new token, unique also across (forked) processes."""
+    global _state_nonce
+    pid = _os.getpid()
+    if _state_nonce[0] != pid:
+        _state_nonce = (pid, _os.urandom(8))
+    return (_state_nonce[1], next(_state_counter))
+
+
+def _has_default_execute(node):
+    """Return True if `node.execute` is the plain `Node.execute`."""
+    execute = type(node).execute
+    return getattr(execute, '_undecorated_', execute) is Node.__dict__['execute']
+
+
+def _get_execute_map(node, name):
+    """Return the result of the map hook 'name' of `node`.
+
+    Return None if the node is still in training or if its execution was
+    overwritten after the class defining the hook (e.g. `SFA2Node` with
+    respect to `SFANode`).
+    """
+    if node.is_training() or not _has_default_execute(node):
+        return None
+    for cls in type(node).__mro__:
+        if name in cls.__dict__:
+            break
+        if '_execute' in cls.__dict__:
+            return None
+    return getattr(node, name)()
+
+
+def _get_affine_map(node):
+    """Return `(W, b)` such that `node._execute(x)` equals `mult(x, W) + b`.
+
+    Return None if the map is not available, see `_get_execute_map`.
+    """
+    return _get_execute_map(node, '_get_affine_map')
+
+
+def _get_index_map(node):
+    """Return the index array `idx` such that `node._execute(x)` equals
+    `x[:, idx]`.
+
+    Return None if the map is not available, see `_get_execute_map`.
+    """
+    return _get_execute_map(node, '_get_index_map')
+
+
 class NodeException(mdp.MDPException):
     """Base class for exceptions in `Node` subclasses."""
     pass
@@ -465,6 +522,18 @@ def is_invertible():
         """Return True if the node can be inverted, False otherwise."""
         return True
 
+    @staticmethod
+    def is_row_independent():
+        """Return True if the node processes every row (sample) of the data
+        independently of the other rows, False otherwise.
+
+        For such nodes the result of the training and the execution does
+        not depend on the order of the rows, so the data of several
+        nodes can be stacked and processed in a single call
+        (e.g., in a CloneLayer).
+        """
+        return False
+
     ### check functions
     def _check_input(self, x):
         # check input rank
@@ -581,6 +650,18 @@ def _inverse(self, x):
         if self.is_invertible():
             return x
 
+    def _get_affine_map(self):
+        # implemented by nodes whose '_execute' is an affine map, it must
+        # return the tuple (W, b) such that _execute(x) == mult(x, W) + b,
+        # or None if the map is not available (see Flow.fuse_affine_nodes)
+        return None
+
+    def _get_index_map(self):
+        # implemented by nodes whose '_execute' only selects columns, it
+        # must return the index array idx such that _execute(x) == x[:, idx],
+        # or None if the map is not available (see Flow.fuse_affine_nodes)
+        return None
+
     def _check_train_args(self, x, *args, **kwargs):
         # implemented by subclasses if needed
         pass
@@ -615,6 +696,8 @@ def train(self, x, *args, **kwargs):
 
         self._train_phase_started = True
         self._train_seq[self._train_phase][0](self._refcast(x), *args, **kwargs)
+        # the training may have changed internal structures in place
+        self._state_token = None
 
     def stop_training(self, *args, **kwargs):
         """Stop the training phase.
@@ -653,6 +736,44 @@ def execute(self, x, *args, **kwargs):
         self._pre_execution_checks(x)
         return self._execute(self._refcast(x), *args, **kwargs)
 
+    def freeze_execute(self):
+        """Return a function that executes the node with minimal overhead.
+
+        The checks done by `execute` at every call (training phase,
+        input dimension, dtype, output dimension) are done only once here,
+        so the node must have been trained (the training is stopped if
+        needed, as in `execute`) and its input dimension and dtype must
+        be known. The returned function
+        ``f(x, *args, **kwargs)`` casts `x` to the node dtype and
+        calls `_execute` directly; the input is not checked anymore.
+
+        This is useful to execute a trained node on many small batches.
+        Nodes that overwrite `execute` itself (or have an active extension
+        doing so) are executed through their `execute` method.
+        """
+        self._check_frozen_execution()
+        if not _has_default_execute(self):
+            return self.execute
+        _execute = self._execute
+        dtype = self.dtype
+        refcast = mdp.utils.refcast
+
+        def frozen_execute(x, *args, **kwargs):
+            return _execute(refcast(x, dtype), *args, **kwargs)
+        return frozen_execute
+
+    def _check_frozen_execution(self):
+        """Do the pre-execution checks once, for `freeze_execute`."""
+        if self.is_training() and not self._train_phase_started:
+            errstr = "The node must be trained before freezing its execution."
+            raise TrainingException(errstr)
+        if self.input_dim is None or self.dtype is None:
+            errstr = ("The input dimension and the dtype must be set before "
+                      "the execution can be frozen.")
+            raise NodeException(errstr)
+        self._pre_execution_checks(numx.zeros((1, self.input_dim),
+                                              dtype=self.dtype))
+
     def inverse(self, y, *args, **kwargs):
         """Invert `y`.
 
@@ -686,6 +807,34 @@ def __add__(self, other):
                        ' (not \'%s\') to node' % (type(other).__name__))
             raise TypeError(err_str)
 
+    ### state token
+
+    def __setattr__(self, name, value):
+        # any assignment may change the state of the node
+        self.__dict__['_state_token'] = None
+        super(Node, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        self.__dict__['_state_token'] = None
+        super(Node, self).__delattr__(name)
+
+    def _get_state_token(self):
+        """Return a token identifying the current state of the node.
+
+        A new token is created whenever an attribute of the node is
+        assigned or deleted, in particular during training. Changes of the
+        attributes in place (e.g. ``node.v *= 2``) are not detected, in
+        this case reassign the attribute. Copies of a node share the token
+        as long as none of them is modified.
+
+        The token is used for example by `mdp.caching` to identify the
+        node without hashing its whole state.
+        """
+        token = self.__dict__.get('_state_token')
+        if token is None:
+            token = self.__dict__['_state_token'] = _new_state_token()
+        return token
+
     ###### string representation
 
     def __str__(self):
@@ -750,6 +899,86 @@ def _set_output_dim(self, n):
         self._output_dim = n
 
 
+class _CumulatorBuffer(object):
+    """Collect data chunks consecutively in a single array.
+
+    The array is allocated with room for `tlen` rows (if given) and
+    doubled in size whenever a chunk does not fit anymore. If `on_disk` is
+    True the array is a `numpy.memmap` on an anonymous temporary file in
+    `dir`, which is grown in place and removed by the operating system as
+    soon as the last view on the data is released.
+    """
+
+    def __init__(self, tlen=None, on_disk=False, dir=None):
+        self.tlen = tlen
+        self.on_disk = on_disk
+        self.dir = dir
+        self._array = None
+        self._file = None
+        self._len = 0
+
+    def append(self, x):
+        needed = self._len + x.shape[0]
+        if self._array is None:
+            self._allocate(max(self.tlen or 0, needed), x.shape[1:], x.dtype)
+        elif needed > self._array.shape[0]:
+            self._allocate(max(2*self._array.shape[0], needed),
+                           self._array.shape[1:], self._array.dtype)
+        self._array[self._len:needed] = x
+        self._len = needed
+
+    def _allocate(self, nrows, shape, dtype):
+        shape = (nrows,) + tuple(shape)
+        if not self.on_disk:
+            if self._array is None:
+                self._array = numx.empty(shape, dtype=dtype)
+            else:
+                # no views on the buffer exist yet, so it can be
+                # reallocated (on most platforms without a copy)
+                self._array.resize(shape, refcheck=False)
+            return
+        if self._file is None:
+            self._file = _tempfile.TemporaryFile(prefix='mdp_cumulator_',
+                                                 dir=self.dir)
+            mode = 'w+'
+        else:
+            # the file is extended, the data already written stays in place
+            self._array.flush()
+            mode = 'r+'
+        self._array = numx.memmap(self._file, dtype=dtype, mode=mode,
+                                  shape=shape)
+
+    def __getstate__(self):
+        """Return the state with an owned copy of the collected data
+        (the temporary file of the 'disk' storage cannot be pickled)."""
+        state = self.__dict__.copy()
+        if self._array is not None:
+            state['_array'] = numx.array(self._array[:self._len])
+        state['_file'] = None
+        state['_len'] = 0
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state, the collected data is written into a new
+        buffer (and a new temporary file for the 'disk' storage)."""
+        data = state.pop('_array')
+        self.__dict__.update(state)
+        self._array = None
+        if data is not None:
+            self.append(data)
+
+    def get(self):
+        """Return a view on the collected data and release the buffer."""
+        data = self._array[:self._len]
+        if self._file is not None:
+            # the memory map keeps the (already unlinked) file alive
+            data.flush()
+            self._file.close()
+        self._array = self._file = None
+        self._len = 0
+        return data
+
+
 def VariadicCumulator(*fields):
     """A VariadicCumulator is a `Node` whose training phase simply collects
     all input data. In this way it is possible to easily implement
@@ -758,6 +987,11 @@ def VariadicCumulator(*fields):
     The data is accessible in the attributes given with the VariadicCumulator's
     constructor after the beginning of the `Node._stop_training` phase.
     ``self.tlen`` contains the number of data points collected.
+
+    By default the chunks are kept in a list and concatenated at the end of
+    the training, so that the memory consumption peaks at twice the size
+    of the data. Use `set_storage` before the training to write the chunks
+    directly into a single (possibly memory mapped) array instead.
     """
 
     class Cumulator(Node):
@@ -770,18 +1004,74 @@ def __init__(self, *args, **kwargs):
                     raise mdp.MDPException(errstr % arg)
                 setattr(self, arg, [])
             self.tlen = 0
+            self._cumulator_storage = 'list'
+            self._cumulator_tlen = None
+            self._cumulator_dir = None
+            self._cumulator_buffers = {}
+
+        def set_storage(self, storage='list', tlen=None, dir=None):
+            """Choose how the training data is collected.
+
+            :param storage: One of
+
+                - ``'list'``: keep the chunks in a list and concatenate
+                  them at the end of the training (default).
+                - ``'memory'``: write the chunks into one array in memory,
+                  the collected data is a view on this array.
+                - ``'disk'``: write the chunks into a memory mapped
+                  temporary file, which is deleted automatically as soon
+                  as the data is not referenced anymore.
+            :type storage: str
+
+            :param tlen: Expected total number of data points. If given,
+                the array is preallocated to this length, otherwise it
+                grows as needed. Ignored for ``'list'`` storage.
+            :type tlen: int
+
+            :param dir: Directory for the temporary file of the
+                ``'disk'`` storage. Defaults to the directory chosen by
+                the `tempfile` module.
+            :type dir: str
+            """
+            if storage not in ('list', 'memory', 'disk'):
+                errstr = "Unknown cumulator storage: %s" % str(storage)
+                raise NodeException(errstr)
+            if self.tlen or not self.is_training():
+                errstr = ("The cumulator storage can only be changed "
+                          "before the training starts.")
+                raise TrainingException(errstr)
+            self._cumulator_storage = storage
+            self._cumulator_tlen = tlen
+            self._cumulator_dir = dir
 
         def _train(self, *args):
-            """Collect all input data in a list."""
+            """Collect all input data."""
             self.tlen += args[0].shape[0]
             for field, data in zip(self._cumulator_fields, args):
+                self._cumulate(field, data)
+
+        def _cumulate(self, field, data):
+            """Append a chunk of data to the given field."""
+            if self._cumulator_storage == 'list':
                 getattr(self, field).append(data)
+                return
+            if field not in self._cumulator_buffers:
+                self._cumulator_buffers[field] = _CumulatorBuffer(
+                    tlen=self._cumulator_tlen,
+                    on_disk=self._cumulator_storage == 'disk',
+                    dir=self._cumulator_dir)
+            self._cumulator_buffers[field].append(data)
+
+        def _cumulated(self, field):
+            """Return all the data collected for the given field."""
+            if field in self._cumulator_buffers:
+                return self._cumulator_buffers.pop(field).get()
+            return numx.concatenate(getattr(self, field), 0)
 
         def _stop_training(self, *args, **kwargs):
-            """Concatenate the collected data in a single array."""
+            """Make the collected data available as a single array."""
             for field in self._cumulator_fields:
-                data = getattr(self, field)
-                setattr(self, field, numx.concatenate(data, 0))
+                setattr(self, field, self._cumulated(field))
 
     return Cumulator
 
@@ -268,14 +268,12 @@ def train(self, x, *args, **kwargs):
         self._train_phase_started = True
 
         if self.training_type == 'incremental':
-            x = x[:, None, :]  # to train sample by sample with 2D shape
-            for _x in x:
-                for _phase in range(len(self._train_seq)):
-                    self._train_seq[_phase][0](_x, *args, **kwargs)
-                    # legacy support for _train_seq.
-                    if len(self._train_seq[_phase]) > 2:
-                        _x = self._train_seq[_phase][2](_x, *args, **kwargs)
-                self._train_iteration += 1
+            train_iteration = self._train_iteration
+            if self._uses_train_block():
+                self._train_block(x, *args, **kwargs)
+            else:
+                OnlineNode._train_block(self, x, *args, **kwargs)
+            self._train_iteration = train_iteration + x.shape[0]
         else:
             _x = x
             for _phase in range(len(self._train_seq)):
@@ -285,6 +283,36 @@ def train(self, x, *args, **kwargs):
                     _x = self._train_seq[_phase][2](_x, *args, **kwargs)
             self._train_iteration += x.shape[0]
 
+    def _train_block(self, x, *args, **kwargs):
+        """Train the node with a block of samples in 'incremental' mode.
+
+        By default the samples are passed through the _train_seq one by one.
+        Subclasses can overwrite this method with a faster implementation
+        that gives the same result as the sample by sample training.
+        `get_current_train_iteration` returns the iteration of the first
+        sample in the block, the iteration counter is updated by `train`.
+
+        The overwritten method is only used as long as `_train` and
+        `_get_train_seq` are not overwritten in a subclass of the class
+        defining `_train_block`.
+        """
+        x = x[:, None, :]  # to train sample by sample with 2D shape
+        for _x in x:
+            for _phase in range(len(self._train_seq)):
+                self._train_seq[_phase][0](_x, *args, **kwargs)
+                # legacy support for _train_seq.
+                if len(self._train_seq[_phase]) > 2:
+                    _x = self._train_seq[_phase][2](_x, *args, **kwargs)
+            self._train_iteration += 1
+
+    def _uses_train_block(self):
+        """Return True if the _train_block method of the node matches
+        its training phases."""
+        mro = type(self).__mro__
+        owners = [next(klass for klass in mro if name in vars(klass))
+                  for name in ('_train_block', '_train', '_get_train_seq')]
+        return all(issubclass(owners[0], owner) for owner in owners[1:])
+
     def stop_training(self, *args, **kwargs):
         """Stop the training phase.
 
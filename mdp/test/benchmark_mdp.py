@@ -138,6 +138,39 @@ def sfa_benchmark():
     #src = src.reshape(1000,5,nsrc)
     flow.train([None, [src], [src]])
 
+def hit_parade_benchmark(length, n, d, reference):
+    """    This benchmark collects the 'n' largest and smallest values
+    separated by a gap 'd' of a random walk of length 'length', either
+    with the block-vectorized update or, if 'reference' is True, with
+    the sample by sample reference loop of the tests.
+    Arguments: (length,n,d,reference)."""
+    numx_rand.seed(1379117)
+    x = numx_rand.normal(size=length).cumsum()
+    if reference:
+        from mdp.test.test_HitParadeNode import LoopHitParade
+        hit = LoopHitParade(n, d)
+    else:
+        hit = mdp.nodes._OneDimensionalHitParade(n, d)
+    chunk_len = 10000
+    for start in range(0, length, chunk_len):
+        stop = min(start + chunk_len, length)
+        hit.update((x[start:stop], numx.arange(start, stop)))
+
+def process_scheduler_transport_benchmark(shared_memory_threshold, n_chunks,
+                                          chunk_len, dim):
+    """    This benchmark executes a trivial flow in parallel with a
+    ProcessScheduler (two processes) on 'n_chunks' data chunks of
+    shape (chunk_len, dim), with the given shared memory threshold
+    (None to pickle all arrays), so that the time is dominated by the
+    data transport.
+    Arguments: (shared_memory_threshold,n_chunks,chunk_len,dim)."""
+    x = numx_rand.random((chunk_len, dim))
+    flow = mdp.parallel.ParallelFlow([mdp.nodes.IdentityNode()])
+    with mdp.parallel.ProcessScheduler(
+            n_processes=2,
+            shared_memory_threshold=shared_memory_threshold) as scheduler:
+        flow.execute([x]*n_chunks, scheduler=scheduler)
+
 #### benchmark tools
 
 # function used to measure time
@@ -199,6 +232,11 @@ def run_benchmarks(bench_funcs, time_digits=15):
 ####### /benchmark function
 
 POLY_EXP_ARGS = [(2**i, 100, j, 200) for j in range(2,5) for i in range(2,4)]
+TRANSPORT_ARGS = [(threshold, 20, 2**i, 100)
+                  for i in (12, 16) for threshold in (None, 2**16)]
+HIT_PARADE_ARGS = [(10**i, n, 10, reference)
+                   for i in (4, 5) for n in (5, 50)
+                   for reference in (True, False)]
 
 #if mdp.numx_description in ['symeig', 'scipy', 'numpy']:
 #    MUL_MTX_DIMS = [[2**i] for i in xrange(4,11)]
@@ -214,7 +252,8 @@ def run_benchmarks(bench_funcs, time_digits=15):
 #    BENCH_FUNCS = [(polynomial_expansion_benchmark, POLY_EXP_ARGS)]
 BENCH_FUNCS = [(polynomial_expansion_benchmark, POLY_EXP_ARGS),
                (isfa_spiral_benchmark, [[]]),
-               (sfa_benchmark, [[]])]
+               (sfa_benchmark, [[]]),
+               (hit_parade_benchmark, HIT_PARADE_ARGS)]
 
 def get_benchmarks():
     return BENCH_FUNCS
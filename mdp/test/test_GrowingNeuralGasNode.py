@@ -1,7 +1,9 @@
 from __future__ import division
 from builtins import range
 from past.utils import old_div
+import pickle
 from ._tools import *
+from mdp.nodes import neural_gas_nodes
 
 
 def _uniform(min_, max_, dims):
@@ -56,3 +58,61 @@ def test_GrowingNeuralGasNode():
     assert_equal(dists[0],1.)
     assert_array_equal(nodes[0].data.pos,numx.asarray([2,0]))
 
+
+def test_GrowingNeuralGasNode_positions():
+    data = numx_rand.normal(size=(2000, 3))
+    start_poss = [data[0,:].copy(), data[1,:].copy()]
+    gng = mdp.nodes.GrowingNeuralGasNode(start_poss=start_poss, lambda_=20)
+    gng.train(data)
+    gng.stop_training()
+    # the start positions are copied
+    assert_array_equal(start_poss[0], data[0,:])
+    # the node data stays in sync with the position and error arrays
+    poss = numx.array([n.data.pos for n in gng.graph.nodes])
+    assert_array_equal(poss, gng.get_nodes_position())
+    errors = [n.data.cum_error for n in gng.graph.nodes]
+    assert_array_equal(errors, gng._errors)
+    # the positions are still linked after pickling
+    gng = pickle.loads(pickle.dumps(gng))
+    gng.graph.nodes[1].data.pos += 1.
+    assert_array_equal(gng.get_nodes_position()[1], poss[1] + 1.)
+
+def test_GrowingNeuralGasNode_buffers():
+    data = numx_rand.normal(size=(2000, 3))
+    gng = mdp.nodes.GrowingNeuralGasNode(lambda_=20)
+    gng.train(data)
+    n_nodes = len(gng.graph.nodes)
+    # the position and error arrays are views on the growing buffers
+    assert gng._positions.base is gng._position_buffer
+    assert gng._errors.base is gng._error_buffer
+    assert n_nodes <= len(gng._position_buffer) < 2*n_nodes
+    poss = gng.get_nodes_position()
+    # a pickle from before the position array only has the graph
+    state = gng.__getstate__()
+    del state['_positions']
+    del state['_errors']
+    old_gng = pickle.loads(pickle.dumps(gng))
+    old_gng.__dict__.clear()
+    old_gng.__setstate__(pickle.loads(pickle.dumps(state)))
+    assert_array_equal(old_gng.get_nodes_position(), poss)
+    assert_array_equal(old_gng._errors,
+                       [n.data.cum_error for n in gng.graph.nodes])
+    # the training continues with the rebuilt arrays
+    old_gng.train(data[:100])
+    assert_array_equal(old_gng.get_nodes_position(),
+                       [n.data.pos for n in old_gng.graph.nodes])
+
+def test_GrowingNeuralGasNode_nearest_neighbor(monkeypatch):
+    data = numx_rand.normal(size=(500, 3))
+    gng = mdp.nodes.GrowingNeuralGasNode(lambda_=10)
+    gng.train(data)
+    gng.stop_training()
+    x = numx_rand.normal(size=(300, 3))
+    # force several chunks
+    monkeypatch.setattr(neural_gas_nodes, '_MAX_DIST_ELEMENTS', 100)
+    nodes, dists = gng.nearest_neighbor(x)
+    poss = gng.get_nodes_position()
+    exp_dists = numx.sqrt(((x[:,numx.newaxis,:] - poss)**2).sum(axis=2))
+    exp_ids = exp_dists.argmin(axis=1)
+    assert_array_equal([gng.graph.nodes.index(n) for n in nodes], exp_ids)
+    assert_array_almost_equal(dists, exp_dists.min(axis=1))
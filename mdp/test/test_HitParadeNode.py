@@ -53,3 +53,49 @@ def testOneDimensionalHitParade():
     assert_array_equal(ind_maxima,[110,103,0,10,50])
     assert_array_equal(minima,[-3.1,-3,-1.5,-1.4,-1.3])
     assert_array_equal(ind_minima,[123,130,1,11,51])
+
+class LoopHitParade(mdp.nodes._OneDimensionalHitParade):
+    """Reference hit-parade that processes the samples one by one."""
+
+    def update(self, inp):
+        (x, ix) = inp
+        d = self.d
+        M, m, iM, im = self.M, self.m, self.iM, self.im
+        lM, lm = self.lM, self.lm
+        for i in range(len(x)):
+            k1 = M.argmin()
+            k2 = m.argmax()
+            if x[i] > M[k1]:
+                if ix[i]-iM[lM] <= d and x[i] > M[lM]:
+                    M[lM] = x[i]
+                    iM[lM] = ix[i]
+                elif ix[i]-iM[lM] > d:
+                    M[k1] = x[i]
+                    iM[k1] = ix[i]
+                    lM = k1
+            if x[i] < m[k2]:
+                if ix[i]-im[lm] <= d and x[i] < m[lm]:
+                    m[lm] = x[i]
+                    im[lm] = ix[i]
+                elif ix[i]-im[lm] > d:
+                    m[k2] = x[i]
+                    im[k2] = ix[i]
+                    lm = k2
+        self.lM, self.lm = lM, lm
+
+@pytest.mark.parametrize('dtype', ['d', 'f', 'i'])
+@pytest.mark.parametrize('n,d', [(1, 1), (5, 3), (20, 50)])
+def testOneDimensionalHitParade_reference(dtype, n, d):
+    # random walk with ties and plateaus
+    signal = (numx_rand.normal(size=5000).cumsum()*4).round().astype(dtype)
+    hit = mdp.nodes._OneDimensionalHitParade(n, d, dtype)
+    ref = LoopHitParade(n, d, dtype)
+    for start in range(0, 5000, 700):
+        inp = (signal[start:start+700], numx.arange(start, start+700))
+        hit.update(inp)
+        ref.update(inp)
+    assert_array_equal(hit.M, ref.M)
+    assert_array_equal(hit.iM, ref.iM)
+    assert_array_equal(hit.m, ref.m)
+    assert_array_equal(hit.im, ref.im)
+    assert (hit.lM, hit.lm) == (ref.lM, ref.lm)
@@ -58,6 +58,29 @@ def test_CuBICANode_telescope():
     verify_ICANodeMatrices(ica2)
 
 
+@pytest.mark.parametrize('approach', ['symm', 'defl'])
+@pytest.mark.parametrize('g', ['pow3', 'tanh', 'gaus'])
+def test_FastICA_block_size(approach, g):
+    # processing the data in blocks must give the same filters as
+    # processing all the data at once
+    src = uniform((3000, 3)) - 0.5
+    x = mult(src, uniform((3, 3)) + numx.eye(3))
+    guess = mdp.utils.random_rot(3)
+    filters = []
+    for block_size, storage in [(None, 'list'), (700, 'list'),
+                                (512, 'disk')]:
+        ica = mdp.nodes.FastICANode(approach=approach, g=g, fine_g=g,
+                                    guess=guess.copy(), limit=1e-5,
+                                    block_size=block_size)
+        ica.set_storage(storage)
+        ica.train(x[:1700])
+        ica.train(x[1700:])
+        ica.stop_training()
+        filters.append(ica.filters)
+    assert_array_almost_equal(filters[0], filters[1], 8)
+    assert_array_almost_equal(filters[0], filters[2], 8)
+
+
 def test_TDSEPNode():
     ica = mdp.nodes.TDSEPNode(lags=20, limit=1e-10)
     ica2 = ica.copy()
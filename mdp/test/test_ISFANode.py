@@ -234,3 +234,14 @@ def testISFANode_AnalyticalSolution():
         if error < 1E-4:
             break
     assert error < 1E-4, 'None out of the %d trials succeded.' % trials
+
+def testISFANode_chunks():
+    # lagged pairs across chunk boundaries are not lost
+    x = uniform((500, 3))
+    isfa1 = mdp.nodes.ISFANode(lags=8, whitened=True)
+    isfa1.train(x)
+    isfa2 = mdp.nodes.ISFANode(lags=8, whitened=True)
+    for start in range(0, 500, 5):
+        isfa2.train(x[start:start+5])
+    for des, act in zip(isfa1.covs.fix(), isfa2.covs.fix()):
+        assert_array_almost_equal(act, des)
@@ -53,3 +53,41 @@ def distr(size): return normal(0, 1., size=(size)) * std_
     node.train(x, classes)
     classification = node.label(x)
     assert_array_equal(classes, classification)
+
+def _knn_reference_labels(node, x):
+    """Label x with the full distance matrix and a complete sort."""
+    square_distances = ((x[:, numx.newaxis, :] -
+                         node.samples[numx.newaxis, :, :])**2).sum(axis=2)
+    min_inds = square_distances.argsort()
+    win_inds = [numx.bincount(node.sample_label_indices[indices[0:node.k]],
+                              minlength=len(node.ordered_labels)).argmax()
+                for indices in min_inds]
+    return [node.ordered_labels[i] for i in win_inds]
+
+@pytest.mark.parametrize('k', [1, 5, 300])
+def testKNNClassifier_chunked_label(k):
+    x = uniform((200, 3))
+    classes = numx_rand.randint(3, size=200)
+    # with this memory limit the query data is processed in
+    # chunks of a single row
+    node = mdp.nodes.KNNClassifier(k=k, max_memory=8)
+    node.train(x, classes)
+    node.stop_training()
+    query = uniform((50, 3))
+    assert_array_equal(node.label(query), _knn_reference_labels(node, query))
+
+def testKNNClassifier_kdtree():
+    pytest.importorskip('scipy.spatial')
+    x = uniform((200, 3))
+    classes = numx_rand.randint(3, size=200)
+    query = uniform((50, 3))
+    for k in [1, 5]:
+        node = mdp.nodes.KNNClassifier(k=k, index='kdtree')
+        node.train(x, classes)
+        node.stop_training()
+        assert_array_equal(node.label(query),
+                           _knn_reference_labels(node, query))
+
+def testKNNClassifier_wrong_index():
+    with pytest.raises(mdp.NodeException):
+        mdp.nodes.KNNClassifier(index='balltree')
@@ -58,3 +58,39 @@ def distr(size): return normal(0, 1., size=(size)) * std_
     node.train(x, classes)
     classification = node.label(x)
     assert_array_equal(classes, classification)
+
+def testNearestMeanClassifier_chunked():
+    nclasses = 5
+    x = uniform((300, 3))
+    classes = numx_rand.randint(nclasses, size=300)
+    # with this memory limit the data is processed in chunks of a single row
+    node = mdp.nodes.NearestMeanClassifier(max_memory=8)
+    node.train(x, classes)
+    node.stop_training()
+    query = uniform((40, 3))
+    square_distances = ((query[:, numx.newaxis, :] -
+                         node.ordered_means[numx.newaxis, :, :])**2).sum(2)
+    nearest = square_distances.argmin(axis=1)
+    assert_array_equal(node.label(query),
+                       [node.ordered_labels[i] for i in nearest])
+
+def testNearestMeanClassifier_rank():
+    nclasses = 5
+    x = uniform((300, 3))
+    classes = numx_rand.randint(nclasses, size=300)
+    node = mdp.nodes.NearestMeanClassifier(max_memory=8*nclasses*7)
+    node.train(x, classes)
+    node.stop_training()
+    query = uniform((40, 3))
+    square_distances = ((query[:, numx.newaxis, :] -
+                         node.ordered_means[numx.newaxis, :, :])**2).sum(2)
+    order = square_distances.argsort(axis=1)
+    assert node.rank(query) == [[node.ordered_labels[i] for i in indices]
+                                for indices in order]
+    threshold = numx.median(square_distances)
+    assert node.rank(query, threshold=threshold) == [
+        [node.ordered_labels[i] for i in indices if dists[i] <= threshold]
+        for dists, indices in zip(square_distances, order)]
+    # the execute method uses the same ranking
+    node.execute_method = "rank"
+    assert node.execute(query) == node.rank(query)
@@ -233,3 +233,19 @@ def test_PCANode_no_eigenvalues_left():
     pca = mdp.nodes.PCANode(svd=True, reduce=True)
     pca.train(mat)
     pytest.raises(mdp.NodeException, pca.stop_training)
+
+def testPCANode_compensated_float32():
+    # single precision training with an offset and many chunks
+    x = mult(numx_rand.normal(size=(100000, 3)),
+             uniform((3, 3))) + 100.
+    pca64 = mdp.nodes.PCANode()
+    pca64.train(x)
+    pca64.stop_training()
+    for node_class in [mdp.nodes.PCANode, mdp.nodes.WhiteningNode]:
+        node = node_class(dtype='f', compensated=True)
+        for start in range(0, 100000, 10000):
+            node.train(x[start:start+10000].astype('f'))
+        node.stop_training()
+        assert_type_equal(node.d.dtype, 'f')
+        assert_array_almost_equal(node.d / pca64.d, numx.ones(3), 4)
+        assert_array_almost_equal(node.avg, pca64.avg, 3)
@@ -57,3 +57,52 @@ def scalar_to_covs(x, n):
     rbf = mdp.nodes.RBFExpansionNode(centers, sizes)
     check_mn_cov(rbf, sizes)
 
+
+def _naive_rbf(x, centers, sizes):
+    y = numx.zeros((x.shape[0], centers.shape[0]))
+    for i in range(centers.shape[0]):
+        dist = x - centers[i]
+        if numx.isscalar(sizes[i]):
+            tmp = (dist**2).sum(axis=1) / sizes[i]
+        else:
+            tmp = (dist*mdp.utils.mult(dist, mdp.utils.inv(sizes[i]))).sum(1)
+        y[:,i] = numx.exp(-0.5*tmp)
+    return y
+
+def testRBFExpansionNode_vectorized():
+    dim, n_centers = 4, 30
+    x = numx_rand.random((500, dim))
+    centers = numx_rand.random((n_centers, dim))
+    sizes = list(0.1 + numx_rand.random(n_centers))
+    rbf = mdp.nodes.RBFExpansionNode(centers, sizes)
+    assert_array_almost_equal(rbf(x), _naive_rbf(x, centers, sizes))
+    sizes = [mdp.utils.symrand(0.1 + numx_rand.random(dim))
+             for i in range(n_centers)]
+    # small max_memory to force evaluation in several chunks
+    rbf = mdp.nodes.RBFExpansionNode(centers, sizes,
+                                     max_memory=n_centers*dim*8*7)
+    assert_array_almost_equal(rbf(x), _naive_rbf(x, centers, sizes))
+
+def testRBFExpansionNode_offset_float32():
+    # far from the origin the distances must not cancel in single precision
+    dim, n_centers = 4, 10
+    for offset in [100., 1e4]:
+        # the reference uses the same (rounded) values in double precision
+        x = (offset + numx_rand.random((200, dim))).astype('float32')
+        centers = (offset +
+                   numx_rand.random((n_centers, dim))).astype('float32')
+        sizes = list(0.1 + numx_rand.random(n_centers))
+        expected = _naive_rbf(x.astype('d'), centers.astype('d'), sizes)
+        rbf = mdp.nodes.RBFExpansionNode(centers, sizes, dtype='float32')
+        assert_array_almost_equal(rbf(x), expected, 4)
+        sizes = [mdp.utils.symrand(0.1 + numx_rand.random(dim))
+                 for i in range(n_centers)]
+        expected = _naive_rbf(x.astype('d'), centers.astype('d'), sizes)
+        rbf = mdp.nodes.RBFExpansionNode(centers, sizes, dtype='float32')
+        assert_array_almost_equal(rbf(x), expected, 4)
+
+def testRBFExpansionNode_not_positive_definite():
+    centers = numx_rand.random((3, 2))
+    sizes = numx.array([[1., 0.], [0., -1.]])
+    pytest.raises(mdp.NodeException,
+                  mdp.nodes.RBFExpansionNode, centers, sizes)
@@ -368,3 +368,17 @@ def testSFANode_derivative_bug2D_eigen():
                                         overwrite=False)
     assert_array_almost_equal(eigvalues, sfa.d, decimal)
     assert_array_almost_equal(eigvectors, sfa.sf, decimal)
+
+def testSFANode_compensated_float32():
+    # single precision training with an offset and many chunks
+    x = mult(numx_rand.normal(size=(100000, 3)),
+             uniform((3, 3))) + 100.
+    sfa64 = mdp.nodes.SFANode()
+    sfa64.train(x)
+    sfa64.stop_training()
+    sfa = mdp.nodes.SFANode(dtype='f', compensated=True)
+    for start in range(0, 100000, 10000):
+        sfa.train(x[start:start+10000].astype('f'))
+    sfa.stop_training()
+    assert_type_equal(sfa.d.dtype, 'f')
+    assert_array_almost_equal(sfa.d / sfa64.d, numx.ones(3), 3)
@@ -78,3 +78,17 @@ def test_TimeDelayNodes():
 
     assert_array_equal(real_res, slider_res)
 
+def test_TimeDelayNodes_chunks():
+    x = numx_rand.random((50, 3))
+    for time_frames, gap in [(1, 1), (3, 2), (4, 1)]:
+        res = TimeDelayNode(time_frames, gap).execute(x)
+        node = TimeDelayNode(time_frames, gap, streaming=True)
+        slider = TimeDelaySlidingWindowNode(time_frames, gap)
+        for sizes in ([50], [7]*7 + [1], [1]*50):
+            for node_ in (node, slider):
+                node_.reset()
+                chunks, i = [], 0
+                for size in sizes:
+                    chunks.append(node_.execute(x[i:i+size]))
+                    i += size
+                assert_array_equal(numx.concatenate(chunks), res)
@@ -25,3 +25,25 @@ def test_TimeFramesNode():
 
 def test_TimeFramesNodeBugInputDim():
     mdp.nodes.TimeFramesNode(time_frames=10, gap=1, input_dim=1)
+
+def test_TimeFramesNode_streaming():
+    inp = numx_rand.random((50, 3))
+    for time_frames, gap in [(1, 1), (3, 1), (4, 3)]:
+        out = mdp.nodes.TimeFramesNode(time_frames, gap).execute(inp)
+        node = mdp.nodes.TimeFramesNode(time_frames, gap, streaming=True)
+        chunks = [node.execute(inp[i:i+4]) for i in range(0, 50, 4)]
+        assert_array_equal(numx.concatenate(chunks), out)
+        # the output is not shared with the input
+        assert not numx.may_share_memory(chunks[-1], inp)
+        node.reset()
+        assert_array_equal(node.execute(inp), out)
+
+def test_TimeFramesNode_view():
+    inp = numx_rand.random((20, 3))
+    out = mdp.nodes.TimeFramesNode(3, 1, view=True).execute(inp)
+    assert numx.may_share_memory(out, inp)
+    assert not out.flags.writeable
+    assert_array_equal(out, mdp.nodes.TimeFramesNode(3, 1).execute(inp))
+    # with a gap the frames are copied
+    node = mdp.nodes.TimeFramesNode(3, 2, view=True)
+    assert not numx.may_share_memory(node.execute(inp), inp)
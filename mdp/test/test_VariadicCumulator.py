@@ -1,4 +1,5 @@
 from builtins import range
+import pickle
 import mdp
 from ._tools import *
 
@@ -31,3 +32,64 @@ def _stop_training(self, *args, **kwargs):
     for i in range(NREP):
         ab.train(x[i], y[i])
     ab.stop_training()
+
+@pytest.mark.parametrize('storage, tlen', [('list', None),
+                                           ('memory', None),
+                                           ('memory', 1000),
+                                           ('disk', None),
+                                           ('disk', 707)])
+def test_Cumulator_storage(storage, tlen):
+    x = [numx_rand.rand(101, 3) for _ in range(7)]
+    node = mdp.Cumulator()
+    node.set_storage(storage, tlen=tlen)
+    for chunk in x:
+        node.train(chunk)
+    node.stop_training()
+    assert node.tlen == 707
+    assert_array_equal(node.data, numx.concatenate(x, 0))
+    if storage == 'disk':
+        assert isinstance(node.data, numx.memmap)
+        # the data can still be modified and pickled
+        node.data[0] = 0.
+        data = pickle.loads(pickle.dumps(node.data))
+        assert_array_equal(data, node.data)
+
+class PicklableCumulator(mdp.Cumulator):
+    """Cumulator defined at module level, so that it can be pickled."""
+    pass
+
+@pytest.mark.parametrize('storage', ['list', 'memory', 'disk'])
+def test_Cumulator_storage_copy(storage):
+    # copy and pickle the node in the middle of the training
+    x = [numx_rand.rand(101, 3) for _ in range(7)]
+    node = PicklableCumulator()
+    node.set_storage(storage, tlen=300)
+    for chunk in x[:4]:
+        node.train(chunk)
+    for new_node in [node.copy(), pickle.loads(pickle.dumps(node))]:
+        for chunk in x[4:]:
+            new_node.train(chunk)
+        new_node.stop_training()
+        assert new_node.tlen == 707
+        assert_array_equal(new_node.data, numx.concatenate(x, 0))
+    for chunk in x[4:]:
+        node.train(chunk)
+    node.stop_training()
+    assert_array_equal(node.data, numx.concatenate(x, 0))
+
+def test_Cumulator_storage_errors():
+    node = mdp.Cumulator()
+    pytest.raises(mdp.NodeException, node.set_storage, 'foo')
+    node.train(numx_rand.rand(10, 3))
+    pytest.raises(mdp.TrainingException, node.set_storage, 'memory')
+
+def test_ClassifierCumulator_storage():
+    x = numx_rand.rand(100, 3)
+    labels = numx.arange(100) % 3
+    node = mdp.ClassifierCumulator()
+    node.set_storage('disk')
+    node.train(x[:40], labels[:40])
+    node.train(x[40:], labels[40:])
+    node.stop_training()
+    assert_array_equal(node.data, x)
+    assert_array_equal(node.labels, labels)
@@ -246,3 +246,156 @@ def test_execute_magic():
         y = node(x)
         y2 = node(x)
         assert_array_equal(y, y2)
+
+
+def test_memory_cache():
+    """Test the in-process cache, which does not need joblib."""
+    global _counter
+    node = _CounterNode()
+    _counter = 0
+    with mdp.caching.cache(backend='memory'):
+        assert mdp.get_active_extensions() == ['cache_execute']
+        for i in range(3):
+            x = mdp.numx.array([[i]], dtype='d')
+            for _ in range(2):
+                assert mdp.numx.all(node.execute(x) == x)
+                assert _counter == i + 1
+        # the cached results can be modified without altering the cache
+        y = node.execute(x)
+        y[0, 0] = -1.
+        assert mdp.numx.all(node.execute(x) == x)
+        assert _counter == 3
+    assert mdp.get_active_extensions() == []
+
+
+def test_memory_cache_node_state():
+    """Test that the in-process cache depends on the node state."""
+    x = mdp.numx_rand.rand(50, 3)
+    node = mdp.nodes.PCANode()
+    node.train(x)
+    node.stop_training()
+    other = mdp.nodes.PCANode()
+    other.train(x[::-1] ** 2)
+    other.stop_training()
+    with mdp.caching.cache(backend='memory'):
+        assert_array_equal(node.execute(x), node.execute(x))
+        assert_array_almost_equal(other.execute(x),
+                                  mult(x - other.avg, other.v))
+        node.v = node.v[:, :2]
+        assert node.execute(x).shape == (50, 2)
+
+
+def test_memory_cache_instances():
+    """Test caching individual instances with the in-process cache."""
+    global _counter
+    x = mdp.numx.array([[13.]], dtype='d')
+    node = _CounterNode()
+    othernode = _CounterNode()
+    _counter = 0
+    with mdp.caching.cache(cache_instances=[node], backend='memory'):
+        assert node.is_cached()
+        assert not othernode.is_cached()
+        node.execute(x)
+        node.execute(x)
+        assert _counter == 1
+        node.set_instance_cache(False)
+        node.execute(x)
+        assert _counter == 2
+
+
+def test_lru_cache_budget():
+    from mdp.caching.caching_extension import _LRUCache
+    lru = _LRUCache(max_bytes=3*80)
+    arrays = [mdp.numx.zeros(10) + i for i in range(4)]
+    for i in range(3):
+        lru.set(i, arrays[i])
+    assert lru.nbytes == 240
+    # mark 0 as recently used, so that 1 is dropped
+    assert lru.get(0) is arrays[0]
+    lru.set(3, arrays[3])
+    assert len(lru) == 3
+    assert 1 not in lru
+    assert lru.get(1) is None
+    assert lru.nbytes == 240
+    # results larger than the budget are not cached at all
+    lru.set(4, mdp.numx.zeros(100))
+    assert 4 not in lru
+    assert len(lru) == 3
+
+
+@requires_joblib
+def test_memory_cache_spill():
+    """Test that the in-process cache falls back to the joblib cache."""
+    global _counter
+    x = mdp.numx.array([[17.]], dtype='d')
+    node = _CounterNode()
+    cachedir = tempfile.mkdtemp(prefix='mdp-tmp-joblib-cache.',
+                                dir=pytest.mdp_tempdirname)
+    _counter = 0
+    with mdp.caching.cache(cachedir=cachedir, backend='memory', spill=True):
+        node.execute(x)
+        node.execute(x)
+        assert _counter == 1
+    # a new in-process cache still finds the result on disk
+    with mdp.caching.cache(cachedir=cachedir, backend='memory', spill=True):
+        node.execute(x)
+        assert _counter == 1
+
+
+def test_node_fingerprint():
+    """Test that node fingerprints only depend on the node content."""
+    from mdp.caching.caching_extension import _node_fingerprint
+    x = mdp.numx_rand.rand(50, 3)
+    node = mdp.nodes.PCANode()
+    node.train(x)
+    node.stop_training()
+    node2 = mdp.nodes.PCANode()
+    node2.train(x)
+    node2.stop_training()
+    assert node._get_state_token() != node2._get_state_token()
+    assert _node_fingerprint(node) == _node_fingerprint(node2)
+    node2.v = node2.v[:, ::-1]
+    assert _node_fingerprint(node) != _node_fingerprint(node2)
+    # in place changes are detected as well
+    fingerprint = _node_fingerprint(node)
+    node.v *= 2
+    assert _node_fingerprint(node) != fingerprint
+    # nodes inside other nodes are compared by content as well
+    assert (_node_fingerprint(mdp.hinet.Layer([node])) ==
+            _node_fingerprint(mdp.hinet.Layer([node.copy()])))
+
+
+def test_node_fingerprint_unpicklable():
+    """Test fingerprints of nodes with lambdas and nested flows."""
+    from mdp.caching.caching_extension import _node_fingerprint, _fingerprint
+    node = mdp.nodes.GeneralExpansionNode([lambda x: x])
+    node2 = mdp.nodes.GeneralExpansionNode([lambda x: x**2])
+    assert _node_fingerprint(node) == _node_fingerprint(node.copy())
+    assert _node_fingerprint(node) != _node_fingerprint(node2)
+    # the state tokens of the nodes inside the flow are ignored
+    x = mdp.numx_rand.rand(50, 3)
+    pca = mdp.nodes.PCANode()
+    pca.train(x)
+    pca.stop_training()
+    flownode = mdp.hinet.FlowNode(mdp.Flow([pca]))
+    flownode2 = mdp.hinet.FlowNode(mdp.Flow([pca.copy()]))
+    assert _node_fingerprint(flownode) == _node_fingerprint(flownode2)
+    # dictionary keys which cannot be sorted
+    assert (_fingerprint({1: 'a', 'b': 2}) == _fingerprint({'b': 2, 1: 'a'}))
+    assert (_fingerprint({1: 'a', 'b': 2}) != _fingerprint({1: 'a', 'b': 3}))
+
+
+def test_memory_cache_node_change():
+    """Test that changing a node invalidates the in-process cache."""
+    x = mdp.numx_rand.rand(50, 3)
+    node = mdp.nodes.PCANode()
+    node.train(x)
+    node.stop_training()
+    with mdp.caching.cache(backend='memory'):
+        y1 = node.execute(x)
+        node.avg *= 2.
+        # in-place changes are only seen after reassignment
+        node.avg = node.avg
+        y2 = node.execute(x)
+        assert_array_almost_equal(y2, mult(x - node.avg, node.v))
+        assert not numx.allclose(y1, y2)
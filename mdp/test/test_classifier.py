@@ -182,3 +182,30 @@ def testKMeansClassifier():
             set(res1) != set(res2)
             ), ("Error in K-Means classifier. "
                 "This might be a bug or just a local minimum.")
+
+def testKMeansClassifier_minibatch():
+    k = KMeansClassifier(2, batch_size=20)
+    # well separated clusters, so that the seeding never fails
+    a1 = numx.random.rand(50, 2) - 100
+    a2 = numx.random.rand(50, 2) + 100
+    data = numx.concatenate([a1, a2])[numx_rand.permutation(100)]
+    for chunk in numx.split(data, 5):
+        k.train(chunk)
+    # the training data is not stored
+    assert len(k.data) == 0
+    k.stop_training()
+    res1 = k.label(a1)
+    res2 = k.label(a2)
+    assert (len(set(res1)) == 1 and
+            len(set(res2)) == 1 and
+            set(res1) != set(res2))
+    # the centroids are the means of the clusters
+    centroids = numx.sort(k._centroids, axis=0)
+    assert_array_almost_equal(centroids,
+                              [a1.mean(axis=0), a2.mean(axis=0)], 10)
+
+def testKMeansClassifier_not_enough_data():
+    k = KMeansClassifier(5)
+    k.train(numx.random.rand(3, 2))
+    with pytest.raises(mdp.TrainingException):
+        k.stop_training()
@@ -199,6 +199,41 @@ def test_HLLENode():
         assert numx.all(res[idx,0]-res[idx[0],0]<1e-2),\
                'Projection should be aligned as original space'
 
+def test_lle_nearest_neighbors():
+    from mdp.nodes.lle_nodes import _nearest_neighbors
+    data = numx_rand.random((60, 3))
+    queries = numx_rand.random((20, 3))
+    dist = ((queries[:, numx.newaxis, :] - data)**2).sum(axis=2)
+    assert_array_equal(_nearest_neighbors(data, queries, 5),
+                       dist.argsort(axis=1)[:, :5])
+    dist = ((data[:, numx.newaxis, :] - data)**2).sum(axis=2)
+    assert_array_equal(_nearest_neighbors(data, data, 5, skip_nearest=True),
+                       dist.argsort(axis=1)[:, 1:6])
+
+@pytest.mark.parametrize('node_class', [mdp.nodes.LLENode,
+                                        mdp.nodes.HLLENode])
+def test_LLENode_sparse_dense(node_class, monkeypatch):
+    pytest.importorskip('scipy.sparse')
+    import mdp.nodes.lle_nodes as lle_nodes
+    nt, ny = 20, 10
+    x, y, z, t = _s_shape_2D(nt, ny)
+    data = numx.asarray([x,y,z]).T
+    node = node_class(8, output_dim=2)
+    node.train(data)
+    node.stop_training()
+    if node_class is mdp.nodes.LLENode:
+        assert lle_nodes._sparse.issparse(node.W)
+    # the dense computation without scipy gives the same embedding
+    monkeypatch.setattr(lle_nodes, '_sparse', None)
+    dense_node = node_class(8, output_dim=2)
+    dense_node.train(data)
+    dense_node.stop_training()
+    for i in range(2):
+        proj = node.training_projection[:, i]
+        dense_proj = dense_node.training_projection[:, i]
+        assert_array_almost_equal(proj * numx.sign(proj[0]),
+                                  dense_proj * numx.sign(dense_proj[0]), 6)
+
 def test_XSFANode():
     T = 5000
     N = 3
@@ -37,6 +37,117 @@ def testFlow():
     rec = flow.inverse(out)
     assert_array_equal(rec,inp)
 
+def testFlow_iexecute():
+    chunks = [numx.ones((10, 3))*i for i in range(4)]
+    flow = _get_default_flow()
+    results = flow.iexecute(chunks)
+    # the result is a generator processing one chunk at a time
+    assert not isinstance(results, list)
+    for x, y in zip(chunks, results):
+        assert_array_equal(y, (2**len(flow))*x)
+    for x, y in zip(chunks, flow.iinverse(flow.iexecute(chunks))):
+        assert_array_equal(y, x)
+    assert_array_equal(numx.concatenate(list(flow.iexecute(chunks, 0))),
+                       flow.execute(chunks, 0))
+    pytest.raises(mdp.FlowException, list, flow.iexecute([]))
+
+def testFlow_execute_out():
+    chunks = [uniform((10, 3)) for _ in range(4)]
+    flow = _get_default_flow()
+    out = numx.zeros((50, 3))
+    res = flow.execute(chunks, out=out)
+    assert_array_equal(res, flow.execute(chunks))
+    assert res.base is out
+    assert_array_equal(out[40:], 0)
+    filename = os.path.join(pytest.mdp_tempdirname, 'flow_out.dat')
+    out = numx.memmap(filename, dtype='d', mode='w+', shape=(40, 3))
+    res = flow.inverse(flow.iexecute(chunks), out=out)
+    assert_array_almost_equal(res, numx.concatenate(chunks))
+    del out, res
+    pytest.raises(mdp.FlowException, flow.execute, chunks,
+                  out=numx.zeros((30, 3)))
+
+def testFlow_freeze_execute():
+    x = uniform((100, 5))
+    flow = mdp.Flow([mdp.nodes.PCANode(output_dim=4),
+                     mdp.nodes.SFANode(dtype='f'),
+                     mdp.nodes.PolynomialExpansionNode(2, dtype='f')])
+    flow.train(x)
+    frozen = flow.freeze_execute()
+    for i in range(3):
+        assert_array_equal(frozen(x[i:i+1]), flow.execute(x[i:i+1]))
+    assert frozen(x[:1]).dtype == numx.dtype('f')
+    assert_array_equal(flow.freeze_execute(1)(x), flow.execute(x, 1))
+    # errors are reported with the number of the failing node
+    pytest.raises(mdp.FlowException, frozen, x[:, :2])
+    # all nodes must be trained
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode()])
+    pytest.raises(mdp.FlowException, flow.freeze_execute)
+
+def testFlow_fuse_affine_nodes():
+    x = uniform((500, 6))
+    x[:, 1:] += 0.1*numx.cumsum(numx_rand.normal(size=(500, 5)), axis=0)
+    y = uniform((500, 2))
+    flow = mdp.Flow([mdp.nodes.PCANode(),
+                     mdp.nodes.WhiteningNode(),
+                     mdp.hinet.Switchboard(6, numx.arange(6)[::-1]),
+                     mdp.nodes.SFANode(output_dim=5),
+                     mdp.nodes.IdentityNode(),
+                     mdp.nodes.SFA2Node(output_dim=4),
+                     mdp.nodes.PCANode(),
+                     mdp.nodes.LinearRegressionNode()])
+    flow.train([[x]]*7 + [[(x, y)]])
+    fused = flow.fuse_affine_nodes()
+    # SFA2Node is not affine although it is an SFANode
+    assert [type(node) for node in fused] == [mdp.nodes.AffineNode,
+                                              mdp.nodes.SFA2Node,
+                                              mdp.nodes.AffineNode]
+    assert fused[0].nodes == flow[:5].flow
+    assert_array_almost_equal(fused(x), flow(x))
+    # the inverse is computed with the original nodes
+    flow = flow[:5]
+    fused = flow.fuse_affine_nodes()
+    assert len(fused) == 1
+    assert_array_almost_equal(fused.inverse(fused(x)), flow.inverse(flow(x)))
+    # untrained nodes and expansions of a reduced space are not fused
+    flow = mdp.Flow([mdp.nodes.PCANode(output_dim=1),
+                     mdp.nodes.LinearRegressionNode()])
+    flow.train([[x], [(x, uniform((500, 6)))]])
+    fused = flow.fuse_affine_nodes()
+    assert fused.flow == flow.flow
+    flow = mdp.Flow([mdp.nodes.PCANode(), mdp.nodes.SFANode()])
+    assert flow.fuse_affine_nodes().flow == flow.flow
+
+def testFlow_fuse_affine_nodes_index_maps():
+    x = uniform((100, 6))
+    perm = numx_rand.permutation(6)
+    # nodes which only select columns are not turned into matrices
+    flow = mdp.Flow([mdp.hinet.Switchboard(6, perm),
+                     mdp.nodes.IdentityNode(),
+                     mdp.hinet.Switchboard(6, perm[::-1])])
+    flow(x)
+    assert flow.fuse_affine_nodes().flow == flow.flow
+    # but they are fused into the rows or columns of an adjacent matrix
+    pca = mdp.nodes.PCANode()
+    pca.train(x)
+    pca.stop_training()
+    flow = mdp.Flow([mdp.hinet.Switchboard(6, numx.r_[perm, perm[:2]]),
+                     mdp.nodes.IdentityNode(),
+                     mdp.hinet.Switchboard(8, numx.arange(8)[2:]),
+                     pca,
+                     mdp.hinet.Switchboard(6, [5, 0, 1]),
+                     mdp.nodes.IdentityNode()])
+    y = flow(x)
+    fused = flow.fuse_affine_nodes()
+    assert len(fused) == 1
+    assert fused[0].W.shape == (6, 3)
+    assert_array_almost_equal(fused(x), y)
+    # unless the matrix would get larger
+    flow = mdp.Flow([mdp.hinet.Switchboard(12, numx.arange(6)), pca])
+    flow(uniform((10, 12)))
+    fused = flow.fuse_affine_nodes()
+    assert fused.flow == flow.flow
+
 def testFlow_copy():
     dummy_list = [1,2,3]
     flow = _get_default_flow()
@@ -344,3 +455,67 @@ def testgenerator():
         raise Exception('Expected mdp.FlowException')
     except mdp.FlowException:
         pass
+
+
+class _CountingNode(mdp.Node):
+    """Trainable node that counts how often it is executed."""
+    def __init__(self, input_dim=None, output_dim=None, dtype=None):
+        super(_CountingNode, self).__init__(input_dim, output_dim, dtype)
+        self.n_execute = 0
+        self.sum_x = 0.
+
+    def _train(self, x):
+        self.sum_x += x.sum()
+
+    def _execute(self, x):
+        self.n_execute += 1
+        return 2*x
+
+
+@pytest.mark.parametrize('cache_mode', ['memory', 'disk', 'mmap'])
+def testFlow_train_cache(cache_mode):
+    chunks = [uniform((20, 3)) for _ in range(4)]
+    ref_flow = mdp.Flow([_CountingNode() for _ in range(4)])
+    ref_flow.train([chunks]*len(ref_flow))
+    flow = mdp.Flow([_CountingNode() for _ in range(4)])
+    flow.train([chunks]*len(flow), cache_mode=cache_mode,
+               cache_dir=pytest.mdp_tempdirname)
+    for node, ref_node in zip(flow, ref_flow):
+        assert_almost_equal(node.sum_x, ref_node.sum_x)
+    # without caching node #0 is executed for each following node,
+    # with caching every node except the last one is executed once
+    assert ref_flow[0].n_execute == 3*len(chunks)
+    for node in flow[:-1]:
+        assert node.n_execute == len(chunks)
+    assert flow[-1].n_execute == 0
+    assert_array_equal(flow.execute(chunks), ref_flow.execute(chunks))
+
+def testFlow_train_cache_different_iterables():
+    chunks1 = [uniform((20, 3)) for _ in range(2)]
+    chunks2 = [uniform((20, 3)) for _ in range(2)]
+    flow = mdp.Flow([_CountingNode() for _ in range(3)])
+    flow.train([chunks1, chunks1, chunks2], cache_mode='memory')
+    ref_flow = mdp.Flow([_CountingNode() for _ in range(3)])
+    ref_flow.train([chunks1, chunks1, chunks2])
+    for node, ref_node in zip(flow, ref_flow):
+        assert_almost_equal(node.sum_x, ref_node.sum_x)
+
+def testFlow_train_cache_supervised():
+    samples = mdp.numx_rand.random((100, 5))
+    labels = mdp.numx.arange(100) % 3
+    iterable = [(samples[:50], labels[:50]), (samples[50:], labels[50:])]
+    def get_flow():
+        return mdp.Flow([mdp.nodes.PolynomialExpansionNode(2),
+                         mdp.nodes.FDANode(output_dim=3),
+                         mdp.nodes.FDANode()])
+    flow = get_flow()
+    flow.train([None, iterable, iterable], cache_mode='mmap')
+    ref_flow = get_flow()
+    ref_flow.train([None, iterable, iterable])
+    assert_array_almost_equal(abs(flow.execute(samples)),
+                              abs(ref_flow.execute(samples)))
+
+def testFlow_train_cache_wrong_mode():
+    flow = _get_default_flow(node_class=BogusNodeTrainable)
+    pytest.raises(mdp.FlowException, flow.train, numx.zeros((10, 2)),
+                  cache_mode='bogus')
@@ -208,6 +208,45 @@ def test_clonelayer():
     assert y.dtype == layer.dtype
 
 
+class _CountingSFANode(mdp.nodes.SFANode):
+    """SFANode counting its training calls."""
+
+    n_train_calls = 0
+
+    def _train(self, x, *args, **kwargs):
+        self.n_train_calls += 1
+        super(_CountingSFANode, self)._train(x, *args, **kwargs)
+
+
+def test_clonelayer_stacked_training():
+    x = numx_rand.random([100, 30])
+    # the training of a row independent node is done in a single call
+    layer = mh.CloneLayer(mdp.nodes.PCANode(input_dim=10, output_dim=5), 3)
+    layer.train(x)
+    layer.stop_training()
+    node = mdp.nodes.PCANode(input_dim=10, output_dim=5)
+    for i in range(3):
+        node.train(x[:, i*10:(i+1)*10])
+    node.stop_training()
+    assert_array_almost_equal(abs(layer.node.v), abs(node.v), 10)
+    assert_array_almost_equal(layer.execute(x),
+                              numx.hstack([node.execute(x[:, i*10:(i+1)*10])
+                                           for i in range(3)]), 10)
+    # other nodes are trained separately for every clone
+    sfa_node = _CountingSFANode(input_dim=10, output_dim=5)
+    assert not sfa_node.is_row_independent()
+    layer = mh.CloneLayer(sfa_node, 3)
+    layer.train(x)
+    assert sfa_node.n_train_calls == 3
+    # a flownode is row independent if all its nodes are
+    flownode = mh.FlowNode(mdp.nodes.PolynomialExpansionNode(2, input_dim=3) +
+                           mdp.nodes.PCANode(output_dim=4))
+    assert flownode.is_row_independent()
+    flownode = mh.FlowNode(mdp.nodes.PCANode(input_dim=3) +
+                           mdp.nodes.SFANode())
+    assert not flownode.is_row_independent()
+
+
 def test_switchboard_inverse1():
     sboard = mh.Switchboard(input_dim=3,
                             connections=[2, 0, 1])
@@ -504,6 +543,76 @@ def test_hinet_simple_net():
     x = numx_rand.random([5, switchboard.input_dim])
     flow.train(x)
 
+@pytest.mark.parametrize('switchboard', [
+    mh.Rectangular2dSwitchboard(in_channels_xy=(12, 8), field_channels_xy=4,
+                                field_spacing_xy=2, in_channel_dim=3),
+    mh.Rectangular2dSwitchboard(in_channels_xy=(9, 6), field_channels_xy=3,
+                                field_spacing_xy=3, in_channel_dim=2),
+    mh.DoubleRect2dSwitchboard(in_channels_xy=(8, 6), field_channels_xy=2,
+                               in_channel_dim=2)])
+def test_switchboard_clonelayer(switchboard):
+    x = numx_rand.random([50, switchboard.input_dim])
+    node = mdp.nodes.PCANode(input_dim=switchboard.out_channel_dim,
+                             output_dim=3)
+    flow = mdp.Flow([switchboard,
+                     mh.CloneLayer(node, switchboard.output_channels)])
+    flow.train(x)
+    # the small memory limit forces several chunks
+    fused_node = mdp.nodes.PCANode(input_dim=switchboard.out_channel_dim,
+                                   output_dim=3)
+    layer = mh.SwitchboardCloneLayer(switchboard, fused_node,
+                                     max_memory=switchboard.output_dim * 80)
+    assert layer.input_dim == switchboard.input_dim
+    layer.train(x)
+    layer.stop_training()
+    assert_array_almost_equal(abs(node.v), abs(fused_node.v), 10)
+    # use the same node, to avoid the sign ambiguity of the eigenvectors
+    layer.node.v = node.v
+    y = layer.execute(x)
+    assert_array_almost_equal(flow.execute(x), y, 10)
+    if switchboard.is_invertible():
+        assert layer.is_invertible()
+        assert_array_almost_equal(layer.inverse(y), flow.inverse(y), 10)
+
+
+def test_switchboard_clonelayer_field_view():
+    switchboard = mh.Rectangular2dSwitchboard(in_channels_xy=(12, 8),
+                                              field_channels_xy=4,
+                                              field_spacing_xy=2,
+                                              in_channel_dim=3)
+    layer = mh.SwitchboardCloneLayer(
+                switchboard, mdp.nodes.IdentityNode(input_dim=48))
+    assert layer._field_view_params is not None
+    x = numx_rand.random([5, switchboard.input_dim])
+    assert_array_equal(layer.execute(x), switchboard.execute(x))
+    # the strided view also works for non-contiguous data
+    x = numx_rand.random([10, switchboard.input_dim])[::2]
+    assert_array_equal(layer.execute(x), switchboard.execute(x))
+
+
+def test_switchboard_clonelayer_sfa():
+    switchboard = mh.Rectangular2dSwitchboard(in_channels_xy=(6, 4),
+                                              field_channels_xy=2)
+    x = numx_rand.random([100, switchboard.input_dim])
+    node = mdp.nodes.SFANode(input_dim=4, output_dim=2)
+    flow = mdp.Flow([switchboard,
+                     mh.CloneLayer(node, switchboard.output_channels)])
+    flow.train(x)
+    fused_node = mdp.nodes.SFANode(input_dim=4, output_dim=2)
+    layer = mh.SwitchboardCloneLayer(switchboard, fused_node)
+    layer.train(x)
+    layer.stop_training()
+    assert_array_almost_equal(abs(node.sf), abs(fused_node.sf), 8)
+
+
+def test_switchboard_clonelayer_wrong_dim():
+    switchboard = mh.Rectangular2dSwitchboard(in_channels_xy=(6, 4),
+                                              field_channels_xy=2)
+    with pytest.raises(mdp.NodeException):
+        mh.SwitchboardCloneLayer(switchboard,
+                                 mdp.nodes.PCANode(input_dim=5))
+
+
 @pytest.fixture
 def noisenode():
     return mdp.nodes.NoiseNode(input_dim=20 * 20, noise_args=(0, 0.0001))
@@ -1,5 +1,7 @@
 from builtins import range
+import copy
 from ._tools import *
+from mdp.utils.covariance import _CompensatedComoment, _symmetric_product
 
 TESTYPES = [numx.dtype('d'), numx.dtype('f')]
 
@@ -91,6 +93,143 @@ def testRoundOffWarningCovMatrix():
     # hope to reset the previous state...
     warnings.filterwarnings("once",'.*',mdp.MDPWarning)
 
+@pytest.mark.parametrize('bias', [False, True])
+def testCompensatedCovarianceMatrices(bias, monkeypatch):
+    # use small blocks to merge many of them
+    monkeypatch.setattr(_CompensatedComoment, 'block_len', 7)
+    inp = uniform((300, 4)) + 10.
+    inp2 = uniform((300, 3))
+    def collect(cov, *args):
+        for start in range(0, 300, 100):
+            cov.update(*[a[start:start+100] for a in args])
+        return cov
+    pairs = [(utils.CovarianceMatrix(bias=bias), (inp,)),
+             (utils.DelayCovarianceMatrix(3, bias=bias), (inp,)),
+             (utils.CrossCovarianceMatrix(bias=bias), (inp, inp2))]
+    for plain, args in pairs:
+        comp = copy.deepcopy(plain)
+        comp.compensated = True
+        des = collect(plain, *args).fix()
+        act = collect(comp, *args).fix()
+        for d, a in zip(des, act):
+            assert_array_almost_equal(a, d, 10)
+    # second moments
+    plain = collect(utils.CovarianceMatrix(bias=bias), inp)
+    comp = collect(utils.CovarianceMatrix(bias=bias, compensated=True), inp)
+    assert_array_almost_equal(comp.fix(center=False)[0],
+                              plain.fix(center=False)[0], 10)
+
+@pytest.mark.parametrize('compensated', [False, True])
+def testCovarianceMatricesMerge(compensated):
+    inp = uniform((500, 4))
+    inp2 = uniform((500, 3))
+    for cov_class, args in [
+            (utils.CovarianceMatrix, (inp,)),
+            (lambda **kwargs: utils.DelayCovarianceMatrix(3, **kwargs),
+             (inp,)),
+            (utils.CrossCovarianceMatrix, (inp, inp2))]:
+        # merging must give the same result as updating with both blocks
+        cov = cov_class(compensated=compensated)
+        cov.update(*[a[:123] for a in args])
+        cov.update(*[a[123:] for a in args])
+        cov1 = cov_class(compensated=compensated)
+        cov1.update(*[a[:123] for a in args])
+        cov2 = cov_class(compensated=compensated)
+        cov2.update(*[a[123:] for a in args])
+        cov1._merge(cov2)
+        for d, a in zip(cov.fix(), cov1.fix()):
+            assert_array_almost_equal(a, d, 10)
+
+@pytest.mark.parametrize('compensated', [False, True])
+def testCovarianceMatricesMergeEmpty(compensated):
+    inp = uniform((500, 4))
+    inp2 = uniform((500, 3))
+    for cov_class, args in [
+            (utils.CovarianceMatrix, (inp,)),
+            (lambda **kwargs: utils.DelayCovarianceMatrix(3, **kwargs),
+             (inp,)),
+            (utils.CrossCovarianceMatrix, (inp, inp2))]:
+        cov = cov_class(compensated=compensated)
+        cov.update(*args)
+        # a fork that received no data
+        cov1 = cov_class(compensated=compensated)
+        cov1.update(*args)
+        cov1._merge(cov_class(compensated=compensated))
+        for d, a in zip(cov.fix(), cov1.fix()):
+            assert_array_almost_equal(a, d, 10)
+        # merging into an instance that received no data
+        cov1 = cov_class(compensated=compensated)
+        cov2 = cov_class(compensated=compensated)
+        cov2.update(*args)
+        cov1._merge(cov2)
+        # the data is not shared with the merged instance
+        cov2.update(*args)
+        cov = cov_class(compensated=compensated)
+        cov.update(*args)
+        cov.update(*args)
+        cov1.update(*args)
+        for d, a in zip(cov.fix(), cov1.fix()):
+            assert_array_almost_equal(a, d, 10)
+
+def testCompensatedCovarianceMatrixSinglePrecision():
+    # large offset and many blocks make plain single precision sums fail
+    mat, mix, inp = get_random_mix(mat_dim=(100000, 3))
+    inp += 100.
+    des_cov = numx.cov(inp, rowvar=0)
+    act_cov = utils.CovarianceMatrix(dtype='f', compensated=True)
+    for start in range(0, 100000, 10000):
+        act_cov.update(inp[start:start+10000].astype('f'))
+    act_cov, act_avg, act_tlen = act_cov.fix()
+    assert_type_equal(act_cov.dtype, 'f')
+    assert_array_almost_equal(act_avg, inp.mean(axis=0), 4)
+    assert_array_almost_equal(act_cov / des_cov, numx.ones((3, 3)), 5)
+
+def testMultiLagCovarianceMatrix():
+    lags = [1, 3, 0, 12]
+    inp = uniform((300, 4))
+    cov = utils.MultiLagCovarianceMatrix(lags)
+    # blocks shorter and longer than the largest lag
+    for start, stop in [(0, 2), (2, 10), (10, 150), (150, 151), (151, 300)]:
+        cov.update(inp[start:stop])
+    covs, avgs, avgs_dt, tlens = cov.fix()
+    for i, dt in enumerate(lags):
+        des = utils.DelayCovarianceMatrix(dt)
+        des.update(inp)
+        des_cov, des_avg, des_avg_dt, des_tlen = des.fix()
+        assert_array_almost_equal(covs[i], des_cov, decimal)
+        assert_array_almost_equal(avgs[i], des_avg, decimal)
+        assert_array_almost_equal(avgs_dt[i], des_avg_dt, decimal)
+        assert tlens[i] == des_tlen
+
+def testMultiLagCovarianceMatrixTransform():
+    A = uniform((4, 4)).astype("f")
+    inp = uniform((100, 4))
+    cov = utils.MultiLagCovarianceMatrix([2, 5], dtype='f')
+    cov.update(inp)
+    covs = cov.fix(A)[0]
+    assert_type_equal(covs.dtype, 'f')
+    des = utils.DelayCovarianceMatrix(5, dtype='f')
+    des.update(inp)
+    assert_array_almost_equal(covs[1], des.fix(A)[0], 4)
+
+def testMultiLagCovarianceMatrixNotEnoughData():
+    cov = utils.MultiLagCovarianceMatrix([1, 5])
+    cov.update(uniform((6, 3)))
+    pytest.raises(mdp.MDPException, cov.fix)
+
+def testSymmetricProduct():
+    x = uniform((50, 12))
+    des = mult(x.T, x)
+    # non-contiguous input
+    assert_array_almost_equal(_symmetric_product(x[:, ::2]), des[::2, ::2])
+    assert_array_almost_equal(_symmetric_product(x), des)
+    weights = uniform(50)
+    des = mult(x.T, x * weights[:, numx.newaxis])
+    assert_array_almost_equal(_symmetric_product(x, weights), des)
+    weights -= 0.5
+    des = mult(x.T, x * weights[:, numx.newaxis])
+    assert_array_almost_equal(_symmetric_product(x, weights), des)
+
 def testMultipleCovarianceMatricesDtypeAndFuncs():
     for type in TESTYPES:
         dec = testdecimals[type]
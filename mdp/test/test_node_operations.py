@@ -82,3 +82,54 @@ def test_Node_execution_without_training():
     node = BogusMultiNode()
     node.execute(x)
     assert node.visited == [1, 2, 3, 4]
+
+def test_Node_state_token():
+    node = mdp.nodes.PCANode()
+    token = node._get_state_token()
+    assert node._get_state_token() == token
+    # training changes the token, also without attribute assignment
+    node.train(uniform(size=MAT_DIM))
+    token2 = node._get_state_token()
+    assert token2 != token
+    node.stop_training()
+    token3 = node._get_state_token()
+    assert token3 not in (token, token2)
+    # execution does not change the state
+    node.execute(uniform(size=MAT_DIM))
+    assert node._get_state_token() == token3
+    # copies share the token until they are modified
+    copy_node = node.copy()
+    assert copy_node._get_state_token() == token3
+    copy_node.v = copy_node.v[:, :2]
+    assert copy_node._get_state_token() != token3
+    assert node._get_state_token() == token3
+    del node.v
+    assert node._get_state_token() != token3
+
+def test_Node_state_token_of_internal_nodes():
+    node = mdp.nodes.PCANode(output_dim=2)
+    node.train(uniform(size=MAT_DIM))
+    for container in (mdp.hinet.Layer([node]),
+                      mdp.hinet.FlowNode(mdp.Flow([node]))):
+        token = container._get_state_token()
+        node.dummy_attr = 1
+        assert container._get_state_token() != token
+
+def test_Node_freeze_execute():
+    x = uniform(size=MAT_DIM)
+    node = mdp.nodes.PCANode(output_dim=3)
+    pytest.raises(mdp.TrainingException, node.freeze_execute)
+    node.train(x)
+    # the training is stopped as in execute
+    frozen = node.freeze_execute()
+    assert not node.is_training()
+    assert mdp.numx.all(frozen(x[:1]) == node.execute(x[:1]))
+    assert mdp.numx.all(frozen(x, n=2) == node.execute(x, n=2))
+    # the input is cast to the node dtype
+    assert frozen(x.astype('f')).dtype == node.dtype
+    # dimension and dtype of untrainable nodes must be known
+    node = mdp.nodes.PolynomialExpansionNode(2)
+    pytest.raises(mdp.NodeException, node.freeze_execute)
+    node = mdp.nodes.PolynomialExpansionNode(2, input_dim=5, dtype='d')
+    assert mdp.numx.all(node.freeze_execute()(x) == node.execute(x))
+    assert node.output_dim == 20
@@ -379,6 +379,8 @@ def CCIPCANode_inp_arg_gen():
          init_args=[[[0.]*5, [0.]*5], [1., 1.]]),
     dict(klass='GeneralExpansionNode',
          init_args=[[lambda x:x, lambda x: x**2, _dumb_quadratic_expansion]]),
+    dict(klass='AffineNode',
+         init_args=[lambda: uniform((5, 3)), lambda: uniform(3)]),
     dict(klass='HitParadeNode',
          init_args=[2, 5]),
     dict(klass='TimeFramesNode',
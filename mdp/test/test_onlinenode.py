@@ -126,3 +126,39 @@ def test_numx_rng():
     assert(node.numx_rng == rng)
 
 
+
+class _SampleCCIPCANode(mdp.nodes.CCIPCANode):
+    # a subclass changing _train must not use the inherited _train_block
+    def _train(self, x):
+        self.n_samples = getattr(self, 'n_samples', 0) + 1
+        super(_SampleCCIPCANode, self)._train(x)
+
+def test_train_block_not_inherited():
+    node = _SampleCCIPCANode(output_dim=2)
+    node.train(mdp.numx_rand.random((10, 4)))
+    assert node.n_samples == 10
+    assert node.get_current_train_iteration() == 10
+
+@pytest.mark.parametrize('node_class, kwargs, attrs', [
+    (mdp.nodes.CCIPCANode, {'output_dim': 3}, ['v', 'd', '_var_tot']),
+    (mdp.nodes.CCIPCAWhiteningNode, {'output_dim': 3}, ['v', 'd']),
+    (mdp.nodes.MCANode, {'output_dim': 3}, ['v', 'd']),
+    (mdp.nodes.MCANode, {'output_dim': 3, 'normalize': False}, ['v', 'd']),
+    (mdp.nodes.OnlineCenteringNode, {}, ['avg']),
+    (mdp.nodes.OnlineCenteringNode, {'avg_n': 5}, ['avg']),
+    (mdp.nodes.OnlineTimeDiffNode, {}, ['x_prev', 'x_cur'])])
+def test_train_block(node_class, kwargs, attrs):
+    x = mdp.numx_rand.random((100, 5)) - 0.5
+    block_node = node_class(numx_rng=mdp.numx_rand.RandomState(1), **kwargs)
+    sample_node = node_class(numx_rng=mdp.numx_rand.RandomState(1), **kwargs)
+    assert block_node._uses_train_block()
+    # train the other node with the generic sample by sample loop
+    sample_node._uses_train_block = lambda: False
+    for chunk in [x[:1], x[1:30], x[30:31], x[31:]]:
+        block_node.train(chunk)
+        sample_node.train(chunk)
+        assert (block_node.get_current_train_iteration() ==
+                sample_node.get_current_train_iteration())
+        for attr in attrs:
+            assert_array_almost_equal(getattr(block_node, attr),
+                                      getattr(sample_node, attr), 10)
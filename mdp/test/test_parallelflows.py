@@ -34,6 +34,54 @@ def test_non_iterator():
     x = n.random.random((100,10))
     flow.execute(x)
 
+def test_tree_join():
+    """Test parallel training with the pairwise join of the results."""
+    data_iterables = [[n.random.random((30,10))*n.arange(1,11)
+                       for _ in range(7)],
+                      None,
+                      [n.random.random((30,10))*n.arange(1,11)
+                       for _ in range(7)]]
+    flow = mdp.Flow([mdp.nodes.SFANode(output_dim=5),
+                     mdp.nodes.PolynomialExpansionNode(degree=3),
+                     mdp.nodes.SFANode(output_dim=20)])
+    flow.train(data_iterables)
+    for scheduler in [parallel.Scheduler(),
+                      parallel.ThreadScheduler(n_threads=3)]:
+        parallel_flow = parallel.ParallelFlow(
+                                [mdp.nodes.SFANode(output_dim=5),
+                                 mdp.nodes.PolynomialExpansionNode(degree=3),
+                                 mdp.nodes.SFANode(output_dim=20)])
+        parallel_flow.train(data_iterables, scheduler=scheduler,
+                            tree_join=True)
+        scheduler.shutdown()
+        assert isinstance(scheduler.result_container,
+                          parallel.ListResultContainer)
+        assert parallel_flow[0].tlen == flow[0].tlen
+        assert parallel_flow[2].tlen == flow[2].tlen
+        x = n.random.random((10,10))
+        assert_array_almost_equal(abs(flow.execute(x)),
+                                  abs(parallel_flow.execute(x)), 6)
+
+def test_tree_join_tasks():
+    """Test that the tree join is done by pairwise join tasks."""
+    class JoinCountScheduler(parallel.Scheduler):
+        def __init__(self, **kwargs):
+            super(JoinCountScheduler, self).__init__(**kwargs)
+            self.n_joins = []
+        def _process_task(self, data, task_callable, task_index):
+            if isinstance(task_callable, parallel.FlowJoinCallable):
+                self.n_joins.append(len(data))
+            super(JoinCountScheduler, self)._process_task(
+                                        data, task_callable, task_index)
+    scheduler = JoinCountScheduler()
+    flow = parallel.ParallelFlow([mdp.nodes.PCANode(output_dim=5)])
+    data_iterable = [n.random.random((30,10)) for _ in range(7)]
+    flow.train([data_iterable], scheduler=scheduler, tree_join=True)
+    scheduler.shutdown()
+    # 7 -> 4 -> 2 -> 1 flownodes
+    assert scheduler.n_joins == [2] * 6
+    assert flow[0].tlen == 210
+
 def test_multiple_schedulers():
     """Test parallel flow training with multiple schedulers."""
     flow = parallel.ParallelFlow([
@@ -75,6 +75,32 @@ def test_parallelnet(self):
         scheduler = parallel.Scheduler()
         flow.train(data_iterables, scheduler=scheduler)
 
+    def test_switchboard_clonelayer(self):
+        """Test ParallelSwitchboardCloneLayer trained via a ParallelFlow."""
+        switchboard = hinet.Rectangular2dSwitchboard(in_channels_xy=10,
+                                                     field_channels_xy=4,
+                                                     field_spacing_xy=2)
+        data_iterables = [[n.random.random((20, 10*10)) for _ in range(5)]]
+        flow = mdp.Flow([hinet.SwitchboardCloneLayer(
+                            switchboard,
+                            mdp.nodes.PCANode(input_dim=16, output_dim=3))])
+        flow.train(data_iterables)
+        layer = hinet.SwitchboardCloneLayer(switchboard,
+                                            mdp.nodes.PCANode(input_dim=16,
+                                                              output_dim=3),
+                                            max_memory=2000)
+        forked_layer = layer.fork()
+        assert forked_layer.switchboard is switchboard
+        assert forked_layer.max_memory == 2000
+        parallel_flow = parallel.ParallelFlow([layer])
+        scheduler = parallel.ThreadScheduler(n_threads=2)
+        parallel_flow.train(data_iterables, scheduler=scheduler)
+        scheduler.shutdown()
+        assert layer.node.tlen == flow[0].node.tlen
+        x = n.random.random((10, 10*10))
+        assert_array_almost_equal(abs(flow.execute(x)),
+                                  abs(parallel_flow.execute(x)), 6)
+
     def test_layer(self):
         """Test Simple random test with three nodes."""
         node1 = mdp.nodes.SFANode(input_dim=10, output_dim=5)
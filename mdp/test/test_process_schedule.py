@@ -2,6 +2,7 @@
 from ._tools import *
 
 import mdp.parallel as parallel
+from mdp.parallel.process_schedule import shared_memory
 n = numx
 
 def test_process_scheduler_shutdown():
@@ -43,6 +44,39 @@ def test_process_scheduler_no_cache():
     results = n.array(results)
     assert n.all(results == n.array([0,1,4,9,16,25,36,49]))
     
+def test_process_scheduler_exception():
+    """Test that a failing task is reported by get_results."""
+    scheduler = parallel.ProcessScheduler(verbose=False,
+                                          n_processes=1,
+                                          source_paths=None)
+    scheduler.add_task("a", parallel.SqrTestCallable())
+    scheduler.add_task(2)
+    pytest.raises(TypeError, scheduler.get_results)
+    # the process is still used for the next tasks
+    process = scheduler._processes[0]
+    for i in range(3):
+        scheduler.add_task(i)
+    assert sorted(scheduler.get_results()) == [0, 1, 4]
+    assert scheduler._processes[0] is process
+    scheduler.shutdown()
+
+def test_process_scheduler_restart():
+    """Test that a dead process is replaced for the next tasks."""
+    scheduler = parallel.ProcessScheduler(verbose=False,
+                                          n_processes=1,
+                                          source_paths=None)
+    process = scheduler._processes[0]
+    scheduler.add_task(2, parallel.SqrTestCallable())
+    assert list(scheduler.get_results()) == [4]
+    process.kill()
+    scheduler.add_task(3)
+    pytest.raises(Exception, scheduler.get_results)
+    for i in range(3):
+        scheduler.add_task(i)
+    assert sorted(scheduler.get_results()) == [0, 1, 4]
+    assert scheduler._processes[0] is not process
+    scheduler.shutdown()
+
 def test_process_scheduler_manager():
     """Test process scheduler with context manager itnerface."""
     with parallel.ProcessScheduler(n_processes=2,
@@ -96,3 +130,37 @@ def test_process_scheduler_mdp_version():
     # check that we get 2 identical dictionaries
     assert out[0] == out[1], 'Subprocesses did not run '\
         'the same MDP as the parent:\n%s\n--\n%s'%(out[0], out[1])
+
+@pytest.mark.skipif(shared_memory is None,
+                    reason="requires multiprocessing.shared_memory")
+def test_process_scheduler_shared_memory():
+    """Test process scheduler with arrays sent via shared memory."""
+    scheduler = parallel.ProcessScheduler(verbose=False,
+                                          n_processes=2,
+                                          source_paths=None,
+                                          shared_memory_threshold=100)
+    # the second size requires a larger segment
+    data = [mdp.numx_rand.random((50, 10)) for _ in range(3)]
+    data += [mdp.numx_rand.random((200, 10)) for _ in range(3)]
+    # small arrays are still pickled
+    data.append(n.arange(3))
+    for x in data:
+        scheduler.add_task(x, parallel.SqrTestCallable())
+    results = scheduler.get_results()
+    scheduler.shutdown()
+    for x, y in zip(data, results):
+        assert_array_equal(y, x**2)
+
+@pytest.mark.skipif(shared_memory is None,
+                    reason="requires multiprocessing.shared_memory")
+def test_process_scheduler_shared_memory_flow():
+    """Test parallel flow execution with the shared memory transport."""
+    flow = mdp.parallel.ParallelFlow([mdp.nodes.PCANode(output_dim=5),
+                                      mdp.nodes.SFANode()])
+    x = mdp.numx_rand.random((300, 10))
+    flow.train(x)
+    chunks = [x[i*100:(i+1)*100] for i in range(3)]
+    with parallel.ProcessScheduler(n_processes=2, source_paths=None,
+                                   shared_memory_threshold=0) as scheduler:
+        y = flow.execute(chunks, scheduler=scheduler)
+    assert_array_almost_equal(y, flow.execute(x))
@@ -49,6 +49,70 @@ def test_cpu_count():
     assert isinstance(n_cpus, int)
 
 
+def _negate(x):
+    return -x
+
+def test_thread_scheduler_many_tasks():
+    """Test thread scheduler with many small tasks and a callable change."""
+    scheduler = parallel.ThreadScheduler(n_threads=3)
+    threads = list(scheduler._threads)
+    for i in range(100):
+        scheduler.add_task(i, parallel.SqrTestCallable())
+    for i in range(100):
+        scheduler.add_task(i)
+    scheduler.add_task(3, _negate)
+    scheduler.add_task(4)
+    results = scheduler.get_results()
+    scheduler.shutdown()
+    assert not [thread for thread in threads if thread.is_alive()]
+    assert list(results) == 2 * [i**2 for i in range(100)] + [-3, -4]
+
+
+class _CountingCallable(parallel.TaskCallable):
+    """Stateful callable which returns the number of its calls."""
+
+    def __init__(self):
+        self.n_calls = 0
+
+    def __call__(self, data):
+        self.n_calls += 1
+        return self.n_calls
+
+
+def test_thread_scheduler_copy_callable():
+    """Test that every task gets a fresh copy of the callable."""
+    with parallel.ThreadScheduler(n_threads=2) as scheduler:
+        for i in range(6):
+            scheduler.add_task(i, _CountingCallable() if i == 0 else None)
+        assert list(scheduler.get_results()) == [1] * 6
+
+
+def test_thread_scheduler_exception():
+    """Test that failing tasks do not block the thread scheduler."""
+    scheduler = parallel.ThreadScheduler(n_threads=2)
+    for i in range(4):
+        scheduler.add_task("a", parallel.SqrTestCallable())
+    pytest.raises(TypeError, scheduler.get_results)
+    # the threads are still available
+    for i in range(4):
+        scheduler.add_task(i, parallel.SqrTestCallable())
+    assert list(scheduler.get_results()) == [0, 1, 4, 9]
+    scheduler.shutdown()
+
+
+def test_thread_scheduler_threads():
+    """Test that the threads only run between the first task and shutdown."""
+    import threading
+    n_threads = threading.active_count()
+    scheduler = parallel.ThreadScheduler(n_threads=3)
+    assert threading.active_count() == n_threads
+    scheduler.add_task(2, parallel.SqrTestCallable())
+    assert threading.active_count() == n_threads + 3
+    assert list(scheduler.get_results()) == [4]
+    scheduler.shutdown()
+    assert threading.active_count() == n_threads
+
+
 def test_thread_scheduler_flow():
     """Test thread scheduler with real Nodes."""
     precision = 6
@@ -85,6 +85,30 @@ def test_mult_diag():
     res2 = utils.mult_diag(d, mtx, left=False)
     assert_array_almost_equal(res1, res2, 10)
 
+def test_sqdist():
+    x = numx_rand.random((20, 4))
+    y = numx_rand.random((7, 4))
+    dist = ((x[:, numx.newaxis, :] - y[numx.newaxis, :, :])**2).sum(axis=2)
+    assert_array_almost_equal(utils.sqdist(x, y), dist, 10)
+    y_sqnorms = (y**2).sum(axis=1)
+    assert_array_almost_equal(utils.sqdist(x, y, y_sqnorms), dist, 10)
+    assert numx.all(utils.sqdist(x, x) >= 0)
+
+def test_sqdist_shift():
+    # far from the origin the unshifted terms cancel in single precision
+    x = (numx_rand.random((20, 4)) + 1000.).astype('f')
+    y = (numx_rand.random((7, 4)) + 1000.).astype('f')
+    xd, yd = x.astype('d'), y.astype('d')
+    dist = ((xd[:, numx.newaxis, :] - yd[numx.newaxis, :, :])**2).sum(axis=2)
+    assert_array_almost_equal(utils.sqdist(x, y) / dist, 1., 3)
+    shift = y.mean(axis=0)
+    y_sqnorms = ((y - shift)**2).sum(axis=1)
+    assert_array_almost_equal(utils.sqdist(x, y, y_sqnorms, shift) / dist,
+                              1., 3)
+    # without the shift the relative error is large
+    y_sqnorms = (y**2).sum(axis=1)
+    assert abs(utils.sqdist(x, y, y_sqnorms) / dist - 1.).max() > 1e-2
+
 def test_symeig_fake_integer():
     a = numx.array([[1,2],[2,7]])
     b = numx.array([[3,1],[1,5]])
@@ -4,7 +4,7 @@
 __docformat__ = "restructuredtext en"
 
 from .routines import (timediff, refcast, scast, rotate, random_rot,
-                       permute, symrand, norm2, cov2,
+                       permute, symrand, norm2, sqdist, cov2,
                        mult_diag, comb, sqrtm, get_dtypes, nongeneral_svd,
                        hermitian, cov_maxima,
                        lrep, rrep, irep, orthogonal_permutations,
@@ -26,7 +26,7 @@
 from .quad_forms import QuadraticForm, QuadraticFormException
 from .covariance import (CovarianceMatrix, VartimeCovarianceMatrix,
                          DelayCovarianceMatrix, MultipleCovarianceMatrices,
-                         CrossCovarianceMatrix)
+                         CrossCovarianceMatrix, MultiLagCovarianceMatrix)
 from .progress_bar import progressinfo
 from .slideshow import (basic_css, slideshow_css, HTMLSlideShow,
                         image_slideshow_css, ImageHTMLSlideShow,
@@ -101,11 +101,13 @@ def svd(x, compute_uv=True):
 
 __all__ = ['CovarianceMatrix', 'VartimeCovarianceMatrix',
            'DelayCovarianceMatrix', 'CrossCovarianceMatrix',
+           'MultiLagCovarianceMatrix',
            'MultipleCovarianceMatrices', 'QuadraticForm',
            'QuadraticFormException',
            'comb', 'cov2', 'dig_node', 'get_dtypes', 'get_node_size',
            'hermitian', 'inv', 'mult', 'mult_diag', 'nongeneral_svd',
            'norm2', 'permute', 'pinv', 'progressinfo',
+           'sqdist',
            'random_rot', 'refcast', 'rotate', 'scast', 'solve', 'sqrtm',
            'svd', 'symrand', 'timediff', 'matmult',
            'HTMLSlideShow', 'ImageHTMLSlideShow',
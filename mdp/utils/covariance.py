@@ -1,5 +1,7 @@
+from __future__ import division
 from builtins import range
 from builtins import object
+import copy
 import mdp
 import warnings
 
@@ -24,29 +26,125 @@ def _check_roundoff(t, dtype):
         warnings.warn(wr, mdp.MDPWarning)
 
 
+def _symmetric_product(x, weights=None):
+    """Return the symmetric matrix x^T diag(weights) x.
+
+    numpy computes mult(x.T, x) with the BLAS routine ?syrk, which only
+    computes one triangle of the result, but only if both factors refer
+    to the same contiguous array; otherwise a full ?gemm is used. This
+    function makes sure that the fast path is taken, also for weighted
+    products with non-negative weights, where the rows of x are scaled by
+    the square root of the weights.
+    """
+    if weights is not None:
+        weights = numx.asarray(weights)
+        if (weights < 0).any():
+            return mdp.utils.mult(x.T, x * weights[:, numx.newaxis])
+        x = x * numx.sqrt(weights)[:, numx.newaxis]
+    elif not (x.flags.c_contiguous or x.flags.f_contiguous):
+        x = numx.ascontiguousarray(x)
+    return mdp.utils.mult(x.T, x)
+
+
+def _kahan_add(total, comp, value):
+    """Add value to the array total in place, using and updating the
+    compensation term comp of Kahan summation."""
+    y = value - comp
+    t = total + y
+    comp[...] = (t - total) - y
+    total[...] = t
+
+
+class _CompensatedComoment(object):
+    """Running averages of two signals and their centered co-moment
+    sum_t (x_t - <x>)^T (y_t - <y>), updated in blocks.
+
+    The co-moment of each block is computed around the block averages and
+    merged into the running state with the pairwise update formulas of
+    Chan et al., using Kahan compensated sums. This avoids both the
+    cancellation in E[xy] - E[x]E[y] and the round off errors of summing
+    many blocks, so that single precision data can be accumulated over
+    very long sequences.
+    """
+
+    # number of samples whose co-moment is computed at once
+    block_len = 4096
+
+    def __init__(self, dim_x, dim_y, dtype, same=False):
+        """If same is True, x and y are the same signal."""
+        self.tlen = 0
+        self.avgx = numx.zeros(dim_x, dtype)
+        self._avgx_comp = numx.zeros(dim_x, dtype)
+        if same:
+            self.avgy = self.avgx
+        else:
+            self.avgy = numx.zeros(dim_y, dtype)
+            self._avgy_comp = numx.zeros(dim_y, dtype)
+        self.comoment = numx.zeros((dim_x, dim_y), dtype)
+        self._comoment_comp = numx.zeros((dim_x, dim_y), dtype)
+
+    def update(self, x, y):
+        block_len = self.block_len
+        for start in range(0, x.shape[0], block_len):
+            xb = x[start:start+block_len]
+            avgx = xb.mean(axis=0)
+            xb = xb - avgx
+            if y is x:
+                avgy, yb = avgx, xb
+            else:
+                yb = y[start:start+block_len]
+                avgy = yb.mean(axis=0)
+                yb = yb - avgy
+            self._merge(xb.shape[0], avgx, avgy, mdp.utils.mult(xb.T, yb))
+
+    def merge(self, other):
+        """Add the state of another instance."""
+        self._merge(other.tlen, other.avgx, other.avgy, other.comoment)
+
+    def _merge(self, tlen, avgx, avgy, comoment):
+        if tlen == 0:
+            return
+        old_tlen = self.tlen
+        self.tlen += tlen
+        dx = avgx - self.avgx
+        if self.avgy is self.avgx:
+            dy = dx
+        else:
+            dy = avgy - self.avgy
+            _kahan_add(self.avgy, self._avgy_comp, dy * (tlen / self.tlen))
+        _kahan_add(self.avgx, self._avgx_comp, dx * (tlen / self.tlen))
+        comoment = comoment + numx.outer(dx, dy) * (old_tlen * tlen
+                                                    / self.tlen)
+        _kahan_add(self.comoment, self._comoment_comp, comoment)
+
+
 class CovarianceMatrix(object):
     """This class stores an empirical covariance matrix that can be updated
     incrementally. A call to the 'fix' method returns the current state of
     the covariance matrix, the average and the number of observations, and
     resets the internal data.
 
-    Note that the internal sum is a standard __add__ operation. We are not
-    using any of the fancy sum algorithms to avoid round off errors when
-    adding many numbers. If you want to contribute a CovarianceMatrix class
-    that uses such algorithms we would be happy to include it in MDP.
-    For a start see the Python recipe by Raymond Hettinger at
-    http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/393090
+    By default the internal sum is a standard __add__ operation, which
+    accumulates round off errors when adding many numbers, in particular
+    in single precision. If ``compensated`` is True, the data is centered
+    block by block and the blocks are merged with Kahan compensated sums
+    (see ``_CompensatedComoment``). This costs an additional pass over
+    each block, but float32 data then gives nearly the accuracy of a
+    float64 accumulation. In this mode '_cov_mtx' holds the centered
+    co-moment and '_avg' the running average.
     For a review about floating point arithmetic and its pitfalls see
     http://docs.oracle.com/cd/E19957-01/806-3568/ncg_goldberg.html
     """
 
-    def __init__(self, dtype=None, bias=False):
+    def __init__(self, dtype=None, bias=False, compensated=False):
         """If dtype is not defined, it will be inherited from the first
         data bunch received by 'update'.
         All the matrices in this class are set up with the given dtype and
         no upcast is possible.
         If bias is True, the covariance matrix is normalized by dividing
         by T instead of the usual T-1.
+        If compensated is True, blockwise centering and compensated
+        summation are used to reduce round off errors.
         """
         if dtype is None:
             self._dtype = None
@@ -59,8 +157,11 @@ def __init__(self, dtype=None, bias=False):
         self._avg = None
         # number of observation so far during the training phase
         self._tlen = 0
+        # compensated accumulator, if used
+        self._moments = None
 
         self.bias = bias
+        self.compensated = compensated
 
     def _init_internals(self, x):
         """Init the internal structures.
@@ -75,6 +176,11 @@ def _init_internals(self, x):
         dim = x.shape[1]
         self._input_dim = dim
         type_ = self._dtype
+        if self.compensated:
+            self._moments = _CompensatedComoment(dim, dim, type_, same=True)
+            self._cov_mtx = self._moments.comoment
+            self._avg = self._moments.avgx
+            return
         # init covariance matrix
         self._cov_mtx = numx.zeros((dim, dim), type_)
         # init average
@@ -90,12 +196,33 @@ def update(self, x):
             self._init_internals(x)
         # cast input
         x = mdp.utils.refcast(x, self._dtype)
+        if self._moments is not None:
+            self._moments.update(x, x)
+            self._tlen = self._moments.tlen
+            return
         # update the covariance matrix, the average and the number of
         # observations (try to do everything inplace)
-        self._cov_mtx += mdp.utils.mult(x.T, x)
+        self._cov_mtx += _symmetric_product(x)
         self._avg += x.sum(axis=0)
         self._tlen += x.shape[0]
 
+    def _merge(self, other):
+        """Add the data collected by another instance in place."""
+        if other._cov_mtx is None or other._tlen == 0:
+            # the other instance received no data
+            return
+        if self._cov_mtx is None:
+            # this instance received no data, so it takes over the data
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            return
+        if self._moments is not None:
+            self._moments.merge(other._moments)
+            self._tlen = self._moments.tlen
+        else:
+            self._cov_mtx += other._cov_mtx
+            self._avg += other._avg
+            self._tlen += other._tlen
+
     def fix(self, center=True):
         """Returns a triple containing the covariance matrix, the average and
         the number of observations. The covariance matrix is then reset to
@@ -107,27 +234,28 @@ def fix(self, center=True):
         # local variables
         type_ = self._dtype
         tlen = self._tlen
-        _check_roundoff(tlen, type_)
         avg = self._avg
         cov_mtx = self._cov_mtx
 
         # fix the training variables
         # fix the covariance matrix (try to do everything inplace)
-        if self.bias:
-            cov_mtx /= tlen
+        norm = tlen if self.bias else tlen - 1
+        if self._moments is not None:
+            # the matrix is already centered and avg is the average
+            cov_mtx /= norm
+            if not center:
+                cov_mtx += numx.outer(avg, avg) * (tlen / norm)
         else:
-            cov_mtx /= tlen - 1
+            _check_roundoff(tlen, type_)
+            cov_mtx /= norm
 
-        if center:
-            avg_mtx = numx.outer(avg, avg)
-            if self.bias:
-                avg_mtx /= tlen*(tlen)
-            else:
-                avg_mtx /= tlen*(tlen - 1)
-            cov_mtx -= avg_mtx
+            if center:
+                avg_mtx = numx.outer(avg, avg)
+                avg_mtx /= tlen*norm
+                cov_mtx -= avg_mtx
 
-        # fix the average
-        avg /= tlen
+            # fix the average
+            avg /= tlen
 
         # clean up
         # covariance matrix, updated during the training phase
@@ -136,6 +264,7 @@ def fix(self, center=True):
         self._avg = None
         # number of observation so far during the training phase
         self._tlen = 0
+        self._moments = None
 
         return cov_mtx, avg, tlen
 
@@ -343,17 +472,12 @@ class DelayCovarianceMatrix(object):
     """This class stores an empirical covariance matrix between the signal and
     time delayed signal that can be updated incrementally.
 
-    Note that the internal sum is a standard __add__ operation. We are not
-    using any of the fancy sum algorithms to avoid round off errors when
-    adding many numbers. If you want to contribute a CovarianceMatrix class
-    that uses such algorithms we would be happy to include it in MDP.
-    For a start see the Python recipe by Raymond Hettinger at
-    http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/393090
-    For a review about floating point arithmetic and its pitfalls see
-    http://docs.sun.com/source/806-3568/ncg_goldberg.html
+    By default the internal sum is a standard __add__ operation. If
+    ``compensated`` is True, blockwise centering and compensated summation
+    are used instead, as described in the CovarianceMatrix docstring.
     """
 
-    def __init__(self, dt, dtype=None, bias=False):
+    def __init__(self, dt, dtype=None, bias=False, compensated=False):
         """dt is the time delay. If dt==0, DelayCovarianceMatrix equals
         CovarianceMatrix. If dtype is not defined, it will be inherited from
         the first data bunch received by 'update'.
@@ -361,6 +485,8 @@ def __init__(self, dt, dtype=None, bias=False):
         no upcast is possible.
         If bias is True, the covariance matrix is normalized by dividing
         by T instead of the usual T-1.
+        If compensated is True, blockwise centering and compensated
+        summation are used to reduce round off errors.
         """
 
         # time delay
@@ -376,8 +502,10 @@ def __init__(self, dt, dtype=None, bias=False):
         self._avg = None
         self._avg_dt = None
         self._tlen = 0
+        self._moments = None
 
         self.bias = bias
+        self.compensated = compensated
 
     def _init_internals(self, x):
         """Inits some internals structures. The reason this is not done in
@@ -390,6 +518,12 @@ def _init_internals(self, x):
             self._dtype = x.dtype
         dim = x.shape[1]
         self._input_dim = dim
+        if self.compensated:
+            self._moments = _CompensatedComoment(dim, dim, self._dtype)
+            self._cov_mtx = self._moments.comoment
+            self._avg = self._moments.avgx
+            self._avg_dt = self._moments.avgy
+            return
         # init covariance matrix
         self._cov_mtx = numx.zeros((dim, dim), self._dtype)
         # init averages
@@ -412,6 +546,11 @@ def update(self, x):
             err = 'Block length is %d, should be at least %d.' % (tlen, dt+1)
             raise mdp.MDPException(err)
 
+        if self._moments is not None:
+            self._moments.update(x[:tlen-dt, :], x[dt:tlen, :])
+            self._tlen = self._moments.tlen
+            return
+
         # update the covariance matrix, the average and the number of
         # observations (try to do everything inplace)
         self._cov_mtx += mdp.utils.mult(x[:tlen-dt, :].T, x[dt:tlen, :])
@@ -420,6 +559,24 @@ def update(self, x):
         self._avg_dt += totalsum - x[:dt, :].sum(axis=0)
         self._tlen += tlen-dt
 
+    def _merge(self, other):
+        """Add the data collected by another instance in place."""
+        if other._cov_mtx is None or other._tlen == 0:
+            # the other instance received no data
+            return
+        if self._cov_mtx is None:
+            # this instance received no data, so it takes over the data
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            return
+        if self._moments is not None:
+            self._moments.merge(other._moments)
+            self._tlen = self._moments.tlen
+        else:
+            self._cov_mtx += other._cov_mtx
+            self._avg += other._avg
+            self._avg_dt += other._avg_dt
+            self._tlen += other._tlen
+
     def fix(self, A=None):
         """The collected data is adjusted to compute the covariance matrix of
         the signal x(1)...x(N-dt) and the delayed signal x(dt)...x(N),
@@ -436,17 +593,18 @@ def fix(self, A=None):
         # local variables
         type_ = self._dtype
         tlen = self._tlen
-        _check_roundoff(tlen, type_)
         avg = self._avg
         avg_dt = self._avg_dt
         cov_mtx = self._cov_mtx
 
         # fix the training variables
         # fix the covariance matrix (try to do everything inplace)
-        avg_mtx = numx.outer(avg, avg_dt)
-        avg_mtx /= tlen
+        if self._moments is None:
+            _check_roundoff(tlen, type_)
+            avg_mtx = numx.outer(avg, avg_dt)
+            avg_mtx /= tlen
+            cov_mtx -= avg_mtx
 
-        cov_mtx -= avg_mtx
         if self.bias:
             cov_mtx /= tlen
         else:
@@ -456,14 +614,157 @@ def fix(self, A=None):
             cov_mtx = mdp.utils.mult(A, mdp.utils.mult(cov_mtx, A.T))
 
         # fix the average
-        avg /= tlen
-        avg_dt /= tlen
+        if self._moments is None:
+            avg /= tlen
+            avg_dt /= tlen
 
         # clean up variables to spare on space
         self._cov_mtx = None
         self._avg = None
         self._avg_dt = None
         self._tlen = 0
+        self._moments = None
+
+        return cov_mtx, avg, avg_dt, tlen
+
+
+class MultiLagCovarianceMatrix(object):
+    """This class stores the empirical covariance matrices between the
+    signal and the signal delayed by several time lags, and can be updated
+    incrementally.
+
+    All lags are updated with a single pass over each data block. The last
+    max(lags) samples of each block are kept and prepended to the next
+    block, so that the lagged pairs across block boundaries are included
+    and the result is the same as if all the data had been given in one
+    block. Unlike with DelayCovarianceMatrix, blocks can thus be shorter
+    than the lags.
+    """
+
+    def __init__(self, lags, dtype=None, bias=False):
+        """lags is a sequence of non-negative integer time delays. If dtype
+        is not defined, it will be inherited from the first data bunch
+        received by 'update'.
+        If bias is True, the covariance matrices are normalized by dividing
+        by T instead of the usual T-1.
+        """
+        self.lags = numx.array(lags, dtype='l').ravel()
+        if len(self.lags) == 0 or (self.lags < 0).any():
+            err = 'lags must be a non-empty sequence of non-negative integers'
+            raise mdp.MDPException(err)
+        self._max_lag = int(self.lags.max())
+
+        if dtype is None:
+            self._dtype = None
+        else:
+            self._dtype = numx.dtype(dtype)
+
+        # clean up variables to spare on space
+        self._cov_mtx = None
+        self._avg = None
+        self._avg_dt = None
+        self._tlen = None
+        # last samples of the data seen so far
+        self._tail = None
+
+        self.bias = bias
+
+    def _init_internals(self, x):
+        """Inits some internals structures. The reason this is not done in
+        the constructor is that we want to be able to derive the input
+        dimension and the dtype directly from the data this class receives.
+        """
+        if self._dtype is None:
+            self._dtype = x.dtype
+        dim = x.shape[1]
+        self._input_dim = dim
+        nlags = len(self.lags)
+        self._cov_mtx = numx.zeros((nlags, dim, dim), self._dtype)
+        self._avg = numx.zeros((nlags, dim), self._dtype)
+        self._avg_dt = numx.zeros((nlags, dim), self._dtype)
+        self._tlen = numx.zeros((nlags,), dtype='l')
+        self._tail = numx.zeros((0, dim), self._dtype)
+
+    def update(self, x):
+        """Update internal structures."""
+        if self._cov_mtx is None:
+            self._init_internals(x)
+        x = mdp.utils.refcast(x, self._dtype)
+        tail = self._tail
+        ntail = tail.shape[0]
+        if ntail:
+            x = numx.concatenate((tail, x))
+        tlen = x.shape[0]
+        max_lag = self._max_lag
+
+        # the sums over the rows x[start:stop] needed below are computed
+        # from the total sum and the sums of the first and last rows,
+        # where start and tlen-stop are at most max_lag
+        nsums = min(max_lag, tlen)
+        total = x.sum(axis=0)
+        head_sums = numx.zeros((max_lag+1, x.shape[1]), self._dtype)
+        head_sums[1:nsums+1] = x[:nsums].cumsum(axis=0)
+        tail_sums = numx.zeros((max_lag+1, x.shape[1]), self._dtype)
+        tail_sums[1:nsums+1] = x[tlen-nsums:][::-1].cumsum(axis=0)
+
+        # only the pairs whose delayed sample is new are added
+        for i, lag in enumerate(self.lags):
+            start = max(0, ntail-lag)
+            stop = tlen - lag
+            if stop <= start:
+                continue
+            self._cov_mtx[i] += mdp.utils.mult(x[start:stop].T,
+                                               x[start+lag:stop+lag])
+            self._avg[i] += total - head_sums[start] - tail_sums[lag]
+            self._avg_dt[i] += total - head_sums[start+lag]
+            self._tlen[i] += stop - start
+
+        self._tail = x[max(0, tlen-max_lag):].copy()
+
+    def fix(self, A=None):
+        """Return a tuple containing the covariance matrices, the averages
+        of the signal and of the delayed signal and the number of
+        observations, one entry along the first axis for each lag (see
+        DelayCovarianceMatrix.fix). The internal data is then reset to a
+        zero-state.
+
+        If A is defined, the covariance matrices are transformed by the
+        linear transformation Ax . E.g. to whiten the data, A is the
+        whitening matrix.
+        """
+        tlen = self._tlen
+        if (tlen < 2).any():
+            err = ('Not enough data to compute the covariance matrices '
+                   '(less than 2 observations for lag %d).'
+                   % self.lags[tlen.argmin()])
+            raise mdp.MDPException(err)
+        _check_roundoff(tlen.max(), self._dtype)
+        avg = self._avg
+        avg_dt = self._avg_dt
+        cov_mtx = self._cov_mtx
+
+        avg_mtx = avg[:, :, numx.newaxis] * avg_dt[:, numx.newaxis, :]
+        avg_mtx /= tlen[:, numx.newaxis, numx.newaxis]
+        cov_mtx -= avg_mtx
+        if self.bias:
+            norm = tlen
+        else:
+            norm = tlen - 1
+        cov_mtx /= norm[:, numx.newaxis, numx.newaxis]
+
+        if A is not None:
+            cov_mtx = numx.array([mdp.utils.mult(A, mdp.utils.mult(cov, A.T))
+                                  for cov in cov_mtx])
+
+        avg /= tlen[:, numx.newaxis]
+        avg_dt /= tlen[:, numx.newaxis]
+
+        # clean up variables to spare on space
+        self._cov_mtx = None
+        self._avg = None
+        self._avg_dt = None
+        self._tlen = None
+        self._tail = None
 
         return cov_mtx, avg, avg_dt, tlen
 
@@ -556,6 +857,12 @@ def _init_internals(self, x, y):
         dim_x = x.shape[1]
         dim_y = y.shape[1]
         type_ = self._dtype
+        if self.compensated:
+            self._moments = _CompensatedComoment(dim_x, dim_y, type_)
+            self._cov_mtx = self._moments.comoment
+            self._avgx = self._moments.avgx
+            self._avgy = self._moments.avgy
+            return
         self._cov_mtx = numx.zeros((dim_x, dim_y), type_)
         self._avgx = numx.zeros(dim_x, type_)
         self._avgy = numx.zeros(dim_y, type_)
@@ -574,33 +881,63 @@ def update(self, x, y):
         x = mdp.utils.refcast(x, self._dtype)
         y = mdp.utils.refcast(y, self._dtype)
 
+        if self._moments is not None:
+            self._moments.update(x, y)
+            self._tlen = self._moments.tlen
+            return
+
         self._cov_mtx += mdp.utils.mult(x.T, y)
         self._avgx += x.sum(axis=0)
         self._avgy += y.sum(axis=0)
         self._tlen += x.shape[0]
 
+    def _merge(self, other):
+        """Add the data collected by another instance in place."""
+        if other._cov_mtx is None or other._tlen == 0:
+            # the other instance received no data
+            return
+        if self._cov_mtx is None:
+            # this instance received no data, so it takes over the data
+            self.__dict__.update(copy.deepcopy(other.__dict__))
+            return
+        if self._moments is not None:
+            self._moments.merge(other._moments)
+            self._tlen = self._moments.tlen
+        else:
+            self._cov_mtx += other._cov_mtx
+            self._avgx += other._avgx
+            self._avgy += other._avgy
+            self._tlen += other._tlen
+
     def fix(self):
         type_ = self._dtype
         tlen = self._tlen
-        _check_roundoff(tlen, type_)
         avgx = self._avgx
         avgy = self._avgy
         cov_mtx = self._cov_mtx
 
-        # fix the training variables
-        # fix the covariance matrix (try to do everything inplace)
-        avg_mtx = numx.outer(avgx, avgy)
-
-        if self.bias:
-            avg_mtx /= tlen*(tlen)
-            cov_mtx /= tlen
+        if self._moments is not None:
+            # the matrix is already centered and the averages are final
+            if self.bias:
+                cov_mtx /= tlen
+            else:
+                cov_mtx /= tlen - 1
         else:
-            avg_mtx /= tlen*(tlen - 1)
-            cov_mtx /= tlen - 1
-        cov_mtx -= avg_mtx
-        # fix the average
-        avgx /= tlen
-        avgy /= tlen
+            _check_roundoff(tlen, type_)
+            # fix the training variables
+            # fix the covariance matrix (try to do everything inplace)
+            avg_mtx = numx.outer(avgx, avgy)
+
+            if self.bias:
+                avg_mtx /= tlen*(tlen)
+                cov_mtx /= tlen
+            else:
+                avg_mtx /= tlen*(tlen - 1)
+                cov_mtx /= tlen - 1
+            cov_mtx -= avg_mtx
+            # fix the average
+            avgx /= tlen
+            avgy /= tlen
 
         # clean up
         # covariance matrix, updated during the training phase
@@ -610,5 +947,6 @@ def fix(self):
         self._avgy = None
         # number of observation so far during the training phase
         self._tlen = 0
+        self._moments = None
 
         return cov_mtx, avgx, avgy, tlen
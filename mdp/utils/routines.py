@@ -210,6 +210,35 @@ def norm2(v):
     return numx.sqrt((v*v).sum())
 
 
+def sqdist(x, y, y_sqnorms=None, shift=None):
+    """Compute the squared euclidean distances between the rows of the 2D
+    matrices x and y.
+
+    The distances are computed with a matrix product as
+    |x_i|^2 - 2 x_i*y_j + |y_j|^2, so no (len(x), len(y), dim) temporary
+    array is created. The terms cancel badly for data far from the origin
+    (in particular in single precision), so x and y are shifted by the
+    vector 'shift' first, by default by the mean of the rows of y.
+    The squared norms of the shifted rows of y (i.e. of y - shift) can be
+    given as 'y_sqnorms' if they are reused for multiple calls. If
+    'y_sqnorms' is given without a 'shift' then the data is not shifted.
+    Negative values due to round-off errors are set to zero.
+    """
+    if shift is None and y_sqnorms is None:
+        shift = y.mean(axis=0)
+    if shift is not None:
+        x = x - shift
+        y = y - shift
+    if y_sqnorms is None:
+        y_sqnorms = numx.einsum('ij,ij->i', y, y)
+    dist = mdp.utils.mult(x, y.T)
+    dist *= -2
+    dist += numx.einsum('ij,ij->i', x, x)[:, numx.newaxis]
+    dist += y_sqnorms
+    numx.maximum(dist, 0, out=dist)
+    return dist
+
+
 def cov2(x, y):
     """Compute the covariance between 2D matrices x and y.
     Complies with the old scipy.cov function: different variables